@@ -1,6 +1,7 @@
 import time
 import bluesky as bs
-from bluesky.tools import datalog, areafilter, plugin
+from bluesky import settings
+from bluesky.tools import datalog, areafilter, plugin, scheduler
 from bluesky.tools.misc import txt2tim,tim2txt
 from bluesky import stack
 from bluesky.traf.metric import Metric
@@ -8,6 +9,9 @@ from bluesky.tools.network import StackTelnetServer
 
 onedayinsec = 24*3600 # [s] time of one day in seconds for clock time
 
+# Register settings defaults
+settings.set_variable_defaults(adaptive_dt=False, adaptive_dtmax=1.0)
+
 class Simulation:
     """
     Simulation class definition : simulation control (time, mode etc.) class
@@ -80,8 +84,8 @@ class Simulation:
 
             # Fast forward: fixed dt until ffstop time, goto pause
             else:
-                self.simdt = self.fixdt
-                self.simt = self.simt+self.fixdt
+                self.simdt = self.stepsize()
+                self.simt = self.simt+self.simdt
                 self.syst0 = self.syst - self.simt
                 if self.ffstop > 0. and self.simt >= self.ffstop:
                     self.ffmode = False
@@ -107,7 +111,10 @@ class Simulation:
         stack.process()
 
         if self.mode == Simulation.op:
-            bs.traf.update(self.simt, self.simdt)
+            # Fast-time with adaptive time step: aircraft in transition
+            # are sub-stepped with fixdt
+            bs.traf.update(self.simt, self.simdt,
+                           self.fixdt if self.ffmode and self.simdt > self.fixdt else None)
 
             # Update metrics
             self.metric.update()
@@ -171,6 +178,34 @@ class Simulation:
             else:
                 self.ffmode = False
 
+    def setAdaptiveDt(self, flag=None, dtmax=None):
+        """ Stack function ADAPTDT: adaptive time step in fast-time """
+        if flag is None:
+            return True, "ADAPTDT is %s, max time step = %.2f s" % \
+                ("ON" if settings.adaptive_dt else "OFF", settings.adaptive_dtmax)
+        settings.adaptive_dt = flag
+        if dtmax is not None:
+            settings.adaptive_dtmax = dtmax
+        return True
+
+    def stepsize(self):
+        """ Time step for the next update in fast-time. With adaptive time
+            step, this is the largest multiple of fixdt up to adaptive_dtmax
+            that doesn't step over a task update (see scheduler.nexttime),
+            a scenario command, or the end of fast-forward. """
+        if not settings.adaptive_dt or settings.adaptive_dtmax <= self.fixdt:
+            return self.fixdt
+
+        tnext = [self.simt + settings.adaptive_dtmax]
+        tnext.append(scheduler.nexttime(self.simt, settings.adaptive_dtmax))
+        scentime = stack.get_scendata()[0]
+        if scentime:
+            tnext.append(scentime[0])
+        if self.ffstop > 0.:
+            tnext.append(self.ffstop)
+        tnext = min(t for t in tnext if t is not None and t > self.simt)
+        return self.fixdt * max(1, int((tnext - self.simt) / self.fixdt + 1e-6))
+
     def fastforward(self, nsec=None):
         self.ffmode = True
         if nsec is not None:
@@ -185,6 +220,7 @@ class Simulation:
         bs.traf.reset()
         datalog.reset()
         areafilter.reset()
+        scheduler.reset()
         self.delclock  = 0.0   # SImulated clock time at simt=0.
         self.simtclock = 0.0
 
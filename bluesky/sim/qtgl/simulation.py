@@ -14,13 +14,13 @@ from .simevents import StackTextEventType, BatchEventType, BatchEvent, \
     SimStateEvent, SimQuitEventType, StackInitEvent
 from bluesky import settings, stack
 # from bluesky.traf import Metric
-from bluesky.tools import datalog, areafilter, plugin
+from bluesky.tools import datalog, areafilter, plugin, scheduler
 from bluesky.tools.misc import txt2tim, tim2txt
 
 onedayinsec = 24 * 3600  # [s] time of one day in seconds for clock time
 
 # Register settings defaults
-settings.set_variable_defaults(simdt=0.05)
+settings.set_variable_defaults(simdt=0.05, adaptive_dt=False, adaptive_dtmax=1.0)
 
 class Simulation(QObject):
     # simulation modes
@@ -99,7 +99,10 @@ class Simulation(QObject):
 
             if self.state == Simulation.op:
 
-                bs.traf.update(self.simt, self.simdt)
+                # Fast-time with adaptive time step: aircraft in transition
+                # are sub-stepped with simdt
+                dt = self.stepsize()
+                bs.traf.update(self.simt, dt, self.simdt if dt > self.simdt else None)
 
                 # Update metrics
                 # self.metric.update()
@@ -111,7 +114,7 @@ class Simulation(QObject):
                 datalog.postupdate()
 
                 # Update time for the next timestep
-                self.simt += self.simdt
+                self.simt += dt
 
             # Update clock
             self.simtclock = (self.deltclock + self.simt) % onedayinsec
@@ -164,6 +167,7 @@ class Simulation(QObject):
         stack.reset()
         datalog.reset()
         areafilter.reset()
+        scheduler.reset()
         bs.scr.reset()
 
     def quit(self):
@@ -183,6 +187,33 @@ class Simulation(QObject):
         else:
             self.start()
 
+    def setAdaptiveDt(self, flag=None, dtmax=None):
+        """ Stack function ADAPTDT: adaptive time step in fast-time """
+        if flag is None:
+            return True, "ADAPTDT is %s, max time step = %.2f s" % \
+                ("ON" if settings.adaptive_dt else "OFF", settings.adaptive_dtmax)
+        settings.adaptive_dt = flag
+        if dtmax is not None:
+            settings.adaptive_dtmax = dtmax
+        return True
+
+    def stepsize(self):
+        """ Time step for the next update. In fast-time with adaptive time
+            step, this is the largest multiple of simdt up to adaptive_dtmax
+            that doesn't step over a task update (see scheduler.nexttime),
+            a scenario command, or the end of fast-forward. """
+        if not (self.ffmode and settings.adaptive_dt) or settings.adaptive_dtmax <= self.simdt:
+            return self.simdt
+
+        tnext = [self.simt + settings.adaptive_dtmax]
+        tnext.append(scheduler.nexttime(self.simt, settings.adaptive_dtmax))
+        scentime = stack.get_scendata()[0]
+        if scentime:
+            tnext.append(scentime[0])
+        tnext.append(self.ffstop)
+        tnext = min(t for t in tnext if t is not None and t > self.simt)
+        return self.simdt * max(1, int((tnext - self.simt) / self.simdt + 1e-6))
+
     def fastforward(self, nsec=None):
         self.ffmode = True
         if nsec is not None:
@@ -8,6 +8,9 @@ Methods:
                               from scenario folder
     savefile(scenname)      : save current traffic situation as
                               scenario file scenname.SCN
+    savestate(fname)        : save the full simulation state to
+                              binary file fname.NPZ
+    loadstate(fname)        : restore a state saved with savestate
     checkfile(t)            : check whether commands need to be
                               processed from scenario file
 
@@ -20,9 +23,10 @@ from random import seed
 import os
 import os.path
 import subprocess
+import zipfile
 import numpy as np
 import bluesky as bs
-from bluesky.tools import geo, areafilter, plugin
+from bluesky.tools import geo, areafilter, plugin, scheduler, checkpoint
 from bluesky.tools.aero import kts, ft, fpm, tas2cas, density
 from bluesky.tools.misc import txt2alt, cmdsplit
 from bluesky.tools.calculator import calculator
@@ -85,6 +89,7 @@ cmdsynon  = {"ADDAIRWAY": "ADDAWY",
 
 
 cmdstack  = []
+crebatch  = []  # Arguments of consecutive CRE commands, created in one go
 
 scenname  = ""
 scenfile  = ""
@@ -130,6 +135,12 @@ def init():
     #
     #--------------------------------------------------------------------
     commands = {
+        "ADAPTDT": [
+            "ADAPTDT [ON/OFF,dtmax]",
+            "[onoff,float]",
+            bs.sim.setAdaptiveDt,
+            "Adaptive time step in fast-time, with sub-steps for aircraft in transition"
+        ],
         "ADDNODES": [
             "ADDNODES number",
             "int",
@@ -168,10 +179,10 @@ def init():
             "Altitude command (autopilot)"
         ],
         "ASAS": [
-            "ASAS ON/OFF",
-            "[onoff]",
+            "ASAS ON/OFF or ASAS GEOMETRY [WGS84/FLAT]",
+            "[onoff/txt,txt]",
             bs.traf.asas.toggle,
-            "Airborne Separation Assurance System switch"
+            "Airborne Separation Assurance System switch, or geometry of the conflict detection"
         ],
         "AT": [
             "acid AT wpname [DEL] SPD/ALT [spd/alt]",
@@ -236,7 +247,7 @@ def init():
         "DEL": [
             "DEL acid/WIND/shape",
             "txt",
-            lambda a:   bs.traf.delete(a)    if bs.traf.id.count(a) > 0 \
+            lambda a:   bs.traf.delete(a)    if bs.traf.id2idx(a) >= 0 \
                    else bs.traf.wind.clear() if a == "WIND" \
                    else areafilter.deleteArea(a),
             "Delete command (aircraft, wind, area)"
@@ -398,6 +409,12 @@ def init():
             bs.traf.ap.setLNAV,
             "LNAV (lateral FMS mode) switch for autopilot"
         ],
+        "LOADSTATE": [
+            "LOADSTATE filename",
+            "string",
+            loadstate,
+            "Restore the simulation state from a SAVESTATE file"
+        ],
         "MAKEDOC": [
             "MAKEDOC",
             "",
@@ -566,6 +583,12 @@ def init():
             saveic,
             "Save current situation as IC"
         ],
+        "SAVESTATE": [
+            "SAVESTATE filename",
+            "string",
+            savestate,
+            "Save the full simulation state to a binary file"
+        ],
         "SCHEDULE": [
             "SCHEDULE time, COMMAND+ARGS",
             "time,txt,...",
@@ -627,6 +650,12 @@ def init():
             bs.traf.trails.setTrails,
             "Toggle aircraft trails on/off"
         ],
+        "UPDATERATE": [
+            "UPDATERATE [task,dt,phase,nslices]",
+            "[txt,float,float,int]",
+            scheduler.setrate,
+            "Set update interval, time offset and number of slices of FMS, PERF, ASAS or plugin"
+        ],
         "VNAV": [
             "VNAV acid,[ON/OFF]",
             "acid,[onoff]",
@@ -838,6 +867,20 @@ def reset():
     scenname = ''
 
 
+def createbatch():
+    """ Create the aircraft of all CRE commands collected in crebatch
+        with a single batch call. """
+    if len(crebatch) == 0:
+        return
+
+    acids, actypes, aclats, aclons, achdgs, acalts, acspds = zip(*crebatch)
+    del crebatch[:]
+
+    results = bs.traf.create_batch(acids, actypes, aclats, aclons, achdgs, acalts, acspds)
+    if isinstance(results, tuple) and len(results) >= 2:
+        bs.scr.echo("CRE:" + results[1])
+
+
 def stack(cmdline):
     # Stack one or more commands separated by ";"
     cmdline = cmdline.strip()
@@ -1070,6 +1113,65 @@ def saveic(fname):
     return True
 
 
+def statefile(fname):
+    """ Return full path of state file fname: add extension .npz, and the
+        scenario path when no path is given. """
+    if fname.lower().find(".npz") < 0:
+        fname = fname + ".npz"
+    if len(os.path.dirname(fname)) == 0:
+        fname = os.path.join(settings.scenario_path, fname)
+    return fname
+
+
+def savestate(fname):
+    """ Save all registered traffic arrays and lists (including routes),
+        the scheduled scenario commands, the simulation time and the timing
+        of the update tasks in a binary file. Arrays are stored as separate
+        npy members, everything else as JSON (see tools/checkpoint.py). """
+    fname = statefile(fname)
+
+    state = bs.traf.getstate()
+    state["stack.scentime"] = scentime
+    state["stack.scencmd"]  = scencmd
+    state["sim.simt"]       = bs.sim.simt
+    state["scheduler"]      = scheduler.getstate()
+
+    try:
+        checkpoint.save(fname, state)
+    except (IOError, OSError):
+        return False, "Error writing to file " + fname
+    except TypeError as e:
+        return False, "Error saving state: " + str(e)
+
+    return True, "Saved state to " + fname
+
+
+def loadstate(fname):
+    """ Reset the simulation and restore a state saved with SAVESTATE. """
+    global scentime, scencmd
+    fname = statefile(fname)
+    if not os.path.exists(fname):
+        return False, "Error: cannot find file: " + fname
+
+    try:
+        state = checkpoint.load(fname)
+    except (IOError, OSError, ValueError, KeyError, zipfile.BadZipfile) as e:
+        return False, "Error reading state from " + fname + ": " + str(e)
+
+    bs.sim.reset()
+    scentime = state.pop("stack.scentime")
+    scencmd  = state.pop("stack.scencmd")
+    bs.sim.simt = state.pop("sim.simt")
+    scheduler.setstate(state.pop("scheduler", {}))
+    bs.traf.setstate(state, len(state["id"]))
+
+    # The reset leaves the sim in init mode, in which the main loop resets
+    # it again: continue running from the restored state instead
+    bs.sim.start()
+
+    return True, "Loaded state from " + fname
+
+
 def process():
     """process and empty command stack"""
 
@@ -1081,12 +1183,17 @@ def process():
         if len(line) == 0:
             continue
 
+        # Any command following a series of CRE commands can refer to the
+        # new aircraft: create them first
+        if crebatch and cmdsplit(line.upper())[0] not in ("CRE", "CREATE"):
+            createbatch()
+
         # Split command line into command and arguments, pass traf ids to check for
         # switched acid and command
-        cmd, args = cmdsplit(line.upper(), bs.traf.id)
+        cmd, args = cmdsplit(line.upper(), bs.traf.idmap)
         numargs   = len(args)
         # Check if this is a POS command with only an aircraft id
-        if numargs == 0 and bs.traf.id.count(cmd) > 0:
+        if numargs == 0 and cmd in bs.traf.idmap:
             args    = [cmd]
             cmd     = 'POS'
             numargs = 1
@@ -1193,6 +1300,21 @@ def process():
             # flag: indicates sucess
             # text: optional error message
             if not synerr:
+                # Complete CRE commands are collected, and created in one batch
+                if cmd == "CRE" and len(arglist) == 7 and None not in arglist \
+                        and arglist[0] != "*":
+                    crebatch.append(arglist)
+                    continue
+
+                createbatch()
+
+                # The command can change the targets of dormant aircraft: of
+                # the aircraft in the arguments, or of all aircraft
+                if argtypes == ['string'] or parser.refac < 0:
+                    bs.traf.wake()
+                else:
+                    bs.traf.wake(parser.refac)
+
                 results = function(*arglist)  # * = unpack list to call arguments
 
                 if isinstance(results, bool):  # Only flag is returned
@@ -1238,6 +1360,7 @@ def process():
         #**********************************************************************
 
     # End of for-loop of cmdstack
+    createbatch()
     del cmdstack[:]
     return
 
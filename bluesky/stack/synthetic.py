@@ -133,8 +133,8 @@ def process(*cmdargs):
                 acidh="SPH"+str(i)+"HIG"
                 bs.traf.create(acidh,"SUPER",lat,lon,track,highalt*ft,hispd)
 
-                idxl = bs.traf.id.index(acidl)
-                idxh = bs.traf.id.index(acidh)
+                idxl = bs.traf.id2idx(acidl)
+                idxh = bs.traf.id2idx(acidh)
 
                 bs.traf.vs[idxl]     =  vs
                 bs.traf.vs[idxh]     = -vs
@@ -225,7 +225,7 @@ def process(*cmdargs):
         floorsep=1.1 #factor of extra spacing in the floor
         hseplat=hsep/mperdeg*floorsep
         bs.traf.create("OWNSHIP","FLOOR",-1,0,90, (20000+altdif)*ft, 200)
-        idx = bs.traf.id.index("OWNSHIP")
+        idx = bs.traf.id2idx("OWNSHIP")
         bs.traf.selvs[idx]=-10
         bs.traf.selalt[idx]=20000-altdif
         for i in range(20):
@@ -0,0 +1,143 @@
+""" Checkpoint files of the simulation state, used by SAVESTATE and LOADSTATE.
+
+    A checkpoint is an uncompressed npz file. Numpy arrays are stored as
+    separate npy members, which are memory-mapped when the checkpoint is
+    loaded. All other state (lists, dicts, routes and scalars) is stored as
+    JSON in the '__json__' member, so loading a checkpoint never executes
+    code from the file: only plain data and the object types listed in
+    objecttypes() can be restored."""
+import io
+import json
+import os
+import struct
+import zipfile
+import numpy as np
+
+# os.replace doesn't exist in Python 2, where os.rename also replaces
+# existing files (on POSIX systems)
+replace = getattr(os, 'replace', os.rename)
+
+# Name of the npz member with the JSON encoded state
+jsonmember = '__json__'
+
+
+def objecttypes():
+    ''' Classes of which the objects can be stored in a checkpoint. The
+        objects are restored by updating the attributes of a new object. '''
+    from bluesky.traf.route import Route
+    return {'Route': Route}
+
+
+def encode(value, types):
+    ''' Convert value into data that can be stored as JSON. Tuples, arrays,
+        dicts and objects are stored as a dict with a tag that tells how to
+        decode them. '''
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, list):
+        return [encode(v, types) for v in value]
+    if isinstance(value, tuple):
+        return {'__tuple__': [encode(v, types) for v in value]}
+    if isinstance(value, np.ndarray) and not value.dtype.hasobject:
+        return {'__ndarray__': value.tolist(), 'dtype': value.dtype.str}
+    if isinstance(value, dict):
+        return {'__dict__': [[encode(k, types), encode(v, types)] for k, v in value.items()]}
+    for name, cls in types.items():
+        if type(value) is cls:
+            return {'__object__': name, 'vars': encode(vars(value), types)}
+    raise TypeError('Cannot store a value of type ' + type(value).__name__)
+
+
+def decode(value, types):
+    ''' Restore the data obtained with encode(). '''
+    if isinstance(value, list):
+        return [decode(v, types) for v in value]
+    if not isinstance(value, dict):
+        return value
+    if '__tuple__' in value:
+        return tuple(decode(v, types) for v in value['__tuple__'])
+    if '__ndarray__' in value:
+        return np.array(value['__ndarray__'], dtype=np.dtype(value['dtype']))
+    if '__dict__' in value:
+        return {hashable(decode(k, types)): decode(v, types) for k, v in value['__dict__']}
+    if '__object__' in value:
+        if value['__object__'] not in types:
+            raise ValueError('Unknown object type ' + value['__object__'])
+        obj = types[value['__object__']]()
+        obj.__dict__.update(decode(value['vars'], types))
+        return obj
+    raise ValueError('Unknown tag in checkpoint')
+
+
+def hashable(key):
+    ''' Dict keys that were lists in the JSON data become tuples again '''
+    return tuple(hashable(k) for k in key) if isinstance(key, (list, tuple)) else key
+
+
+def save(fname, state):
+    ''' Save the state dict in checkpoint fname. The file is written under a
+        temporary name first and then replaces fname, so arrays that are
+        still memory-mapped from an earlier load of fname remain valid. '''
+    types  = objecttypes()
+    arrays = {key: val for key, val in state.items()
+              if isinstance(val, np.ndarray) and not val.dtype.hasobject}
+    other  = {key: encode(val, types) for key, val in state.items() if key not in arrays}
+    arrays[jsonmember] = np.frombuffer(json.dumps(other).encode('utf-8'), dtype=np.uint8)
+
+    tmpname = fname + '.tmp'
+    with open(tmpname, 'wb') as f:
+        np.savez(f, **arrays)
+    replace(tmpname, fname)
+
+
+def load(fname):
+    ''' Load the state dict from checkpoint fname. The arrays are memory-mapped
+        copy-on-write: they can be changed in place, but changes are never
+        written back to the file. '''
+    state = dict()
+    other = dict()
+    with zipfile.ZipFile(fname) as zf, open(fname, 'rb') as f:
+        for info in zf.infolist():
+            name = info.filename[:-4] if info.filename.endswith('.npy') else info.filename
+            if name == jsonmember:
+                data  = np.lib.format.read_array(io.BytesIO(zf.read(info)), allow_pickle=False)
+                other = json.loads(data.tobytes().decode('utf-8'))
+            else:
+                state[name] = maparray(fname, f, zf, info)
+
+    state.update({key: decode(val, objecttypes()) for key, val in other.items()})
+    return state
+
+
+def maparray(fname, f, zf, info):
+    ''' Memory-map the array of npz member info. Compressed members are read
+        into memory instead. '''
+    if info.compress_type != zipfile.ZIP_STORED:
+        return np.lib.format.read_array(zf.open(info), allow_pickle=False)
+
+    # Skip the local file header of the member: the lengths of its name and
+    # extra field are at offset 26
+    f.seek(info.header_offset + 26)
+    namelen, extralen = struct.unpack('<HH', f.read(4))
+    f.seek(namelen + extralen, 1)
+
+    version = np.lib.format.read_magic(f)
+    if version == (1, 0):
+        shape, fortran, dtype = np.lib.format.read_array_header_1_0(f)
+    elif version == (2, 0):
+        shape, fortran, dtype = np.lib.format.read_array_header_2_0(f)
+    else:
+        return np.lib.format.read_array(zf.open(info), allow_pickle=False)
+
+    if dtype.hasobject:
+        raise ValueError('Object arrays cannot be loaded from a checkpoint')
+    if int(np.prod(shape)) == 0:
+        return np.empty(shape, dtype=dtype)
+
+    arr = np.memmap(fname, dtype=dtype, mode='c', offset=f.tell(), shape=shape,
+                    order='F' if fortran else 'C')
+    # A plain ndarray view avoids the overhead of the memmap subclass in
+    # all later calculations; the view keeps the mapping alive
+    return arr.view(np.ndarray)
@@ -163,6 +163,73 @@ def qdrdist_matrix(lat1, lon1, lat2, lon2):
     return qdr, dist
 
 
+def qdrdist_pairs(lat1, lon1, lat2, lon2, reverse=False):
+    """ Calculate bearing and distance for pairs of positions, using WGS'84.
+        This is the element-wise version of qdrdist_matrix: for position
+        vectors lat1[i], lat2[j] it gives the same results as element [i,j]
+        of qdrdist_matrix, but only for the given pairs.
+        In:
+            lat1,lon1 en lat2, lon2 [deg] :positions 1 & 2 (vectors of pairs)
+            reverse                       :also return the bearing from 2 to 1
+        Out:
+            qdr [deg] = heading from 1 to 2 (vector)
+            qdrrev [deg] = heading from 2 to 1 (vector, only with reverse=True)
+            d [nm]    = distance from 1 to 2 in nm (vector) """
+    prodla = lat1 * lat2
+    condition = prodla < 0
+
+    r = np.zeros(prodla.shape)
+    r = np.where(condition, r, rwgs84_matrix(lat1 + lat2))
+
+    a = 6378137.0
+
+    r = np.where(np.invert(condition), r, (np.divide(np.multiply
+      (0.5, ((np.multiply(abs(lat1), (rwgs84_matrix(lat1)+a))) +
+         np.multiply(abs(lat2), (rwgs84_matrix(lat2)+a)))),
+            (abs(lat1))+(abs(lat2)+(lat2 == 0.)*0.000001))))  # different hemisphere
+
+    diff_lat = lat2-lat1
+    diff_lon = lon2-lon1
+
+    sin1 = (np.radians(diff_lat))
+    sin2 = (np.radians(diff_lon))
+
+    sinlat1 = np.sin(np.radians(lat1))
+    sinlat2 = np.sin(np.radians(lat2))
+    coslat1 = np.cos(np.radians(lat1))
+    coslat2 = np.cos(np.radians(lat2))
+
+    sin10 = np.abs(np.sin(sin1/2.))
+    sin20 = np.abs(np.sin(sin2/2.))
+    sin1sin1 =  np.multiply(sin10, sin10)
+    sin2sin2 =  np.multiply(sin20, sin20)
+    sqrt =  sin1sin1+np.multiply((coslat1*coslat2), sin2sin2)
+
+    dist_c =  np.multiply(2., np.arctan2(np.sqrt(sqrt), np.sqrt(1-sqrt)))
+    dist = np.multiply(r/nm, dist_c)
+
+    sin21 = np.sin(sin2)
+    cos21 = np.cos(sin2)
+    y = np.multiply(sin21, coslat2)
+
+    x1 = np.multiply(coslat1, sinlat2)
+
+    x2 = np.multiply(sinlat1, coslat2)
+    x3 = np.multiply(x2, cos21)
+    x = x1-x3
+
+    qdr = np.degrees(np.arctan2(y, x))
+
+    if reverse:
+        # Same calculation with positions 1 and 2 swapped
+        yrev   = -np.multiply(sin21, coslat1)
+        xrev   = np.multiply(coslat2, sinlat1) - np.multiply(np.multiply(sinlat2, coslat1), cos21)
+        qdrrev = np.degrees(np.arctan2(yrev, xrev))
+        return qdr, qdrrev, dist
+
+    return qdr, dist
+
+
 def latlondist(latd1, lond1, latd2, lond2):
     """ Calculates distance using haversine formulae and avaerage r from wgs'84
         Input:
@@ -144,7 +144,7 @@ def cmdsplit(cmdline, trafids=None):
             cmdargs[i] = ""
 
     # If a traffic id list is passed, check if command and first argument need to be switched
-    if trafids and len(cmdargs) > 1 and trafids.count(cmdargs[0]):
+    if trafids and len(cmdargs) > 1 and cmdargs[0] in trafids:
         cmdargs[0:2] = cmdargs[1::-1]
 
     # return command, argumentlist
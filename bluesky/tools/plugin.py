@@ -6,6 +6,7 @@ from glob import glob
 import imp
 import bluesky as bs
 from bluesky import settings
+from bluesky.tools import scheduler
 
 # Register settings defaults
 settings.set_variable_defaults(plugin_path='plugins', enabled_plugins=['datafeed'])
@@ -119,6 +120,14 @@ if settings.node_only or settings.gui == 'pygame':
     preupdate_funs = dict()
     update_funs    = dict()
 
+    def stagger(k):
+        """ Default phase of the k-th loaded plugin, as a fraction of its
+            update interval: the fractional part of k times the golden
+            ratio. This spreads plugins with the same interval over the
+            interval, and keeps them off the start of the interval, at which
+            ASAS is updated. """
+        return (k * 0.6180339887) % 1.0
+
     def load(name, descr):
         try:
             # Load the plugin
@@ -128,12 +137,17 @@ if settings.node_only or settings.gui == 'pygame':
             config, stackfuns    = plugin.init_plugin()
             active_plugins[name] = plugin
             dt     = max(config.get('update_interval', 0.0), bs.sim.simdt)
+            phase  = config.get('update_phase', stagger(len(active_plugins)) * dt)
             prefun = config.get('preupdate', None)
             updfun = config.get('update', None)
+            # The first update is one interval after loading the plugin
+            tfirst = bs.sim.simt + dt + phase
             if prefun:
-                preupdate_funs[name] = [bs.sim.simt + dt, dt, prefun]
+                preupdate_funs[name] = [scheduler.Task(name + '.PRE', dt, phase), prefun]
+                preupdate_funs[name][0].tnext = tfirst
             if updfun:
-                update_funs[name]    = [bs.sim.simt + dt, dt, updfun]
+                update_funs[name]    = [scheduler.Task(name, dt, phase), updfun]
+                update_funs[name][0].tnext = tfirst
             # Add the plugin's stack functions to the stack
             bs.stack.append_commands(stackfuns)
             return True, 'Successfully loaded %s' % name
@@ -145,33 +159,26 @@ if settings.node_only or settings.gui == 'pygame':
         cmds, docs = list(zip(*descr.plugin_stack))
         bs.stack.remove_commands(cmds)
         active_plugins.pop(name)
-        preupdate_funs.pop(name)
-        update_funs.pop(name)
+        preupdate_funs.pop(name, None)
+        update_funs.pop(name, None)
+        scheduler.remove(name + '.PRE')
+        scheduler.remove(name)
 
     def preupdate(simt):
-        for fun in list(preupdate_funs.values()):
-            # Call function if its update interval has passed
-            if simt >= fun[0]:
-                # Set the next triggering time for this function
-                fun[0] += fun[1]
-                # Call the function
-                fun[2]()
+        for task, fun in list(preupdate_funs.values()):
+            # Call function if its update task is due
+            if task.due(simt):
+                fun()
 
     def update(simt):
-        for fun in list(update_funs.values()):
-            # Call function if its update interval has passed
-            if simt >= fun[0]:
-                # Set the next triggering time for this function
-                fun[0] += fun[1]
-                # Call the function
-                fun[2]()
+        for task, fun in list(update_funs.values()):
+            # Call function if its update task is due
+            if task.due(simt):
+                fun()
 
     def reset():
-        for fun in list(preupdate_funs.values()):
-            fun[0] = 0.0
-
-        for fun in update_funs:
-            fun[0] = 0.0
+        for task, fun in list(preupdate_funs.values()) + list(update_funs.values()):
+            task.reset()
 
 else:
     def load(name, descr):
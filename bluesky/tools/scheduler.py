@@ -0,0 +1,181 @@
+""" BlueSky scheduler for the periodic updates of the simulation.
+
+    Subsystems that are not updated every time step (e.g., the FMS, the
+    performance model, ASAS and plugins) each create a Task with their
+    update interval. The tasks are not run from a central loop: each
+    subsystem checks its own task in its update function, as before. This
+    module keeps all tasks together, so that their timing can be listed and
+    changed with the UPDATERATE stack command, is reset with the
+    simulation, stored by SAVESTATE, and used to align adaptive time steps.
+
+    - By default, a task is performed when its interval dt has passed since
+      its last update (the FMS and the performance model), or at the
+      simulation times phase + k * dt when a phase is given (ASAS and
+      plugins). Plugins get different default phases, so that they are
+      spread over their interval. Other subsystems can be staggered by
+      giving them a phase offset with UPDATERATE.
+    - With nslices > 1, each update of a sliceable subsystem (the FMS and
+      the BlueSky performance model) only covers the next 1/nslices part of
+      the aircraft, in round-robin order, so the cost of a full update is
+      spread over several updates."""
+from math import floor
+
+# Dict to contain all tasks, by name
+tasks = dict()
+
+# Tolerance for the accumulated round-off in the simulation time
+eps = 1e-6
+
+
+class Task(object):
+    """ Periodic update of a subsystem. Without phase, the task is due when
+        dt has passed since its last update, and at the first time step.
+        With a phase, it is due at simulation times phase + k * dt. The
+        subsystem calls due(simt) every time step, and performs its update
+        when it returns True. """
+
+    def __init__(self, name, dt, phase=None, nslices=1, sliceable=False):
+        self.name      = name.upper()
+        self.dt        = dt
+        self.phase     = phase
+        self.nslices   = nslices
+        self.sliceable = sliceable  # Whether the subsystem can use getslice()
+        self.reset()
+
+        tasks[self.name] = self
+
+    def reset(self):
+        self.tnext   = self.phase or 0.0  # Next time this task is due
+        self.ncalls  = 0                  # Number of times this task was due
+        self.tlast   = None               # Time of the last update
+        self.elapsed = 0.0                # Time since the previous update [s]
+
+    def isreset(self, simt):
+        """ Whether the simulation time is before the last update of this
+            task, which means the simulation was reset. """
+        tlast = self.tnext - (self.dt if self.phase is None else max(self.dt, self.phase))
+        return simt + eps < tlast
+
+    def due(self, simt):
+        """ Returns True when the task should be performed in this time step.
+            With a phase, updates that were missed (e.g., because the time
+            step is larger than dt) are skipped, so that the task keeps its
+            phase. """
+        if self.isreset(simt):
+            self.reset()
+
+        if simt + eps < self.tnext:
+            return False
+
+        # Tasks without interval are performed every time step
+        if self.phase is None:
+            self.tnext = simt + self.dt
+        elif self.dt > 0.0:
+            self.tnext += self.dt * (floor((simt + eps - self.tnext) / self.dt) + 1)
+
+        # Time since the previous update, to integrate over (e.g., the fuel
+        # burn). This can differ from dt with large (adaptive) time steps,
+        # and when updates are skipped.
+        self.elapsed = self.dt if self.tlast is None else simt - self.tlast
+        self.tlast   = simt
+        self.ncalls += 1
+        return True
+
+    def isdue(self, simt):
+        """ Returns True when the task will be performed in this time step,
+            without counting it as performed (see due). """
+        return simt + eps >= self.tnext or self.isreset(simt)
+
+    def getslice(self, n):
+        """ Returns the slice of the n aircraft to update in the current call. """
+        if self.nslices <= 1:
+            return slice(None)
+        i = (self.ncalls - 1) % self.nslices
+        return slice(i * n // self.nslices, (i + 1) * n // self.nslices)
+
+
+def nexttime(simt, dtmin=0.0):
+    """ Return the first time after simt at which a task with an update
+        interval of at least dtmin is due, or None when there is no such
+        task. Used to align adaptive time steps with the task updates. """
+    tnext = None
+    for task in tasks.values():
+        if task.dt < dtmin:
+            continue
+        t = task.tnext
+        if t <= simt + eps and task.dt > 0.0:
+            # Due in this time step: the next update is after this one
+            if task.phase is None:
+                t = simt + task.dt
+            else:
+                t += task.dt * (floor((simt + eps - t) / task.dt) + 1)
+        if t > simt + eps and (tnext is None or t < tnext):
+            tnext = t
+    return tnext
+
+
+def remove(name):
+    tasks.pop(name.upper(), None)
+
+
+def reset():
+    for task in tasks.values():
+        task.reset()
+
+
+def getstate():
+    """ Return the timing of all tasks, for SAVESTATE """
+    return {name: (task.tnext, task.ncalls, task.tlast) for name, task in tasks.items()}
+
+
+def setstate(state):
+    """ Restore the timing of all tasks, for LOADSTATE. States saved
+        without the time of the last update are accepted as well. """
+    for name, timing in state.items():
+        if name in tasks:
+            tasks[name].tnext, tasks[name].ncalls = timing[:2]
+            tasks[name].tlast = timing[2] if len(timing) > 2 else None
+
+
+def describe(task):
+    """ Text with the timing of task, for UPDATERATE """
+    timing = "after each update" if task.phase is None else "phase = %.2f s" % task.phase
+    slices = (", %d slices" % task.nslices) if task.sliceable else ""
+    return "%-12s dt = %.2f s, %s%s" % (task.name, task.dt, timing, slices)
+
+
+def setrate(name=None, dt=None, phase=None, nslices=None):
+    """ Stack function UPDATERATE: list the tasks, or set the update
+        interval, phase offset, and number of slices of a task. Giving a
+        phase puts the task on the time grid phase + k * dt. """
+    if name is None:
+        return True, "\n".join(describe(task) for task in
+                               sorted(tasks.values(), key=lambda task: task.name))
+
+    task = tasks.get(name.upper())
+    if task is None:
+        return False, "UPDATERATE: unknown task " + name + ". Tasks are: " + \
+            ", ".join(sorted(tasks.keys()))
+
+    if dt is None:
+        return True, describe(task)
+
+    if dt <= 0.0:
+        return False, "UPDATERATE: interval should be larger than zero"
+
+    if nslices is not None and nslices > 1 and not task.sliceable:
+        return False, "UPDATERATE: " + task.name + " cannot be updated in slices"
+
+    if nslices is not None:
+        task.nslices = max(1, nslices)
+
+    if phase is not None:
+        task.phase = phase
+    if task.phase is not None:
+        # Continue on the new time grid
+        task.tnext = task.phase
+    elif task.ncalls > 0:
+        # Next update at the new interval after the last update
+        task.tnext += dt - task.dt
+    task.dt = dt
+    return True
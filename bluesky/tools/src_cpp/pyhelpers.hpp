@@ -28,6 +28,8 @@ struct PyArrayAttr: public PyAttr {
     PyArrayAttr(PyObject* attr) : PyAttr(attr) {init();}
 
     void init() {
+        arr = NULL;
+        ptr_start = ptr = NULL;
         if (attr != NULL) {
             arr = (PyArrayObject*)PyArray_FROM_OTF(attr, atype<T>(), NPY_ARRAY_IN_ARRAY);
             if (arr != NULL) {
@@ -40,7 +42,7 @@ struct PyArrayAttr: public PyAttr {
         Py_XDECREF(arr);
     }
 
-    operator bool() const {return (attr != NULL);}
+    operator bool() const {return (attr != NULL && arr != NULL);}
     npy_intp size() const {return PyArray_SIZE(arr);}
 };
 
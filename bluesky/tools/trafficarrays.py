@@ -5,6 +5,44 @@ import numpy as np
 
 defaults = {"float": 0.0, "int": 0, "bool": False, "S": "", "str": ""}
 
+# Default values for numpy arrays, per dtype kind
+kinddefaults = {"f": 0.0, "i": 0, "u": 0, "b": False, "S": "", "U": ""}
+
+# Types of attributes that are part of the state (see TrafficArrays.getstate),
+# and bookkeeping attributes that are not
+statetypes = (np.ndarray, list, dict, str, bool, int, float, np.number)
+structvars = ("parent", "children", "Vars", "ArrVars", "LstVars", "ArrBufs", "idmap", "scratchbufs")
+
+
+def keepmask(n, idx, mask=None):
+    """ Return a boolean mask of length n which is False for all indices
+        in idx. An existing mask of the right length is reused."""
+    if mask is None or len(mask) != n:
+        mask = np.ones(n, dtype=bool)
+        mask[idx] = False
+    return mask
+
+
+def listdelete(lst, idx):
+    """ Remove element idx from list lst in-place. idx can be a single
+        index, an array of indices, or a boolean mask of elements to keep."""
+    if np.ndim(idx) == 0:
+        del lst[idx]
+        return
+    keep = idx if np.asarray(idx).dtype == bool else keepmask(len(lst), idx)
+    lst[:] = [elem for elem, k in zip(lst, keep) if k]
+
+
+def setsubset(arr, idx, values):
+    """ Return arr with the elements idx replaced by values. With idx=None,
+        values replaces the whole array. A copy is modified instead of arr
+        itself, so other references to arr are not affected."""
+    if idx is None:
+        return values
+    arr = arr.copy()
+    arr[idx] = values
+    return arr
+
 
 class RegisterElementParameters():
     """ Class to use in 'with'-syntax. This class automatically
@@ -24,7 +62,12 @@ class RegisterElementParameters():
 class TrafficArrays(object):
     """ Parent class to use separate arrays and lists to allow
         vectorizing but still maintain and object like benefits
-        for creation and deletion of an element for all paramters"""
+        for creation and deletion of an element for all paramters
+
+        Registered numpy arrays are stored in preallocated buffers that
+        double in capacity when they are full. The attributes themselves
+        (e.g., traf.lat) are views of the live part of these buffers, so
+        creating an aircraft only costs a full copy when a buffer grows."""
 
     # The TrafficArrays class keeps track of all of the constructed
     # TrafficArray objects
@@ -43,6 +86,7 @@ class TrafficArrays(object):
         self.children = []
         self.ArrVars  = []
         self.LstVars  = []
+        self.ArrBufs  = dict()  # Backing storage of the registered arrays
         self.Vars     = self.__dict__
 
     def reparent(self, newparent):
@@ -77,37 +121,110 @@ class TrafficArrays(object):
             self.Vars[v].extend(defaultvalue)
 
         for v in self.ArrVars:  # Numpy array
-            # Get type without byte length
-            fulltype = str(self.Vars[v].dtype)
-            vartype = ""
-            for c in fulltype:
-                if not c.isdigit():
-                    vartype = vartype + c
-
-            # Get default value
-            if vartype in defaults:
-                defaultvalue = [defaults[vartype]] * n
-            else:
-                defaultvalue = [0.0] * n
-
-            self.Vars[v] = np.append(self.Vars[v], defaultvalue)
+            # Get default value from the type (kind) of the array
+            defaultvalue = kinddefaults.get(self.Vars[v].dtype.kind, 0.0)
+
+            arr = self.grow(v, n)
+            arr[len(arr) - n:] = defaultvalue
+
+    def grow(self, v, n):
+        ''' Extend registered array v with n elements, and return the
+            new view on its backing buffer. When the array was replaced
+            by a new array object (e.g., traf.alt = traf.alt + dalt) since
+            the last call, or when the buffer is full, a new buffer with
+            double the required size is allocated. Old buffers are never
+            written to again, so references to previous views stay valid.'''
+        arr  = self.Vars[v]
+        nold = len(arr)
+        nnew = nold + n
+        buf  = self.ArrBufs.get(v)
+        if buf is None or arr.base is not buf or len(buf) < nnew:
+            buf = np.empty(max(2 * nnew, 8), dtype=arr.dtype)
+            buf[:nold] = arr
+            self.ArrBufs[v] = buf
+
+        self.Vars[v] = buf[:nnew]
+        return self.Vars[v]
 
     def create_children(self, n=1):
+        if n <= 0:
+            return
         for child in self.children:
             child.create(n)
             child.create_children(n)
 
     def delete(self, idx):
-        # Remove element (aircraft) idx from all lists and arrays
-        for v in self.LstVars:
-            del self.Vars[v][idx]
-
-        for v in self.ArrVars:
-            self.Vars[v] = np.delete(self.Vars[v], idx)
+        # Remove element (aircraft) idx from all lists and arrays.
+        # idx can also be an array of indices, in which case all lists
+        # and arrays are compacted in a single masked pass each.
+        if np.ndim(idx) > 0:
+            keep = None
+            for v in self.LstVars:
+                keep = keepmask(len(self.Vars[v]), idx, keep)
+                listdelete(self.Vars[v], keep)
+
+            for v in self.ArrVars:
+                keep = keepmask(len(self.Vars[v]), idx, keep)
+                self.Vars[v] = self.Vars[v][keep]
+
+        else:
+            for v in self.LstVars:
+                del self.Vars[v][idx]
+
+            for v in self.ArrVars:
+                self.Vars[v] = np.delete(self.Vars[v], idx)
 
         for child in self.children:
             child.delete(idx)
 
+    def namedchildren(self):
+        ''' Return (name, child) tuples of all children. The name of a child
+            is its attribute name in this object (e.g., 'asas'), or its
+            lowercase class name when it isn't an attribute (e.g., plugins).'''
+        names = {id(obj): name for name, obj in self.Vars.items()
+                 if name != 'parent' and isinstance(obj, TrafficArrays)}
+        return [(names.get(id(child), type(child).__name__.lower()), child)
+                for child in self.children]
+
+    def getstate(self, prefix=''):
+        ''' Return the state of this object and all its children as a dict,
+            keyed by path (e.g., 'asas.trk'). The state consists of all
+            data attributes: the registered arrays and lists, but also for
+            instance the conflict lists of ASAS and scheduling times.'''
+        state = dict()
+        for name, value in self.Vars.items():
+            if name not in structvars and isinstance(value, statetypes):
+                state[prefix + name] = value
+
+        for name, child in self.namedchildren():
+            state.update(child.getstate(prefix + name + '.'))
+
+        return state
+
+    def setstate(self, state, n, prefix=''):
+        ''' Restore the state of this object and all its children from a
+            dict obtained with getstate(), for a total of n elements.
+            Registered variables that are missing from the state are filled
+            with their default values.'''
+        for name, value in self.Vars.items():
+            if name not in structvars and isinstance(value, statetypes) \
+                    and prefix + name in state:
+                self.Vars[name] = state[prefix + name]
+
+        for v in self.ArrVars:
+            if prefix + v not in state:
+                self.Vars[v] = np.full(n, kinddefaults.get(self.Vars[v].dtype.kind, 0.0),
+                                       dtype=self.Vars[v].dtype)
+
+        for v in self.LstVars:
+            if prefix + v not in state:
+                self.Vars[v] = [""] * n
+
+        self.ArrBufs.clear()
+
+        for name, child in self.namedchildren():
+            child.setstate(state, n, prefix + name + '.')
+
     def reset(self):
         # Delete all elements from arrays and start at 0 aircraft
         for v in self.LstVars:
@@ -116,5 +233,7 @@ class TrafficArrays(object):
         for v in self.ArrVars:
             self.Vars[v] = np.array([], dtype=self.Vars[v].dtype)
 
+        self.ArrBufs.clear()
+
         for child in self.children:
             child.reset()
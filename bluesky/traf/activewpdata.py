@@ -1,6 +1,6 @@
 import numpy as np
 import bluesky as bs
-from bluesky.tools.trafficarrays import TrafficArrays, RegisterElementParameters
+from bluesky.tools.trafficarrays import TrafficArrays, RegisterElementParameters, setsubset
 from bluesky.tools.aero import nm, g0
 from bluesky.tools.misc import degto180
 
@@ -28,28 +28,34 @@ class ActiveWaypoint(TrafficArrays):
         self.flyby[-n:]     = 1.0   # Flyby/fly-over switch
         self.next_qdr[-n:]  = -999.0    # bearing next leg
 
-    def Reached(self, qdr, dist, flyby):
+    def Reached(self, qdr, dist, flyby, idx=None):
+        # Waypoint check of the slice idx of the aircraft (default: all
+        # aircraft), for which qdr, dist and flyby are given. Returns the
+        # indices of the aircraft that reached their active waypoint.
+        i = slice(None) if idx is None else idx
+
         # Calculate distance before waypoint where to start the turn
         # Turn radius:      R = V2 tan phi / g
         # Distance to turn: wpturn = R * tan (1/2 delhdg) but max 4 times radius
         # using default bank angle per flight phase
-        turnrad = bs.traf.tas * bs.traf.tas /     \
-                      np.maximum(bs.traf.eps, np.tan(bs.traf.bank) * g0 * nm)  # [nm]
+        turnrad = bs.traf.tas[i] * bs.traf.tas[i] /     \
+                      np.maximum(bs.traf.eps[i], np.tan(bs.traf.bank[i]) * g0 * nm)  # [nm]
 
-        next_qdr = np.where(self.next_qdr < -900., qdr, self.next_qdr)
+        next_qdr = np.where(self.next_qdr[i] < -900., qdr, self.next_qdr[i])
 
         # Avoid circling
 #        away = np.abs(degto180(bs.traf.trk - next_qdr)+180.)>90.
 #        away     = np.abs(degto180(bs.traf.trk - next_qdr))>90.
-        away     = np.abs(degto180(bs.traf.trk%360. - qdr%360.))>90.
+        away     = np.abs(degto180(bs.traf.trk[i]%360. - qdr%360.))>90.
         incircle = dist<turnrad*1.01
         circling = away*incircle
 
 
         # distance to turn initialisation point [nm]
-        self.turndist = flyby*np.minimum(100., np.abs(turnrad *
+        turndist = flyby*np.minimum(100., np.abs(turnrad *
             np.tan(np.radians(0.5 * np.abs(degto180(qdr%360. - next_qdr%360.))))))
-
+        self.turndist = setsubset(self.turndist, idx, turndist)
 
         # Check whether shift based dist [nm] is required, set closer than WP turn distanc
-        return np.where(bs.traf.swlnav * ((dist < self.turndist)+circling))[0]
+        reached = np.where(bs.traf.swlnav[i] * ((dist < turndist)+circling))[0]
+        return reached if idx is None else reached + i.start
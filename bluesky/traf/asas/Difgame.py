@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+Differential game conflict resolution: the controls of the ownship are
+looked up in a precomputed table of the optimal actions, for the
+discretized relative state of each conflict.
+
+Created on Wed Mar 04 14:27:44 2015
+
+@author: Jerom Maas
+"""
+import numpy as np
+from bluesky import settings
+from bluesky.tools.aero import nm
+
+# Register settings defaults
+settings.set_variable_defaults(asas_difgame_table='data/asas/DifgameActions.npy')
+
+
+def start(asas):
+    # Table of the optimal horizontal controls (acceleration and bank), for
+    # the own ship ('own') and for the ship that tries to hit it ('wrong'),
+    # indexed by the discretized state. Memory-mapped, only the entries
+    # that are used are read.
+    asas.Controls = np.load(settings.asas_difgame_table, mmap_mode='r')
+
+    # Discretization numbers: in how many elements is discretized
+    asas.dn_state = [9, 9, 5, 5, 8]  # states
+
+    gridsize = 5 * nm
+
+    # State variables
+    asas.xw  = ndisc(0, gridsize, asas.dn_state[0])         # [m]
+    asas.yw  = ndisc(12.5 * nm, gridsize, asas.dn_state[1])  # [m]
+    asas.v_o = ndisc(140, 15, asas.dn_state[2])              # [m/s]
+    asas.v_w = ndisc(140, 15, asas.dn_state[3])              # [m/s]
+    asas.phi = cdisc(-1, 1, asas.dn_state[4]) * np.pi        # [radians]
+
+    asas.dist_a = 10 * nm    # [m]
+    asas.dist_b = 12.5 * nm  # [m]
+
+
+def resolve(asas, traf):
+    if not asas.swasas:
+        return
+
+    # -------------------------------------------------------------------------
+    # First, find the conflicts of the CD in the region of the differential
+    # game, with the relative positions in the frame of the ownship track
+    ids = traf.ids2idx([ac for pair in asas.confpairs for ac in pair]).reshape(-1, 2)
+    k   = np.flatnonzero((ids[:, 0] > -1) & (ids[:, 1] > -1))
+    own, wrn = ids[k, 0], ids[k, 1]
+
+    qdrrel = np.radians(asas.qdr[k] - traf.trk[own])
+    xrel = np.sin(qdrrel) * asas.dist[k]
+    yrel = np.cos(qdrrel) * asas.dist[k]
+
+    # Define the two borders:
+    b1 = yrel - np.abs(xrel) > -asas.dist_a
+    b2 = xrel**2 + (yrel - asas.dist_b)**2 < (asas.dist_a + asas.dist_b)**2
+    dg = b1 & b2
+
+    # -------------------------------------------------------------------------
+    # Second, find the controls of the ownship of each conflict. The controls
+    # are indices: 0 is decrease, 1 is keep, 2 is increase
+    ctrl = Difgame(traf, asas, k[dg], own[dg], wrn[dg])
+
+    # Superposition of the controls of all conflicts of each aircraft,
+    # limited to the maximum values
+    controls = np.zeros((traf.ntraf, 3), dtype=int)
+    np.add.at(controls, own[dg], ctrl - 1)
+    controls = np.clip(controls, -1, 1)
+    acccontrol, bankcontrol, climbcontrol = controls.T
+
+    # Now assign in the asas class --------------------------------------------
+    # Accelerate to the maximum or decelerate to the minimum ASAS speed
+    asas.tas = np.where(acccontrol == 0, traf.gs,
+                        np.where(acccontrol > 0, asas.vmax, asas.vmin))
+    # Turn right or left
+    asas.trk = (traf.trk + 90. * bankcontrol) % 360
+    # Climb or descend, or keep the current altitude
+    asas.vs  = np.where(climbcontrol > 0, asas.vsmax,
+                        np.where(climbcontrol < 0, asas.vsmin, 0.))
+    asas.alt = np.where(climbcontrol == 0, traf.alt, climbcontrol * 1e5)
+
+
+def Difgame(traf, asas, k, own, wrn):
+    """ Controls from the differential game table for conflicts k (indices
+        in asas.confpairs) between aircraft own and wrn (arrays with one
+        element per conflict). Returns the acceleration, bank and climb
+        control indices, one row per conflict """
+    # Does the ownship try to hit the other ship? Then the controls are
+    # taken from the 'wrong' part of the table, which is in the perspective
+    # of the other ship
+    pirates = np.array(traf.id)[own] == "WRN" if len(own) else np.zeros(0, dtype=bool)
+
+    # First, compute the five states in the perspective of the table
+    o = np.where(pirates, wrn, own)
+    w = np.where(pirates, own, wrn)
+    dist   = asas.dist[k]
+    qdr    = np.where(pirates, asas.qdr[k] + 180., asas.qdr[k])
+    phi    = np.radians((traf.trk[w] - traf.trk[o] + 180) % 360 - 180)
+    qdrrel = np.radians(qdr - traf.trk[o])
+    x      = np.sin(qdrrel) * dist
+    y      = np.cos(qdrrel) * dist
+    v_o    = traf.gs[o]
+    v_w    = traf.adsb.gs[w]
+
+    # Discretized state, and the horizontal controls from the table
+    dstate = (discretize(x, asas.xw), discretize(y, asas.yw),
+              discretize(v_o, asas.v_o), discretize(v_w, asas.v_w),
+              discretize(phi, asas.phi, cyclic=True))
+    actions = asas.Controls[dstate]
+    horC    = np.where(pirates.reshape(-1, 1), actions['wrong'], actions['own'])
+
+    # Find vertical controls: the lower aircraft descends, the higher climbs
+    verticalconflict = np.abs(traf.alt[own] - traf.alt[wrn]) < asas.dhm
+    verC = np.where(verticalconflict,
+                    np.where(traf.alt[own] < traf.alt[wrn], 0, 2), 1)
+
+    # Combine Horizontal and Vertical Controls
+    return np.column_stack((horC, verC))
+
+
+#========================= Discretization =====================================
+
+
+def ndisc(center, step, n):
+    """ n discrete values around center, step apart """
+    return center + step * (np.arange(n) - 0.5 * (n - 1))
+
+
+def cdisc(lower, upper, n):
+    """ n discrete values of a cyclic variable with period upper - lower """
+    return lower + (upper - lower) * np.arange(n) / float(n)
+
+
+def discretize(values, grid, cyclic=False):
+    """ Indices of the nearest grid values of values. Values outside the
+        grid get the first or last index, unless the variable is cyclic """
+    idx = np.round((values - grid[0]) / (grid[1] - grid[0])).astype(int)
+    return idx % len(grid) if cyclic else np.clip(idx, 0, len(grid) - 1)
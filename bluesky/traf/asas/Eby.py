@@ -5,7 +5,6 @@ Created on Tue Mar 03 16:50:19 2015
 @author: Jerom Maas
 """
 import numpy as np
-from bluesky.tools.aero import vtas2eas
 
 
 def start(asas):
@@ -19,56 +18,58 @@ def resolve(asas, traf):
     # required change in velocity
     dv = np.zeros((traf.ntraf, 3))
 
+    # Indices of the aircraft of each conflict in the CD results
+    ids = traf.ids2idx([ac for pair in asas.confpairs for ac in pair]).reshape(-1, 2)
+    k   = np.arange(len(ids))
+
     #if possible, solve conflicts once and copy results for symmetrical conflicts,
     #if that is not possible, solve each conflict twice, once for each A/C
-    if not traf.ADSBtrunc and not traf.ADSBtransnoise:
-        for conflict in asas.conflist_now:
-            id1, id2 = asas.ConflictToIndices(conflict)
-            if id1 != "Fail" and id2 != "Fail":
-                dv_eby = Eby_straight(traf, asas, id1, id2)
-                dv[id1] -= dv_eby
-                dv[id2] += dv_eby
-    else:
-        for i in range(asas.nconf):
-            confpair = asas.confpairs[i]
-            ac1      = confpair[0]
-            ac2      = confpair[1]
-            id1      = traf.id.index(ac1)
-            id2      = traf.id.index(ac2)
-            dv_eby   = Eby_straight(asas, id1, id2)
-            dv[id1] -= dv_eby
+    symmetric = not traf.adsb.truncated and not traf.adsb.transnoise
+    if symmetric:
+        # Solve each pair once, with the first of its two conflicts
+        key = np.minimum(ids[:, 0], ids[:, 1]) * traf.ntraf + np.maximum(ids[:, 0], ids[:, 1])
+        k   = np.sort(np.unique(key, return_index=True)[1])
+
+    k        = k[(ids[k, 0] > -1) & (ids[k, 1] > -1)]
+    id1, id2 = ids[k, 0], ids[k, 1]
+    dv_eby   = Eby_straight(traf, asas, k, id1, id2)
+
+    np.subtract.at(dv, id1, dv_eby)
+    if symmetric:
+        np.add.at(dv, id2, dv_eby)
 
     # now we have the change in speed vector for each aircraft.
     dv=np.transpose(dv)
     # the old speed vector, cartesian coordinates
-    trkrad=np.radians(traf.trk)
-    v=np.array([np.sin(trkrad)*traf.tas,\
-        np.cos(trkrad)*traf.tas,\
-        traf.vs])
+    v=np.array([traf.gseast, traf.gsnorth, traf.vs])
     # the new speed vector
     newv=dv+v
 
     # the new speed vector in polar coordinates
     newtrack=(np.arctan2(newv[0,:],newv[1,:])*180/np.pi) %360
     newgs=np.sqrt(newv[0,:]**2+newv[1,:]**2)
-    neweas=vtas2eas(newgs,traf.alt)
 
     # Cap the velocity
-    neweascapped=np.maximum(asas.vmin,np.minimum(asas.vmax,neweas))
+    newgscapped=np.maximum(asas.vmin,np.minimum(asas.vmax,newgs))
 
-    # now assign in the traf class
-    asas.hdg = newtrack
-    asas.tas = neweascapped
+    # now assign in the asas class
+    asas.trk = newtrack
+    asas.tas = newgscapped
     asas.vs  = newv[2,:]
-    asas.alt = np.sign(asas.vs)*1e5
+    # Climb or descend while the resolution has a vertical component,
+    # otherwise keep the selected altitude
+    asas.alt = np.where(np.abs(dv[2,:])>0.0, np.sign(asas.vs)*1e5, traf.selalt)
 
 #=================================== Eby Method ===============================
 
     # Resolution: Eby method assuming aircraft move straight forward, solving algebraically, only horizontally
-def Eby_straight(traf, asas, id1, id2):
-    traf = traf
-    dist = asas.dist[id1,id2]
-    qdr  = asas.qdr[id1,id2]
+def Eby_straight(traf, asas, k, id1, id2):
+    """ Eby resolution for conflicts k (indices in asas.confpairs) between
+        aircraft id1 and id2 (arrays with one element per conflict).
+        Returns the required change of the relative velocity (one row per
+        conflict) """
+    dist = asas.dist[k]
+    qdr  = asas.qdr[k]
     # from degrees to radians
     qdr  = np.radians(qdr)
     # relative position vector
@@ -76,13 +77,9 @@ def Eby_straight(traf, asas, id1, id2):
            np.cos(qdr)*dist, \
            traf.alt[id2]-traf.alt[id1] ])
 
-    # find track in radians
-    t1 = np.radians(traf.trk[id1])
-    t2 = np.radians(traf.trk[id2])
-
     # write velocities as vectors and find relative velocity vector
-    v1=np.array([np.sin(t1)*traf.tas[id1],np.cos(t1)*traf.tas[id1],traf.vs[id1]])
-    v2=np.array([np.sin(t2)*traf.tas[id2],np.cos(t2)*traf.tas[id2],traf.vs[id2]])
+    v1=np.array([traf.gseast[id1],traf.gsnorth[id1],traf.vs[id1]])
+    v2=np.array([traf.gseast[id2],traf.gsnorth[id2],traf.vs[id2]])
     v=np.array(v2-v1)
     # bear in mind: the definition of vr (relative velocity) is opposite to
     # the velocity vector in the LOS_nominal method, this just has consequences
@@ -100,39 +97,41 @@ def Eby_straight(traf, asas, id1, id2):
     """
     # These terms are used to construct a,b,c of the quadratic formula
     R2=asas.Rm**2 # in meters
-    d2=np.dot(d,d) # distance vector length squared
-    v2=np.dot(v,v) # velocity vector length squared
-    dv=np.dot(d,v) # dot product of distance and velocity
+    d2=np.sum(d*d, axis=0) # distance vector length squared
+    v2=np.sum(v*v, axis=0) # velocity vector length squared
+    dv=np.sum(d*v, axis=0) # dot product of distance and velocity
 
     # Solving the quadratic formula
     a=R2*v2 - dv**2
     b=2*dv* (R2 - d2)
     c=R2*d2 - d2**2
-    discrim=b**2 - 4*a*c
-
-    if discrim<0: # if the discriminant is negative, we're done as taking the square root will result in an error
-        discrim=0
-    time1=(-b+np.sqrt(discrim))/(2*a)
-    time2=(-b-np.sqrt(discrim))/(2*a)
-
-    #time when the size of the conflict is largest relative to time to solve
-    tstar=min(abs(time1),abs(time2))
+    # if the discriminant is negative, taking the square root would result in an error
+    discrim=np.maximum(0., b**2 - 4*a*c)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        time1=(-b+np.sqrt(discrim))/(2*a)
+        time2=(-b-np.sqrt(discrim))/(2*a)
+
+    #time when the size of the conflict is largest relative to time to solve.
+    #Without relative motion (a=0) there is no such time: solve the conflict
+    #within one ASAS update
+    tstar=np.fmin(np.abs(time1),np.abs(time2))
+    tstar=np.where(np.isfinite(tstar), np.maximum(tstar, asas.task.dt), asas.task.dt)
 
     #find drel and absolute distance at tstar
     drelstar=d+v*tstar
-    dstarabs=np.linalg.norm(drelstar)
+    dstarabs=np.sqrt(np.sum(drelstar*drelstar, axis=0))
     #exception: if the two aircraft are on exact collision course
     #(passing eachother within 10 meter), change drelstar
     exactcourse=10 #10 meter
     dif=exactcourse-dstarabs
-    if dif>0:
-        vperp=np.array([-v[1],v[0],0]) #rotate velocity 90 degrees in horizontal plane
-        drelstar+=dif*vperp/np.linalg.norm(vperp) #normalize to 10 m and add to drelstar
-        dstarabs=np.linalg.norm(drelstar)
+    vperp=np.array([-v[1],v[0],np.zeros(len(k))]) #rotate velocity 90 degrees in horizontal plane
+    vperpabs=np.maximum(np.sqrt(np.sum(vperp*vperp, axis=0)), 1e-9)
+    drelstar+=np.where(dif>0, dif*vperp/vperpabs, 0.) #normalize to 10 m and add to drelstar
+    dstarabs=np.sqrt(np.sum(drelstar*drelstar, axis=0))
 
     #intrusion at tstar
     i=asas.Rm-dstarabs
 
     #desired change in the plane's speed vector:
     dv=i*drelstar/(dstarabs*tstar)
-    return dv
+    return dv.T
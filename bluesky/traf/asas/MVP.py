@@ -28,83 +28,54 @@ def resolve(asas, traf):
 
     # Call MVP function to resolve conflicts-----------------------------------
 
+    # Indices of the aircraft of each conflict in the CD results
+    ids = traf.ids2idx([ac for pair in asas.confpairs for ac in pair]).reshape(-1, 2)
+    k   = np.arange(len(ids))
+
     # If possible, solve conflicts once and copy results for symmetrical conflicts
     # If that is not possible, solve each conflict twice, once for each A/C
-    if not traf.adsb.truncated and not traf.adsb.transnoise:
-        for conflict in asas.conflist_now:
-
-            # Determine ac indexes from callsigns
-            ac1, ac2 = conflict.split(" ")
-            id1, id2 = traf.id2idx(ac1), traf.id2idx(ac2)
-
-            # If A/C indexes are found, then apply MVP on this conflict pair
-            # Then use the MVP computed resolution to subtract and add dv_mvp
-            # to id1 and id2, respectively
-            if id1 > -1 and id2 > -1:
-                dv_mvp, tsolV = MVP(traf, asas, id1, id2)
-                if tsolV < timesolveV[id1]:
-                    timesolveV[id1] = tsolV
-                if tsolV < timesolveV[id2]:
-                    timesolveV[id2] = tsolV  
-
-                # Use priority rules if activated
-                if asas.swprio:
-                    dv[id1], dv[id2] = prioRules(traf, asas.priocode, dv_mvp, dv[id1], dv[id2], id1, id2)
-                else:
-                    # since cooperative, the vertical resolution component can be halved, and then dv_mvp can be added
-                    dv_mvp[2] = dv_mvp[2]/2.0
-                    dv[id1] = dv[id1] - dv_mvp
-                    dv[id2] = dv[id2] + dv_mvp
-
-                # Check the noreso aircraft. Nobody avoids noreso aircraft.
-                # But noreso aircraft will avoid other aircraft
-                if asas.swnoreso:
-                    if ac1 in asas.noresolst: # -> Then id2 does not avoid id1.
-                        dv[id2] = dv[id2] - dv_mvp
-                    if ac2 in asas.noresolst: # -> Then id1 does not avoid id2.
-                        dv[id1] = dv[id1] + dv_mvp
-
-                # Check the resooff aircraft. These aircraft will not do resolutions.
-                if asas.swresooff:
-                    if ac1 in asas.resoofflst: # -> Then id1 does not do any resolutions
-                        dv[id1] = 0.0
-                    if ac2 in asas.resoofflst: # -> Then id2 does not do any resolutions
-                        dv[id2] = 0.0
-
-
+    symmetric = not traf.adsb.truncated and not traf.adsb.transnoise
+    if symmetric:
+        # Solve each pair once, with the results of the first of its two
+        # conflicts in the CD results (the order of conflist_now)
+        key  = np.minimum(ids[:, 0], ids[:, 1]) * traf.ntraf + np.maximum(ids[:, 0], ids[:, 1])
+        k    = np.sort(np.unique(key, return_index=True)[1])
+
+    # If A/C indexes are found, then apply MVP on these conflict pairs
+    k        = k[(ids[k, 0] > -1) & (ids[k, 1] > -1)]
+    id1, id2 = ids[k, 0], ids[k, 1]
+    dv_mvp, tsolV = MVP(traf, asas, k, id1, id2)
+
+    # Use priority rules if activated
+    if asas.swprio:
+        dv1, dv2, dv_mvp = prioRules(traf, asas.priocode, dv_mvp, id1, id2)
     else:
-        for i in range(asas.nconf):
-            confpair = asas.confpairs[i]
-            ac1      = confpair[0]
-            ac2      = confpair[1]
-            id1      = traf.id.index(ac1)
-            id2      = traf.id.index(ac2)
-
-            # If A/C indexes are found, then apply MVP on this conflict pair
-            # Because ADSB is ON, this is done for each aircraft separately
-            if id1 >-1 and id2 > -1:
-                dv_mvp   = MVP(traf, asas, id1, id2)
-                if tsolV < timesolveV[id1]:
-                    timesolveV[id1] = tsolV
-
-                # Use priority rules if activated
-                if asas.swprio:
-                    dv[id1], _ = prioRules(traf, asas.priocode, dv_mvp, dv[id1], dv[id2], id1, id2)
-                else:
-                    # since cooperative, the vertical resolution component can be halved, and then dv_mvp can be added
-                    dv_mvp[2] = dv_mvp[2]/2.0
-                    dv[id1]    = dv[id1] - dv_mvp
-
-                # Check the noreso aircraft. Nobody avoids noreso aircraft.
-                # But noreso aircraft will avoid other aircraft
-                if asas.swnoreso:
-                    if ac2 in asas.noresolst: # -> Then id1 does not avoid id2.
-                        dv[id1] = dv[id1] + dv_mvp
-
-                # Check the resooff aircraft. These aircraft will not do resolutions.
-                if asas.swresooff:
-                    if ac1 in asas.resoofflst: # -> Then id1 does not do any resolutions
-                        dv[id1] = 0.0
+        # since cooperative, the vertical resolution component can be halved, and then dv_mvp can be added
+        dv_mvp[:, 2] = dv_mvp[:, 2]/2.0
+        dv1, dv2 = -dv_mvp, dv_mvp
+
+    # Check the noreso aircraft. Nobody avoids noreso aircraft.
+    # But noreso aircraft will avoid other aircraft
+    if asas.swnoreso:
+        noreso = acmask(traf, asas.noresolst)
+        # -> id2 does not avoid a noreso id1, and id1 does not avoid a noreso id2
+        dv1 = dv1 + np.where(noreso[id2].reshape(-1, 1), dv_mvp, 0.0)
+        dv2 = dv2 - np.where(noreso[id1].reshape(-1, 1), dv_mvp, 0.0)
+
+    # Add the resolutions of all conflicts of each aircraft, in the order of
+    # the conflicts. Without symmetry, each aircraft only resolves its own
+    # conflicts (as id1)
+    np.minimum.at(timesolveV, id1, tsolV)
+    if symmetric:
+        np.minimum.at(timesolveV, id2, tsolV)
+        np.add.at(dv, np.column_stack((id1, id2)).ravel(),
+                  np.stack((dv1, dv2), axis=1).reshape(-1, 3))
+    else:
+        np.add.at(dv, id1, dv1)
+
+    # Check the resooff aircraft. These aircraft will not do resolutions.
+    if asas.swresooff:
+        dv[acmask(traf, asas.resoofflst)] = 0.0
 
 
     # Determine new speed and limit resolution direction for all aicraft-------     
@@ -123,7 +94,7 @@ def resolve(asas, traf):
     # Compute new speed vector in polar coordinates based on desired resolution
     if asas.swresohoriz: # horizontal resolutions
         if asas.swresospd and not asas.swresohdg: # SPD only
-            newtrack = traf.trk
+            newtrack = traf.trk.copy()
             newgs    = np.sqrt(newv[0,:]**2 + newv[1,:]**2)
             newvs    = traf.vs
         elif asas.swresohdg and not asas.swresospd: # HDG only
@@ -135,7 +106,7 @@ def resolve(asas, traf):
             newgs    = np.sqrt(newv[0,:]**2 + newv[1,:]**2)
             newvs    = traf.vs
     elif asas.swresovert: # vertical resolutions
-        newtrack = traf.trk
+        newtrack = traf.trk.copy()
         newgs    = traf.gs
         newvs    = newv[2,:]
     else: # horizontal + vertical
@@ -173,15 +144,18 @@ def resolve(asas, traf):
 #======================= Modified Voltage Potential ===========================
 
 
-def MVP(traf, asas, id1, id2):
-    """Modified Voltage Potential (MVP) resolution method"""
+def MVP(traf, asas, k, id1, id2):
+    """Modified Voltage Potential (MVP) resolution method for conflicts k
+       (indices in asas.confpairs) between aircraft id1 and id2 (arrays with
+       one element per conflict). Returns the resolution velocity vectors
+       (one row per conflict) and the times to solve vertically"""
     
     
     # Preliminary calculations-------------------------------------------------
     
     # Get distance and qdr between id1 and id2
-    dist = asas.dist[id1,id2]
-    qdr  = asas.qdr[id1,id2]
+    dist = asas.dist[k]
+    qdr  = asas.qdr[k]
     
     # Convert qdr from degrees to radians
     qdr = np.radians(qdr)
@@ -200,7 +174,7 @@ def MVP(traf, asas, id1, id2):
     # Horizontal resolution----------------------------------------------------
     
     # Get the time to solve conflict horizontally -> tcpa
-    tcpa = asas.tcpa[id1,id2] 
+    tcpa = asas.tcpa[k] 
     
     # Find horizontal distance at the tcpa (min horizontal distance)
     dcpa  = drel + vrel*tcpa
@@ -211,44 +185,46 @@ def MVP(traf, asas, id1, id2):
     
     # Exception handlers for head-on conflicts
     # This is done to prevent division by zero in the next step
-    if dabsH <= 10.:
-        dabsH = 10.
-        dcpa[0] = 10.
-        dcpa[1] = 10.
+    headon = dabsH <= 10.
+    dabsH[headon]   = 10.
+    dcpa[0, headon] = 10.
+    dcpa[1, headon] = 10.
         
     # Compute the resolution velocity vector in horizontal direction
     # abs(tcpa) because it bcomes negative during intrusion
-    dv1 = (iH*dcpa[0])/(abs(tcpa)*dabsH)  
-    dv2 = (iH*dcpa[1])/(abs(tcpa)*dabsH)
+    dv1 = (iH*dcpa[0])/(np.abs(tcpa)*dabsH)  
+    dv2 = (iH*dcpa[1])/(np.abs(tcpa)*dabsH)
     
     # If intruder is outside the ownship PZ, then apply extra factor
     # to make sure that resolution does not graze IPZ
-    if asas.Rm<dist and dabsH<dist:
-        erratum=np.cos(np.arcsin(asas.Rm/dist)-np.arcsin(dabsH/dist))
-        dv1 = dv1/erratum
-        dv2 = dv2/erratum
+    outside = (asas.Rm<dist) & (dabsH<dist)
+    erratum = np.cos(np.arcsin(asas.Rm/dist[outside])-np.arcsin(dabsH[outside]/dist[outside]))
+    dv1[outside] = dv1[outside]/erratum
+    dv2[outside] = dv2[outside]/erratum
         
     
     # Vertical resolution------------------------------------------------------
     
     # Compute the  vertical intrusion
     # Amount of vertical intrusion dependent on vertical relative velocity
-    iV = asas.dhm if abs(vrel[2])>0.0 else asas.dhm-abs(drel[2])
+    vsrel = np.abs(vrel[2])>0.0
+    iV = np.where(vsrel, asas.dhm, asas.dhm-np.abs(drel[2]))
     
     # Get the time to solve the conflict vertically - tsolveV
-    tsolV = abs(drel[2]/vrel[2]) if abs(vrel[2])>0.0 else asas.tinconf[id1,id2]
+    tsolV = asas.tinconf[k].copy()
+    tsolV[vsrel] = np.abs(drel[2, vsrel]/vrel[2, vsrel])
     
     # If the time to solve the conflict vertically is longer than the look-ahead time,
     # because the the relative vertical speed is very small, then solve the intrusion
     # within tinconf
-    if tsolV>asas.dtlookahead:
-        tsolV = asas.tinconf[id1,id2]
-        iV    = asas.dhm
+    slow = tsolV>asas.dtlookahead
+    tsolV[slow] = asas.tinconf[k][slow]
+    iV[slow]    = asas.dhm
     
     # Compute the resolution velocity vector in the vertical direction
     # The direction of the vertical resolution is such that the aircraft with
     # higher climb/decent rate reduces their climb/decent rate    
-    dv3 = np.where(abs(vrel[2])>0.0,  (iV/tsolV)*(-vrel[2]/abs(vrel[2])), (iV/tsolV))
+    dv3 = np.where(vsrel, (iV/tsolV)*-np.sign(vrel[2]), (iV/tsolV))
     
     # It is necessary to cap dv3 to prevent that a vertical conflict 
     # is solved in 1 timestep, leading to a vertical separation that is too 
@@ -262,76 +238,84 @@ def MVP(traf, asas, id1, id2):
     # Combine resolutions------------------------------------------------------
 
     # combine the dv components 
-    dv = np.array([dv1,dv2,dv3])
+    dv = np.column_stack([dv1,dv2,dv3])
     
     return dv, tsolV
     
+
+def acmask(traf, acids):
+    """ Boolean mask of the aircraft in the list of call signs acids """
+    mask = np.zeros(traf.ntraf, dtype=bool)
+    idx  = traf.ids2idx(acids)
+    mask[idx[idx >= 0]] = True
+    return mask
+
 #============================= Priority Rules =================================    
     
-def prioRules(traf, priocode, dv_mvp, dv1, dv2, id1, id2):
-    ''' Apply the desired priority setting to the resolution '''
-    
+def prioRules(traf, priocode, dv_mvp, id1, id2):
+    ''' Apply the desired priority setting to the resolutions dv_mvp of the
+        conflicts between aircraft id1 and id2. Returns the resolutions of
+        id1 and id2, and dv_mvp with the vertical component that was used '''
+
+    # Which aircraft solves the conflict (both by default), and the factor
+    # for the vertical component of the resolution
+    solve1 = np.ones(len(id1), dtype=bool)
+    solve2 = np.ones(len(id1), dtype=bool)
+    vfac   = np.full(len(id1), 0.5)
+
+    # Aircraft 1 is cruising, and aircraft 2 is climbing/descending
+    cruise1 = (np.abs(traf.vs[id1])<0.1) & (np.abs(traf.vs[id2]) > 0.1)
+    # Aircraft 2 is cruising, and aircraft 1 is climbing/descending
+    cruise2 = ~cruise1 & (np.abs(traf.vs[id2])<0.1) & (np.abs(traf.vs[id1]) > 0.1)
+
     # Primary Free Flight prio rules (no priority)
     if priocode == "FF1": 
         # since cooperative, the vertical resolution component can be halved, and then dv_mvp can be added
-        dv_mvp[2] = dv_mvp[2]/2.0
-        dv1 = dv1 - dv_mvp
-        dv2 = dv2 + dv_mvp 
+        # both aircraft solve the conflict
+        pass
     
     # Secondary Free Flight (Cruising aircraft has priority, combined resolutions)    
-    if priocode == "FF2": 
+    elif priocode == "FF2": 
         # since cooperative, the vertical resolution component can be halved, and then dv_mvp can be added
-        dv_mvp[2] = dv_mvp[2]/2.0
         # If aircraft 1 is cruising, and aircraft 2 is climbing/descending -> aircraft 2 solves conflict
-        if abs(traf.vs[id1])<0.1 and abs(traf.vs[id2]) > 0.1:
-            dv2 = dv2 + dv_mvp
+        solve1[cruise1] = False
         # If aircraft 2 is cruising, and aircraft 1 is climbing -> aircraft 1 solves conflict
-        elif abs(traf.vs[id2])<0.1 and abs(traf.vs[id1]) > 0.1:
-            dv1 = dv1 - dv_mvp
-        else: # both are climbing/descending/cruising -> both aircraft solves the conflict
-            dv1 = dv1 - dv_mvp
-            dv2 = dv2 + dv_mvp
+        solve2[cruise2] = False
+        # else: both are climbing/descending/cruising -> both aircraft solves the conflict
     
     # Tertiary Free Flight (Climbing/descending aircraft have priority and crusing solves with horizontal resolutions)          
     elif priocode == "FF3": 
         # If aircraft 1 is cruising, and aircraft 2 is climbing/descending -> aircraft 1 solves conflict horizontally
-        if abs(traf.vs[id1])<0.1 and abs(traf.vs[id2]) > 0.1:
-            dv_mvp[2] = 0.0
-            dv1       = dv1 - dv_mvp
+        solve2[cruise1] = False
         # If aircraft 2 is cruising, and aircraft 1 is climbing -> aircraft 2 solves conflict horizontally
-        elif abs(traf.vs[id2])<0.1 and abs(traf.vs[id1]) > 0.1:
-            dv_mvp[2] = 0.0
-            dv2       = dv2 + dv_mvp
-        else: # both are climbing/descending/cruising -> both aircraft solves the conflict, combined
-            dv_mvp[2] = dv_mvp[2]/2.0
-            dv1       = dv1 - dv_mvp
-            dv2       = dv2 + dv_mvp
+        solve1[cruise2] = False
+        vfac[cruise1 | cruise2] = 0.0
+        # else: both are climbing/descending/cruising -> both aircraft solves the conflict, combined
             
     # Primary Layers (Cruising aircraft has priority and clmibing/descending solves. All conflicts solved horizontally)        
     elif priocode == "LAY1": 
-        dv_mvp[2] = 0.0
+        vfac[:] = 0.0
         # If aircraft 1 is cruising, and aircraft 2 is climbing/descending -> aircraft 2 solves conflict horizontally
-        if abs(traf.vs[id1])<0.1 and abs(traf.vs[id2]) > 0.1:
-            dv2 = dv2 + dv_mvp
+        solve1[cruise1] = False
         # If aircraft 2 is cruising, and aircraft 1 is climbing -> aircraft 1 solves conflict horizontally
-        elif abs(traf.vs[id2])<0.1 and abs(traf.vs[id1]) > 0.1:
-            dv1 = dv1 - dv_mvp
-        else: # both are climbing/descending/cruising -> both aircraft solves the conflict horizontally
-            dv1 = dv1 - dv_mvp
-            dv2 = dv2 + dv_mvp
+        solve2[cruise2] = False
+        # else: both are climbing/descending/cruising -> both aircraft solves the conflict horizontally
     
     # Secondary Layers (Climbing/descending aircraft has priority and cruising solves. All conflicts solved horizontally)
     elif priocode ==  "LAY2": 
-        dv_mvp[2] = 0.0
+        vfac[:] = 0.0
         # If aircraft 1 is cruising, and aircraft 2 is climbing/descending -> aircraft 1 solves conflict horizontally
-        if abs(traf.vs[id1])<0.1 and abs(traf.vs[id2]) > 0.1:
-            dv1 = dv1 - dv_mvp
+        solve2[cruise1] = False
         # If aircraft 2 is cruising, and aircraft 1 is climbing -> aircraft 2 solves conflict horizontally
-        elif abs(traf.vs[id2])<0.1 and abs(traf.vs[id1]) > 0.1:
-            dv2 = dv2 + dv_mvp
-        else: # both are climbing/descending/cruising -> both aircraft solves the conflic horizontally
-            dv1 = dv1 - dv_mvp
-            dv2 = dv2 + dv_mvp
-    
-    return dv1, dv2
-    
\ No newline at end of file
+        solve1[cruise2] = False
+        # else: both are climbing/descending/cruising -> both aircraft solves the conflic horizontally
+
+    # Unknown priority code: no resolutions
+    else:
+        return np.zeros_like(dv_mvp), np.zeros_like(dv_mvp), dv_mvp
+
+    dv_mvp = dv_mvp.copy()
+    dv_mvp[:, 2] = np.where(vfac > 0.0, dv_mvp[:, 2]*vfac, 0.0)
+    dv1 = np.where(solve1.reshape(-1, 1), -dv_mvp, 0.0)
+    dv2 = np.where(solve2.reshape(-1, 1), dv_mvp, 0.0)
+    return dv1, dv2, dv_mvp
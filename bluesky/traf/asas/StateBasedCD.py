@@ -3,10 +3,28 @@ State-based conflict detection
 
 
 """
+from itertools import product
 import numpy as np
+from bluesky import settings
 from bluesky.tools import geo
 from bluesky.tools.aero import nm
 
+# Register settings defaults
+settings.set_variable_defaults(prefer_compiled=False, asas_broadphase=True,
+                               asas_tile_size=512, asas_cdcache=True)
+
+# The compiled version of the pairwise detection (see src_cpp/casas.cpp),
+# which is used instead of detectpairs() when available
+casas = None
+if settings.prefer_compiled:
+    try:
+        from . import casas
+        print('StateBasedCD: using compiled version.')
+    except ImportError:
+        print('StateBasedCD: using default Python version, no compiled version for this platform.')
+if casas is None:
+    print('StateBasedCD: using Python version.')
+
 
 def detect(asas, traf, simt):
     if not asas.swasas:
@@ -16,63 +34,227 @@ def detect(asas, traf, simt):
     asas.iconf        = [[] for ac in range(traf.ntraf)]
     asas.nconf        = 0
     asas.confpairs    = []
-    asas.latowncpa    = []
-    asas.lonowncpa    = []
-    asas.altowncpa    = []
 
-    asas.LOSlist_now  = []
-    asas.conflist_now = []
+    asas.LOSlist_now  = dict()
+    asas.conflist_now = dict()
 
-    # Horizontal conflict ---------------------------------------------------------
+    # Velocities, from own and from ADS-B data
+    trkrad   = np.radians(traf.trk)
+    asas.u = traf.gs * np.sin(trkrad).reshape((1, len(trkrad)))  # m/s
+    asas.v = traf.gs * np.cos(trkrad).reshape((1, len(trkrad)))  # m/s
 
-    # qdlst is for [i,j] qdr from i to j, from perception of ADSB and own coordinates
-    qdlst = geo.qdrdist_matrix(np.mat(traf.lat), np.mat(traf.lon),
-                               np.mat(traf.adsb.lat), np.mat(traf.adsb.lon))
+    # Indices and CD results of the conflicting pairs of ownship iown and
+    # intruder ioth, in row-major pair order
+    results = detectpairs(asas, traf) if casas is None else casas.detect(asas, traf)
+    iown, ioth, asas.qdr, asas.dist, asas.dx, asas.dy, asas.dalt, asas.tcpa, \
+        asas.tinconf, asas.toutconf = results
+
+    # ----------------------------------------------------------------------
+    # Update conflict lists
+    # ----------------------------------------------------------------------
+    # Store result
+    asas.nconf        = len(iown)
+    asas.confpairs    = [(traf.id[i], traf.id[j]) for i, j in zip(iown.tolist(), ioth.tolist())]
+    for idx, i in enumerate(iown.tolist()):
+        asas.iconf[i].append(idx)
 
-    # Convert results from mat-> array
-    asas.qdr  = np.array(qdlst[0])  # degrees
-    I           = np.eye(traf.ntraf)  # Identity matric of order ntraf
-    asas.dist = np.array(qdlst[1]) * nm + 1e9 * I  # meters i to j
+    # Calculate CPA positions of the ownships
+    rng = asas.tcpa * traf.gs[iown] / nm
+    asas.latowncpa, asas.lonowncpa = geo.qdrpos(traf.lat[iown], traf.lon[iown],
+                                                traf.trk[iown], rng)
+    asas.altowncpa = traf.alt[iown] + asas.tcpa * traf.vs[iown]
+
+    # Check for loss of separation
+    dx = (traf.lat[iown] - traf.lat[ioth]) * 111319.
+    dy = (traf.lon[iown] - traf.lon[ioth]) * 111319.
+
+    hdist2 = dx**2 + dy**2
+    hLOS   = hdist2 < asas.R**2
+    vdist  = np.abs(traf.alt[iown] - traf.alt[ioth])
+    vLOS   = vdist < asas.dh
+    LOS    = (hLOS & vLOS)
+
+    # Add to Conflict and LOSlist, to count total conflicts and LOS
+
+    # NB: if only one A/C detects a conflict, it is also added to these lists
+    experimenttime = simt > 2100 and simt < 5700  # These parameters may be
+    # changed to count only conflicts within a given expirement time window
+
+    keys = [pairkey(*pair) for pair in asas.confpairs]
+    for key, pair in zip(keys, asas.confpairs):
+        asas.conflist_all.setdefault(key, pair)
+        asas.conflist_now.setdefault(key, pair)
+        if experimenttime:
+            asas.conflist_exp.setdefault(key, pair)
+
+    # Intrusions of the LOS. Both aircraft of a pair measure the same
+    # intrusion.
+    ilos = np.flatnonzero(LOS)
+    Ih = 1.0 - np.sqrt(hdist2[ilos]) / asas.R
+    Iv = 1.0 - vdist[ilos] / asas.dh
+    severity = np.minimum(Ih, Iv)
+
+    for idx, sev, ih, iv in zip(ilos.tolist(), severity.tolist(), Ih.tolist(), Iv.tolist()):
+        key, pair = keys[idx], asas.confpairs[idx]
+        isev = asas.LOSlist_all.get(key)
+        if isev is None:
+            isev = asas.LOSlist_all[key] = len(asas.LOSmaxsev)
+            asas.LOSmaxsev.append(0.)
+            asas.LOShmaxsev.append(0.)
+            asas.LOSvmaxsev.append(0.)
+        asas.LOSlist_now.setdefault(key, pair)
+        if experimenttime:
+            asas.LOSlist_exp.setdefault(key, pair)
+
+        # Now, we measure intrusion and store it if it is the most severe
+        if sev > asas.LOSmaxsev[isev]:
+            asas.LOSmaxsev[isev]  = sev
+            asas.LOShmaxsev[isev] = ih
+            asas.LOSvmaxsev[isev] = iv
+
+    # Calculate whether ASAS or A/P commands should be followed
+    ResumeNav(asas, traf)
+
+
+def detectpairs(asas, traf):
+    """ Return the indices of ownship i and intruder j and the CD results
+        (qdr, dist, dx, dy, dalt, tcpa, tinconf, toutconf) of all pairs
+        that are in conflict, in row-major pair order. """
+    # parameters received through ADSB
+    adsbtrkrad = np.radians(traf.adsb.trk)
+    adsbu = traf.adsb.gs * np.sin(adsbtrkrad)  # m/s
+    adsbv = traf.adsb.gs * np.cos(adsbtrkrad)  # m/s
+
+    adsbalt = traf.adsb.alt
+    if traf.adsb.transnoise:
+        # error in the determined altitude of other a/c
+        alterror = np.random.normal(0, traf.adsb.transerror[2], traf.alt.shape)  # degrees
+        adsbalt = adsbalt + alterror
+
+    # Without ADS-B noise and truncation, pairs (i, j) and (j, i) share
+    # their distance and vertical geometry, and both are checked at once
+    symmetric = not traf.adsb.transnoise and not traf.adsb.truncated
+
+    # The cache of pair distances needs the same symmetry
+    cache = asas.cdcache if symmetric and settings.asas_cdcache else None
+
+    # Flat-earth geometry, when selected and accurate enough
+    flat = flatearth(asas, traf)
+
+    # Check the candidate pairs of ownship i and intruder j tile by tile,
+    # and only keep the results of the conflicting pairs
+    tiles = [narrowphase(asas, traf, i, j, adsbu, adsbv, adsbalt, symmetric, cache, flat)
+             for i, j in candidates(asas, traf, symmetric, cache)]
+    if cache is not None:
+        cache.commit()
+    if tiles:
+        results = [np.concatenate(arrs) for arrs in zip(*tiles)]
+        if symmetric:
+            # Sort the conflicts of both directions in row-major pair order
+            order   = np.argsort(results[0] * traf.ntraf + results[1])
+            results = [arr[order] for arr in results]
+        return results
+
+    return [np.array([], dtype=int)] * 2 + [np.array([])] * 8
+
+
+def pairkey(ac1, ac2):
+    """ Key of a pair of aircraft in the conflict and LOS registry of ASAS,
+        which is the same for both orders of the call signs. """
+    return (ac1, ac2) if ac1 < ac2 else (ac2, ac1)
+
+
+def narrowphase(asas, traf, i, j, adsbu, adsbv, adsbalt, symmetric=False, cache=None, flat=None):
+    """ Calculate the CPA of the pairs of ownship i and intruder j (arrays
+        with one element per pair), and return the indices i, j and the CD
+        results (qdr, dist, dx, dy, dalt, tcpa, tinconf, toutconf) of the
+        pairs that are in conflict. When symmetric is True, the reversed
+        pairs (j, i) are checked as well, which requires that the ADS-B
+        data is equal to the own data of all aircraft. The distances of
+        all pairs are stored in cache, when given. With flat (see
+        flatearth), the relative positions are calculated with a flat-earth
+        approximation instead of the WGS'84 bearing and distance. """
+    diag = (i == j) * 1.0  # Pairs of an aircraft with itself
+
+    # Horizontal conflict ---------------------------------------------------------
+
+    # qdr is for [i,j] qdr from i to j, from perception of ADSB and own coordinates
+    qdr = qdrrev = None
+    if flat is not None:
+        if symmetric:
+            dx, dy, dxrev, dyrev, dist = flatpairs(i, j, *flat, reverse=True)
+        else:
+            dx, dy, dist = flatpairs(i, j, *flat)  # is pos j rel to i
+        dist = dist + 1e9 * diag  # meters i to j
+    else:
+        if symmetric:
+            qdr, qdrrev, dist = geo.qdrdist_pairs(traf.lat[i], traf.lon[i],
+                                                  traf.adsb.lat[j], traf.adsb.lon[j],
+                                                  reverse=True)
+        else:
+            qdr, dist = geo.qdrdist_pairs(traf.lat[i], traf.lon[i],
+                                          traf.adsb.lat[j], traf.adsb.lon[j])
+        dist = dist * nm + 1e9 * diag  # meters i to j
 
     # Transmission noise
     if traf.adsb.transnoise:
+        if qdr is None:
+            qdr = np.degrees(np.arctan2(dx, dy))
         # error in the determined bearing between two a/c
-        bearingerror = np.random.normal(0, traf.adsb.transerror[0], asas.qdr.shape)  # degrees
-        asas.qdr += bearingerror
+        bearingerror = np.random.normal(0, traf.adsb.transerror[0], qdr.shape)  # degrees
+        qdr += bearingerror
         # error in the perceived distance between two a/c
-        disterror = np.random.normal(0, traf.adsb.transerror[1], asas.dist.shape)  # meters
-        asas.dist += disterror
+        disterror = np.random.normal(0, traf.adsb.transerror[1], dist.shape)  # meters
+        dist += disterror
 
-    # Calculate horizontal closest point of approach (CPA)
-    qdrrad    = np.radians(asas.qdr)
-    asas.dx = asas.dist * np.sin(qdrrad)  # is pos j rel to i
-    asas.dy = asas.dist * np.cos(qdrrad)  # is pos j rel to i
+    if qdr is not None:
+        qdrrad = np.radians(qdr)
+        dx     = dist * np.sin(qdrrad)  # is pos j rel to i
+        dy     = dist * np.cos(qdrrad)  # is pos j rel to i
 
-    trkrad   = np.radians(traf.trk)
-    asas.u = traf.gs * np.sin(trkrad).reshape((1, len(trkrad)))  # m/s
-    asas.v = traf.gs * np.cos(trkrad).reshape((1, len(trkrad)))  # m/s
+    du = asas.u[0, j] - adsbu[i]  # Speed du[i,j] is perceived eastern speed of i to j
+    dv = asas.v[0, j] - adsbv[i]  # Speed dv[i,j] is perceived northern speed of i to j
 
-    # parameters received through ADSB
-    adsbtrkrad = np.radians(traf.adsb.trk)
-    adsbu = traf.adsb.gs * np.sin(adsbtrkrad).reshape((1, len(adsbtrkrad)))  # m/s
-    adsbv = traf.adsb.gs * np.cos(adsbtrkrad).reshape((1, len(adsbtrkrad)))  # m/s
+    # Vertical crossing of disk (-dh,+dh)
+    dalt = traf.alt[j] - adsbalt[i]
+
+    dvs = traf.vs[j] - traf.adsb.vs[i]
+
+    if cache is not None:
+        cache.store(dist, dalt)
 
-    du = asas.u - adsbu.T  # Speed du[i,j] is perceived eastern speed of i to j
-    dv = asas.v - adsbv.T  # Speed dv[i,j] is perceived northern speed of i to j
+    results = conflicts(asas, i, j, diag, qdr, dist, dx, dy, du, dv, dalt, dvs)
+    if symmetric:
+        # The bearings of i to j and j to i are not exactly opposite on the
+        # sphere, so the CPA of the reversed pairs is calculated separately
+        if qdrrev is not None:
+            qdrrad = np.radians(qdrrev)
+            dxrev, dyrev = dist * np.sin(qdrrad), dist * np.cos(qdrrad)
+        reverse = conflicts(asas, j, i, diag, qdrrev, dist, dxrev, dyrev, -du, -dv, -dalt, -dvs)
+        results = [np.concatenate(arrs) for arrs in zip(results, reverse)]
 
+    return results
+
+
+def conflicts(asas, i, j, diag, qdr, dist, dx, dy, du, dv, dalt, dvs):
+    """ Calculate the CPA of pairs (i, j) from their relative position and
+        velocity, and return the indices and CD results of the pairs that
+        are in conflict (see narrowphase). Without qdr, the bearing is only
+        calculated for the conflicting pairs. """
+    # Calculate horizontal closest point of approach (CPA)
     dv2 = du * du + dv * dv
     dv2 = np.where(np.abs(dv2) < 1e-6, 1e-6, dv2)  # limit lower absolute value
 
     vrel = np.sqrt(dv2)
 
-    asas.tcpa = -(du * asas.dx + dv * asas.dy) / dv2 + 1e9 * I
+    tcpa = -(du * dx + dv * dy) / dv2 + 1e9 * diag
 
     # Calculate CPA positions
-    # xcpa = asas.tcpa * du
-    # ycpa = asas.tcpa * dv
+    # xcpa = tcpa * du
+    # ycpa = tcpa * dv
 
     # Calculate distance^2 at CPA (minimum distance^2)
-    dcpa2 = asas.dist * asas.dist - asas.tcpa * asas.tcpa * dv2
+    dcpa2 = dist * dist - tcpa * tcpa * dv2
 
     # Check for horizontal conflict
     R2 = asas.R * asas.R
@@ -82,143 +264,263 @@ def detect(asas, traf, simt):
     dxinhor = np.sqrt(np.maximum(0., R2 - dcpa2))  # half the distance travelled inzide zone
     dtinhor = dxinhor / vrel
 
-    tinhor = np.where(swhorconf, asas.tcpa - dtinhor, 1e8)  # Set very large if no conf
+    tinhor = np.where(swhorconf, tcpa - dtinhor, 1e8)  # Set very large if no conf
 
-    touthor = np.where(swhorconf, asas.tcpa + dtinhor, -1e8)  # set very large if no conf
+    touthor = np.where(swhorconf, tcpa + dtinhor, -1e8)  # set very large if no conf
     # swhorconf = swhorconf*(touthor>0)*(tinhor<asas.dtlook)
 
     # Vertical conflict -----------------------------------------------------------
 
-    # Vertical crossing of disk (-dh,+dh)
-    alt = traf.alt.reshape((1, traf.ntraf))
-    adsbalt = traf.adsb.alt.reshape((1, traf.ntraf))
-    if traf.adsb.transnoise:
-        # error in the determined altitude of other a/c
-        alterror = np.random.normal(0, traf.adsb.transerror[2], traf.alt.shape)  # degrees
-        adsbalt += alterror
-
-    asas.dalt = alt - adsbalt.T
-
-
-    vs = traf.vs.reshape(1, len(traf.vs))
-
-
-    avs = traf.adsb.vs.reshape(1, len(traf.adsb.vs))
-
-    dvs = vs - avs.T
-
     # Check for passing through each others zone
     dvs = np.where(np.abs(dvs) < 1e-6, 1e-6, dvs)  # prevent division by zero
-    tcrosshi = (asas.dalt + asas.dh) / -dvs
-    tcrosslo = (asas.dalt - asas.dh) / -dvs
+    tcrosshi = (dalt + asas.dh) / -dvs
+    tcrosslo = (dalt - asas.dh) / -dvs
 
     tinver = np.minimum(tcrosshi, tcrosslo)
     toutver = np.maximum(tcrosshi, tcrosslo)
 
     # Combine vertical and horizontal conflict-------------------------------------
-    asas.tinconf = np.maximum(tinver, tinhor)
-
-    asas.toutconf = np.minimum(toutver, touthor)
-
-    swconfl = swhorconf * (asas.tinconf <= asas.toutconf) * \
-        (asas.toutconf > 0.) * (asas.tinconf < asas.dtlookahead) \
-        * (1. - I)
-
-    # ----------------------------------------------------------------------
-    # Update conflict lists
-    # ----------------------------------------------------------------------
-    if len(swconfl) == 0:
-        return
-    # Calculate CPA positions of traffic in lat/lon?
-
-    # Select conflicting pairs: each a/c gets their own record
-    confidxs            = np.where(swconfl)
-    iown                = confidxs[0]
-    ioth                = confidxs[1]
-
-    # Store result
-    asas.nconf        = len(confidxs[0])
-
-    for idx in range(asas.nconf):
-        i = iown[idx]
-        j = ioth[idx]
-        if i == j:
-            continue
-
-        asas.iconf[i].append(idx)
-        asas.confpairs.append((traf.id[i], traf.id[j]))
-
-        rng        = asas.tcpa[i, j] * traf.gs[i] / nm
-        lato, lono = geo.qdrpos(traf.lat[i], traf.lon[i], traf.trk[i], rng)
-        alto       = traf.alt[i] + asas.tcpa[i, j] * traf.vs[i]
-
-        asas.latowncpa.append(lato)
-        asas.lonowncpa.append(lono)
-        asas.altowncpa.append(alto)
-
-        dx = (traf.lat[i] - traf.lat[j]) * 111319.
-        dy = (traf.lon[i] - traf.lon[j]) * 111319.
-
-        hdist2 = dx**2 + dy**2
-        hLOS   = hdist2 < asas.R**2
-        vdist  = abs(traf.alt[i] - traf.alt[j])
-        vLOS   = vdist < asas.dh
-        LOS    = (hLOS & vLOS)
-
-        # Add to Conflict and LOSlist, to count total conflicts and LOS
-
-        # NB: if only one A/C detects a conflict, it is also added to these lists
-        combi = str(traf.id[i]) + " " + str(traf.id[j])
-        combi2 = str(traf.id[j]) + " " + str(traf.id[i])
-
-        experimenttime = simt > 2100 and simt < 5700  # These parameters may be
-        # changed to count only conflicts within a given expirement time window
-
-        if combi not in asas.conflist_all and combi2 not in asas.conflist_all:
-            asas.conflist_all.append(combi)
-
-        if combi not in asas.conflist_exp and combi2 not in asas.conflist_exp and experimenttime:
-            asas.conflist_exp.append(combi)
-
-        if combi not in asas.conflist_now and combi2 not in asas.conflist_now:
-            asas.conflist_now.append(combi)
-
-        if LOS:
-            if combi not in asas.LOSlist_all and combi2 not in asas.LOSlist_all:
-                asas.LOSlist_all.append(combi)
-                asas.LOSmaxsev.append(0.)
-                asas.LOShmaxsev.append(0.)
-                asas.LOSvmaxsev.append(0.)
-
-            if combi not in asas.LOSlist_exp and combi2 not in asas.LOSlist_exp and experimenttime:
-                asas.LOSlist_exp.append(combi)
-
-            if combi not in asas.LOSlist_now and combi2 not in asas.LOSlist_now:
-                asas.LOSlist_now.append(combi)
-
-            # Now, we measure intrusion and store it if it is the most severe
-            Ih = 1.0 - np.sqrt(hdist2) / asas.R
-            Iv = 1.0 - vdist / asas.dh
-            severity = min(Ih, Iv)
-
-            try:  # Only continue if combi is found in LOSlist (and not combi2)
-                idx = asas.LOSlist_all.index(combi)
-            except:
-                idx = -1
-
-            if idx >= 0:
-                if severity > asas.LOSmaxsev[idx]:
-                    asas.LOSmaxsev[idx]  = severity
-                    asas.LOShmaxsev[idx] = Ih
-                    asas.LOSvmaxsev[idx] = Iv
-
-    # Convert to numpy arrays for vectorisation
-    asas.latowncpa = np.array(asas.latowncpa)
-    asas.lonowncpa = np.array(asas.lonowncpa)
-    asas.altowncpa = np.array(asas.altowncpa)
-
-    # Calculate whether ASAS or A/P commands should be followed
-    ResumeNav(asas, traf)
+    tinconf = np.maximum(tinver, tinhor)
+
+    toutconf = np.minimum(toutver, touthor)
+
+    swconfl = swhorconf * (tinconf <= toutconf) * \
+        (toutconf > 0.) * (tinconf < asas.dtlookahead) \
+        * (1. - diag)
+
+    # Return the results of the conflicting pairs
+    confidxs = np.flatnonzero(swconfl)
+    if qdr is None:
+        qdr = np.degrees(np.arctan2(dx[confidxs], dy[confidxs]))
+    else:
+        qdr = qdr[confidxs]
+    return [i[confidxs], j[confidxs], qdr] + \
+        [arr[confidxs] for arr in (dist, dx, dy, dalt, tcpa, tinconf, toutconf)]
+
+
+def flatearth(asas, traf):
+    """ Return the data of the flat-earth approximation of the relative
+        positions in narrowphase: the latitude, longitude, cosine and sine
+        of the latitude, and earth radius of the own and ADS-B positions of
+        all aircraft. Returns None with the WGS84 geometry, and when the traffic
+        covers an area larger than asas_flatextent, for which the
+        approximation isn't accurate enough. """
+    if asas.geometry != "FLAT" or traf.ntraf == 0:
+        return None
+
+    # Diagonal of the area of the traffic, which is large when it crosses
+    # the date line
+    lat = np.concatenate((traf.lat, traf.adsb.lat))
+    lon = np.concatenate((traf.lon, traf.adsb.lon))
+    if geo.kwikdist(lat.min(), lon.min(), lat.max(), lon.max()) > settings.asas_flatextent:
+        return None
+
+    return [data for lat, lon in ((traf.lat, traf.lon), (traf.adsb.lat, traf.adsb.lon))
+            for data in (lat, lon, np.cos(np.radians(lat)), np.sin(np.radians(lat)),
+                         geo.rwgs84(2. * lat))]
+
+
+def flatpairs(i, j, lat1, lon1, coslat1, sinlat1, r1, lat2, lon2, coslat2, sinlat2, r2,
+              reverse=False):
+    """ Flat-earth approximation of the position of 2 relative to 1 for
+        pairs (i, j): the east and north distance [m], and the distance [m].
+        The longitude difference is scaled with the mean cosine of the
+        latitudes, which gives the direction halfway the great circle. This
+        direction is rotated with the approximate convergence of the
+        meridians to the initial direction, as in geo.qdrdist_pairs. The
+        earth radius of each aircraft is the WGS'84 radius at twice its
+        latitude, in line with geo.qdrdist_pairs, which uses the radius at
+        the sum of the latitudes. With reverse=True, the position of 1
+        relative to 2 is returned as well. """
+    r    = 0.5 * (r1[i] + r2[j])
+    dlon = np.radians(lon2[j] - lon1[i])
+    dx   = r * dlon * 0.5 * (coslat1[i] + coslat2[j])
+    dy   = r * np.radians(lat2[j] - lat1[i])
+    dist = np.sqrt(dx * dx + dy * dy)
+
+    # Half the change of direction along the great circle (small angle)
+    sindelta = 0.25 * dlon * (sinlat1[i] + sinlat2[j])
+    cosdelta = 1. - 0.5 * sindelta * sindelta
+    dx1 = dx * cosdelta - dy * sindelta
+    dy1 = dy * cosdelta + dx * sindelta
+    if reverse:
+        return dx1, dy1, -dx * cosdelta - dy * sindelta, dx * sindelta - dy * cosdelta, dist
+    return dx1, dy1, dist
+
+
+def candidates(asas, traf, symmetric=False, cache=None):
+    """ Broad phase of the conflict detection: generate the indices (i, j)
+        of the ownship-intruder pairs that have to be checked, in tiles of
+        at most asas_tile_size x asas_tile_size pairs, in the order of a
+        row-major N x N matrix. Without broad phase, and with ADS-B
+        transmission noise (which is drawn for all pairs), these are all
+        pairs, including those of an aircraft with itself. Otherwise, pairs
+        that stay vertically separated are always skipped. When symmetric
+        is True, only pairs with i < j are generated. With a cache, the
+        pairs that are known to be out of reach are skipped. """
+    ntraf = traf.ntraf
+    npairs = max(1, settings.asas_tile_size) ** 2
+
+    pairs = None
+    broadphase = settings.asas_broadphase and not traf.adsb.transnoise
+    if broadphase and ntraf > 1:
+        pairs = gridpairs(asas, traf, symmetric)
+        if pairs is None:
+            pairs = altpairs(asas, traf, symmetric)
+
+    if pairs is not None:
+        i, j = pairs
+        if cache is not None:
+            i, j = cache.filter(traf, i, j, *reach(asas, traf))
+        for k in range(0, len(i), npairs):
+            yield i[k:k + npairs], j[k:k + npairs]
+    else:
+        # All intruders for a block of ownships
+        nown = max(1, npairs // max(1, ntraf))
+        for i0 in range(0, ntraf, nown):
+            k = np.arange(i0 * ntraf, min(i0 + nown, ntraf) * ntraf)
+            i, j = np.divmod(k, ntraf)
+            if broadphase:
+                keep = (i < j if symmetric else i != j) & vertical(asas, traf, i, j)
+                yield i[keep], j[keep]
+            elif symmetric:
+                yield i[i < j], j[i < j]
+            else:
+                yield i, j
+
+
+def reach(asas, traf):
+    """ Return the largest horizontal and vertical distance [m] at which a
+        pair can get into conflict within the lookahead time, with a margin
+        for round-off """
+    vrel   = np.max(np.abs(traf.gs)) + np.max(np.abs(traf.adsb.gs)) + 1.0
+    vsrel  = np.max(np.abs(traf.vs)) + np.max(np.abs(traf.adsb.vs)) + 1.0
+    hreach = 1.01 * (asas.R + vrel * asas.dtlookahead)
+    vreach = 1.01 * (asas.dh + vsrel * asas.dtlookahead)
+    return hreach, vreach
+
+
+def gridpairs(asas, traf, symmetric=False):
+    """ Return the candidate pairs of a lat/lon/altitude grid. The cell size
+        is the largest distance at which two aircraft can get into conflict
+        within the lookahead time, so only aircraft in the same or in
+        neighbouring cells can be in conflict. Returns None when the grid
+        can't be used: close to the poles or the date line, or when the
+        cells would cover most of the globe. Of the aircraft in neighbouring
+        cells, only the pairs that can get within dh vertically are kept
+        (see vertical). When symmetric is True, only pairs with i < j are
+        returned. """
+    # In detect, the horizontal geometry of pair (i, j) uses the own position
+    # of i and the ADS-B position of j, and the vertical geometry the ADS-B
+    # altitude of i and the own altitude of j
+    lat1, lon1, alt1 = traf.lat, traf.lon, traf.adsb.alt
+    lat2, lon2, alt2 = traf.adsb.lat, traf.adsb.lon, traf.alt
+
+    hreach, vreach = reach(asas, traf)
+    pairs = neighbours(lat1, lon1, alt1, lat2, lon2, alt2, hreach, vreach)
+    if pairs is None:
+        return None
+
+    # Skip aircraft pairs with themselves, and pairs that stay vertically
+    # separated, and sort the pairs in row-major order
+    ntraf = traf.ntraf
+    i, j  = np.divmod(pairs, ntraf)
+    keep  = (i < j if symmetric else i != j) & vertical(asas, traf, i, j)
+    return np.divmod(np.sort(pairs[keep]), ntraf)
+
+
+def neighbours(lat1, lon1, alt1, lat2, lon2, alt2, hreach, vreach):
+    """ Radius query with a lat/lon/altitude grid: return the pairs (i, j)
+        of positions 1 and 2 that are in the same or in neighbouring cells,
+        which includes all pairs within a distance hreach (as calculated by
+        geo.qdrdist_pairs) and an altitude difference vreach [m]. The pairs
+        are returned as i * len(lat2) + j, in no particular order. Returns
+        None when the grid can't be used: close to the poles or the date
+        line, or when the cells would cover most of the globe. """
+    # Corresponding latitude and longitude differences [deg]. The distance
+    # in qdrdist_pairs is at least the WGS'84 minor semi-axis times the
+    # latitude difference in radians.
+    b       = 6356752.314245
+    dlat    = np.degrees(hreach / b)
+    latmax  = max(np.max(np.abs(lat1)), np.max(np.abs(lat2)))
+    if latmax >= 89.:
+        return None
+    sindlon = np.sin(0.5 * hreach / b) / np.cos(np.radians(latmax))
+    if sindlon >= 0.5:
+        return None
+    dlon = np.degrees(2. * np.arcsin(sindlon))
+    if min(np.min(lon1), np.min(lon2)) - dlon <= -180. or \
+            max(np.max(lon1), np.max(lon2)) + dlon >= 180.:
+        return None
+
+    # Cells of positions 1 and 2, numbered from zero with room for the
+    # neighbouring cells
+    cell1 = np.floor([lat1 / dlat, lon1 / dlon, alt1 / vreach]).astype(np.int64)
+    cell2 = np.floor([lat2 / dlat, lon2 / dlon, alt2 / vreach]).astype(np.int64)
+    cmin  = np.minimum(cell1.min(axis=1), cell2.min(axis=1)) - 1
+    cell1 -= cmin.reshape(3, 1)
+    cell2 -= cmin.reshape(3, 1)
+    ncell = np.maximum(cell1.max(axis=1), cell2.max(axis=1)) + 2
+
+    # Positions 2 sorted by cell number
+    key2  = (cell2[0] * ncell[1] + cell2[1]) * ncell[2] + cell2[2]
+    order = np.argsort(key2, kind="mergesort")
+    key2  = key2[order]
+
+    # Look up positions 2 in the 27 (neighbouring) cells of each position 1
+    n1, n2 = len(lat1), len(lat2)
+    pairs  = []
+    for di, dj, dk in product((-1, 0, 1), repeat=3):
+        key1  = ((cell1[0] + di) * ncell[1] + cell1[1] + dj) * ncell[2] + cell1[2] + dk
+        first = np.searchsorted(key2, key1, side="left")
+        count = np.searchsorted(key2, key1, side="right") - first
+        n     = np.sum(count)
+        if n > 0:
+            i = np.repeat(np.arange(n1), count)
+            k = np.repeat(first - (np.cumsum(count) - count), count) + np.arange(n)
+            pairs.append(i * n2 + order[k])
+
+    return np.concatenate(pairs) if pairs else np.array([], dtype=np.int64)
+
+
+def altpairs(asas, traf, symmetric=False):
+    """ Return the candidate pairs of a sweep over the aircraft sorted by
+        altitude, for when the grid can't be used. The intruders of each
+        ownship are the aircraft within the altitude range that it can reach
+        together with the fastest climbing or descending intruder, of which
+        only the pairs that can get within dh are kept (see vertical).
+        Returns None when this leaves most pairs, which are then checked in
+        tiles instead. When symmetric is True, only pairs with i < j are
+        returned. """
+    ntraf = traf.ntraf
+    alt1  = traf.adsb.alt
+    alt2  = traf.alt
+
+    # Altitude range of the intruders of each ownship
+    vreach = 1.01 * (asas.dh + (np.abs(traf.adsb.vs) + np.max(np.abs(traf.vs))) *
+                     asas.dtlookahead) + 1.0
+    order = np.argsort(alt2, kind="mergesort")
+    first = np.searchsorted(alt2[order], alt1 - vreach, side="left")
+    count = np.searchsorted(alt2[order], alt1 + vreach, side="right") - first
+    n     = np.sum(count)
+    if n > ntraf * ntraf // 2:
+        return None
+
+    i = np.repeat(np.arange(ntraf), count)
+    j = order[np.repeat(first - (np.cumsum(count) - count), count) + np.arange(n)]
+    keep  = (i < j if symmetric else i != j) & vertical(asas, traf, i, j)
+    pairs = np.sort(i[keep] * ntraf + j[keep])
+    return np.divmod(pairs, ntraf)
+
+
+def vertical(asas, traf, i, j):
+    """ Return for each pair (i, j) whether it can get within dh vertically
+        within the lookahead time, given the vertical speeds of both aircraft,
+        with a margin for round-off. Level pairs more than dh apart can never
+        be in conflict. """
+    dalt  = np.abs(traf.alt[j] - traf.adsb.alt[i])
+    vsrel = np.abs(traf.vs[j]) + np.abs(traf.adsb.vs[i])
+    return dalt < 1.01 * (asas.dh + vsrel * asas.dtlookahead) + 1.0
 
 
 def ResumeNav(asas, traf):
@@ -226,81 +528,67 @@ def ResumeNav(asas, traf):
         should be followed or not, based on if the aircraft pairs passed
         their CPA. """
     asas.active.fill(False)
+    if not asas.conflist_all:
+        return
 
     # Look at all conflicts, also the ones that are solved but CPA is yet to come
-    for conflict in asas.conflist_all:
-        ac1, ac2 = conflict.split(" ")
-        id1, id2 = traf.id2idx(ac1), traf.id2idx(ac2)
-        if id1 >= 0 and id2 >= 0:
-            # Check if conflict is past CPA
-            d = np.array([traf.lon[id2] - traf.lon[id1], traf.lat[id2] - traf.lat[id1]])
-
-            # write velocities as vectors
-            v1 = np.array([traf.gseast[id1], traf.gsnorth[id1]])
-            v2 = np.array([traf.gseast[id2], traf.gsnorth[id2]])
-
-            # Compute pastCPA
-            pastCPA = np.dot(d,v2-v1)>0.
-
-            # hLOS:
-            # Aircraft should continue to resolve until there is no horizontal
-            # LOS. This is particularly relevant when vertical resolutions
-            # are used.
-            dx = (traf.lat[id1] - traf.lat[id2]) * 111319.
-            dy = (traf.lon[id1] - traf.lon[id2]) * 111319.
-            hdist2 = dx**2 + dy**2
-            hLOS   = hdist2 < asas.R**2
-
-            # Bouncing conflicts:
-            # If two aircraft are getting in and out of conflict continously,
-            # then they it is a bouncing conflict. ASAS should stay active until
-            # the bouncing stops.
-            bouncingConflict = (abs(traf.trk[id1] - traf.trk[id2]) < 30.) & (hdist2<asas.Rm**2)
-
-            # Decide if conflict is over or not.
-            # If not over, turn active to true.
-            # If over, then initiate recovery
-            if not pastCPA or hLOS or bouncingConflict:
-                # Aircraft haven't passed their CPA: must follow their ASAS
-                asas.active[id1] = True
-                asas.active[id2] = True
-
-            else:
-                # Waypoint recovery after conflict
-                # Find the next active waypoint and send the aircraft to that
-                # waypoint.
-                iwpid1 = traf.ap.route[id1].findact(id1)
-                if iwpid1 != -1: # To avoid problems if there are no waypoints
-                    traf.ap.route[id1].direct(id1, traf.ap.route[id1].wpname[iwpid1])
-                iwpid2 = traf.ap.route[id2].findact(id2)
-                if iwpid2 != -1: # To avoid problems if there are no waypoints
-                    traf.ap.route[id2].direct(id2, traf.ap.route[id2].wpname[iwpid2])
-
-                # If conflict is solved, remove it from conflist_all list
-                # This is so that if a conflict between this pair of aircraft
-                # occurs again, then that new conflict should be detected, logged
-                # and solved (if reso is on)
-                asas.conflist_all.remove(conflict)
-
-        # If aircraft id1 cannot be found in traffic because it has finished its
-        # flight (and has been deleted), start trajectory recovery for aircraft id2
-        # And remove the conflict from the conflict_all list
-        elif id1 < 0 and id2 >= 0:
-             iwpid2 = traf.ap.route[id2].findact(id2)
-             if iwpid2 != -1: # To avoid problems if there are no waypoints
-                 traf.ap.route[id2].direct(id2, traf.ap.route[id2].wpname[iwpid2])
-             asas.conflist_all.remove(conflict)
-
-        # If aircraft id2 cannot be found in traffic because it has finished its
-        # flight (and has been deleted) start trajectory recovery for aircraft id1
-        # And remove the conflict from the conflict_all list
-        elif id2 < 0 and id1 >= 0:
-            iwpid1 = traf.ap.route[id1].findact(id1)
-            if iwpid1 != -1: # To avoid problems if there are no waypoints
-                traf.ap.route[id1].direct(id1, traf.ap.route[id1].wpname[iwpid1])
-            asas.conflist_all.remove(conflict)
-
-        # if both ids are unknown, then delete this conflict, because both aircraft
-        # have completed their flights (and have been deleted)
-        else:
-            asas.conflist_all.remove(conflict)
+    keys  = list(asas.conflist_all.keys())
+    pairs = list(asas.conflist_all.values())
+    id1   = traf.ids2idx([pair[0] for pair in pairs])
+    id2   = traf.ids2idx([pair[1] for pair in pairs])
+
+    # Conflicts of which both aircraft still exist
+    iboth = np.flatnonzero((id1 >= 0) & (id2 >= 0))
+    i1, i2 = id1[iboth], id2[iboth]
+
+    # Check if conflict is past CPA
+    dlon = traf.lon[i2] - traf.lon[i1]
+    dlat = traf.lat[i2] - traf.lat[i1]
+    pastCPA = dlon * (traf.gseast[i2] - traf.gseast[i1]) + \
+        dlat * (traf.gsnorth[i2] - traf.gsnorth[i1]) > 0.
+
+    # hLOS:
+    # Aircraft should continue to resolve until there is no horizontal
+    # LOS. This is particularly relevant when vertical resolutions
+    # are used.
+    dx = (traf.lat[i1] - traf.lat[i2]) * 111319.
+    dy = (traf.lon[i1] - traf.lon[i2]) * 111319.
+    hdist2 = dx**2 + dy**2
+    hLOS   = hdist2 < asas.R**2
+
+    # Bouncing conflicts:
+    # If two aircraft are getting in and out of conflict continously,
+    # then they it is a bouncing conflict. ASAS should stay active until
+    # the bouncing stops.
+    bouncingConflict = (np.abs(traf.trk[i1] - traf.trk[i2]) < 30.) & (hdist2 < asas.Rm**2)
+
+    # Decide if conflict is over or not.
+    # If not over, turn active to true.
+    # Aircraft that haven't passed their CPA must follow their ASAS
+    ongoing = ~pastCPA | hLOS | bouncingConflict
+    asas.active[i1[ongoing]] = True
+    asas.active[i2[ongoing]] = True
+
+    # The conflict is over when it is solved, or when one or both of the
+    # aircraft have finished their flight (and have been deleted)
+    over = np.ones(len(keys), dtype=bool)
+    over[iboth[ongoing]] = False
+
+    # Waypoint recovery after conflict for the remaining aircraft
+    # Find the next active waypoint and send the aircraft to that
+    # waypoint.
+    recover = np.column_stack((id1[over], id2[over])).ravel()
+    recover = recover[recover >= 0]
+    _, ifirst = np.unique(recover, return_index=True)
+    for i in recover[np.sort(ifirst)].tolist():
+        route = traf.ap.route[i]
+        iwp   = route.findact(i)
+        if iwp != -1:  # To avoid problems if there are no waypoints
+            route.direct(i, route.wpname[iwp])
+
+    # Remove conflicts that are over from the conflict_all list
+    # This is so that if a conflict between this pair of aircraft
+    # occurs again, then that new conflict should be detected, logged
+    # and solved (if reso is on)
+    for k in np.flatnonzero(over).tolist():
+        del asas.conflist_all[keys[k]]
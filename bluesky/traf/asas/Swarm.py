@@ -8,8 +8,10 @@ Created on Wed Mar 04 14:27:44 2015
 """
 
 import numpy as np
+from bluesky.tools import geo
 from bluesky.tools.aero import nm, ft
 from . import MVP
+from . import StateBasedCD
 
 
 def start(asas):
@@ -21,22 +23,18 @@ def start(asas):
 
 
 def resolve(asas, traf):
-    # Find matrix of neighbouring aircraft withing swarm distance
-    dx = asas.dx
-    dy = asas.dy - np.eye(traf.ntraf) * 1e9  # setting distance of A/C to itself to 0,\
-    # correcting the distance from CASAS line 109
+    # Neighbouring aircraft within swarm distance that fly in the same
+    # direction, as a list of pairs (i, j) sorted by aircraft i. Together
+    # with each aircraft itself, these form the swarm of aircraft i.
+    i, j, dx, dy, dtrk = neighbours(asas, traf)
 
-    close = np.logical_and(dx**2 + dy**2 < asas.Rswarm**2,
-                           np.abs(asas.dalt) < asas.dhswarm)
+    # Number of aircraft in the swarm of each aircraft, including itself
+    nswarm = 1. + np.bincount(i, minlength=traf.ntraf)
 
-    trkdif = traf.trk.reshape(1, traf.ntraf) - traf.trk.reshape(traf.ntraf, 1)
-    dtrk = (trkdif + 180) % 360 - 180
-    samedirection = np.abs(dtrk) < 90
-
-    selected = np.logical_and(close, samedirection)
-    own = np.eye(traf.ntraf, dtype='bool')
-
-    Swarming = np.logical_or(selected, own)
+    def swarmaverage(own, other):
+        """ Average over the swarm of each aircraft of a quantity that is
+            own for the aircraft itself, and other for the pairs (i, j) """
+        return (own + np.bincount(i, weights=other, minlength=traf.ntraf)) / nswarm
 
     # First do conflict resolution following MVP
     MVP.resolve(asas, traf)
@@ -47,24 +45,20 @@ def resolve(asas, traf):
     ca_vs = asas.active * asas.vs + (1 - asas.active) * traf.selvs
 
     # Add factor of Velocity Alignment to speed vector
-    hspeed = np.ones((traf.ntraf, traf.ntraf)) * traf.cas
-    va_cas = np.average(hspeed, axis=1, weights=Swarming)
-
-    vspeed = np.ones((traf.ntraf, traf.ntraf)) * traf.vs
-    va_vs = np.average(vspeed, axis=1, weights=Swarming)
+    va_cas = swarmaverage(traf.cas, traf.cas[j])
+    va_vs = swarmaverage(traf.vs, traf.vs[j])
 
-    avgdtrk = np.average(dtrk, axis=1, weights=Swarming)
+    avgdtrk = swarmaverage(0., dtrk)
     va_trk = traf.trk + avgdtrk
 
-    # Add factor of Flock Centering to speed vector
-    dxflock = dx + np.eye(traf.ntraf) * asas.u / 100.
-    dyflock = dy + np.eye(traf.ntraf) * asas.v / 100.
-
-    fc_dx = np.average(dxflock, axis=1, weights=Swarming)
-    fc_dy = np.average(dyflock, axis=1, weights=Swarming)
+    # Add factor of Flock Centering to speed vector. The own position in
+    # the swarm is the ADS-B position relative to the own position, which
+    # is zero without ADS-B noise and truncation.
+    qdr, dist = geo.qdrdist_pairs(traf.lat, traf.lon, traf.adsb.lat, traf.adsb.lon)
+    fc_dx = swarmaverage(dist * nm * np.sin(np.radians(qdr)) + np.ravel(asas.u) / 100., dx)
+    fc_dy = swarmaverage(dist * nm * np.cos(np.radians(qdr)) + np.ravel(asas.v) / 100., dy)
 
-    z = np.ones((traf.ntraf, traf.ntraf)) * traf.alt
-    fc_dz = np.average(z, axis=1, weights=Swarming) - traf.alt
+    fc_dz = swarmaverage(traf.alt, traf.alt[j]) - traf.alt
 
     fc_trk = np.degrees(np.arctan2(fc_dx, fc_dy))
     fc_cas = traf.cas
@@ -97,3 +91,41 @@ def resolve(asas, traf):
     # Make sure that all aircraft follow these directions
     asas.active.fill(True)
     pass
+
+
+def neighbours(asas, traf):
+    """ Return the pairs (i, j) of aircraft that are within Rswarm and
+        dhswarm of each other and fly in the same direction, sorted by i,
+        with the position of j relative to i [m] and the track difference
+        [deg]. Uses the own position of i and the ADS-B position of j. """
+    lat1, lon1, alt1 = traf.lat, traf.lon, traf.adsb.alt
+    lat2, lon2, alt2 = traf.adsb.lat, traf.adsb.lon, traf.alt
+
+    # Candidate pairs in a grid, with a margin for round-off, or all pairs
+    # when the grid can't be used
+    pairs = None
+    if traf.ntraf > 1:
+        pairs = StateBasedCD.neighbours(lat1, lon1, alt1, lat2, lon2, alt2,
+                                        1.01 * asas.Rswarm, 1.01 * asas.dhswarm)
+    if pairs is None:
+        pairs = np.arange(traf.ntraf * traf.ntraf)
+    i, j = np.divmod(np.sort(pairs), traf.ntraf)
+    i, j = i[i != j], j[i != j]
+
+    # Relative positions of the candidate pairs
+    qdr, dist = geo.qdrdist_pairs(lat1[i], lon1[i], lat2[j], lon2[j])
+    qdrrad = np.radians(qdr)
+    dist   = dist * nm
+    dx     = dist * np.sin(qdrrad)
+    dy     = dist * np.cos(qdrrad)
+    dalt   = alt2[j] - alt1[i]
+
+    # Neighbouring aircraft within swarm distance
+    close = (dx**2 + dy**2 < asas.Rswarm**2) & (np.abs(dalt) < asas.dhswarm)
+
+    trkdif = traf.trk[j] - traf.trk[i]
+    dtrk = (trkdif + 180) % 360 - 180
+    samedirection = np.abs(dtrk) < 90
+
+    sel = np.flatnonzero(close & samedirection)
+    return i[sel], j[sel], dx[sel], dy[sel], dtrk[sel]
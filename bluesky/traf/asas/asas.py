@@ -4,25 +4,20 @@ import numpy as np
 import bluesky as bs
 from bluesky import settings
 from bluesky.tools.aero import ft, nm
+from bluesky.tools import scheduler
 from bluesky.tools.trafficarrays import TrafficArrays, RegisterElementParameters
+from .cdcache import CDCache
 
 # Register settings defaults
-settings.set_variable_defaults(prefer_compiled=False, asas_dt=1.0, asas_dtlookahead=300.0, asas_mar=1.2, asas_pzr=5.0, asas_pzh=1000.0)
+settings.set_variable_defaults(prefer_compiled=False, asas_dt=1.0, asas_dtlookahead=300.0, asas_mar=1.2, asas_pzr=5.0, asas_pzh=1000.0, asas_nthreads=0,
+                               asas_geometry='WGS84', asas_flatextent=500.0)
 
-# Import default CD methods
-StateBasedCD = False
-if settings.prefer_compiled:
-    try:
-        from . import casas as StateBasedCD
-        print('StateBasedCD: using compiled version.')
-    except ImportError:
-        print('StateBasedCD: using default Python version, no compiled version for this platform.')
-
-if not StateBasedCD:
-    print('StateBasedCD: using Python version.')
-    from . import StateBasedCD
+# Import default CD methods. StateBasedCD uses the compiled pairwise
+# detection when prefer_compiled is set and it is available.
+from . import StateBasedCD
 
 # Import default CR methods
+from . import Difgame
 from . import DoNothing
 from . import Eby
 from . import MVP
@@ -37,7 +32,7 @@ class ASAS(TrafficArrays):
     CDmethods = {"STATEBASED": StateBasedCD}
 
     # Dictionary of CR methods
-    CRmethods = {"OFF": DoNothing, "MVP": MVP, "EBY": Eby, "SWARM": Swarm}
+    CRmethods = {"OFF": DoNothing, "MVP": MVP, "EBY": Eby, "SWARM": Swarm, "DIFGAME": Difgame}
 
     @classmethod
     def addCDMethod(asas, name, module):
@@ -59,6 +54,13 @@ class ASAS(TrafficArrays):
             self.alt      = np.array([])  # speed alt by the ASAS [m]
             self.vs       = np.array([])  # speed vspeed by the ASAS [m/s]
 
+            # Pair distances of the previous conflict detections
+            self.cdcache  = CDCache()
+
+        # Scheduling of CD&R at whole multiples of the interval, which is set
+        # in the reset function
+        self.task = scheduler.Task('ASAS', settings.asas_dt, phase=0.0)
+
         # All ASAS variables are initialized in the reset function
         self.reset()
 
@@ -71,7 +73,7 @@ class ASAS(TrafficArrays):
         self.cd           = ASAS.CDmethods[self.cd_name]
         self.cr           = ASAS.CRmethods[self.cr_name]
 
-        self.dtasas       = settings.asas_dt           # interval for ASAS
+        self.task.dt      = settings.asas_dt           # interval for ASAS
         self.dtlookahead  = settings.asas_dtlookahead  # [s] lookahead time
         self.mar          = settings.asas_mar          # [-] Safety margin for evasion
         self.R            = settings.asas_pzr * nm     # [m] Horizontal separation minimum for detection
@@ -79,7 +81,9 @@ class ASAS(TrafficArrays):
         self.Rm           = self.R * self.mar          # [m] Horizontal separation minimum for resolution
         self.dhm          = self.dh * self.mar         # [m] Vertical separation minimum for resolution
         self.swasas       = True                       # [-] whether to perform CD&R
-        self.tasas        = 0.0                        # Next time ASAS should be called
+        self.nthreads     = settings.asas_nthreads     # [-] Number of threads of the compiled CD (0 = one per core)
+        self.geometry     = settings.asas_geometry     # [-] Geometry of the CD: WGS84 or FLAT (flat-earth)
+        self.task.reset()
 
         self.vmin         = 51.4                       # [m/s] Minimum ASAS velocity (100 kts)
         self.vmax         = 308.6                      # [m/s] Maximum ASAS velocity (600 kts)
@@ -120,24 +124,45 @@ class ASAS(TrafficArrays):
         self.u            = np.array([])
         self.v            = np.array([])
 
-        self.conflist_all = []  # List of all Conflicts
-        self.LOSlist_all  = []  # List of all Losses Of Separation
-        self.conflist_exp = []  # List of all Conflicts in experiment time
-        self.LOSlist_exp  = []  # List of all Losses Of Separation in experiment time
-        self.conflist_now = []  # List of current Conflicts
-        self.LOSlist_now  = []  # List of current Losses Of Separation
+        # Conflict and LOS registry: dicts keyed by unordered aircraft pair
+        # (see StateBasedCD.pairkey), with as value the pair of call signs in
+        # the order in which it was first detected
+        self.conflist_all = dict()  # All Conflicts
+        self.LOSlist_all  = dict()  # All Losses Of Separation, with as value the index in LOSmaxsev
+        self.conflist_exp = dict()  # All Conflicts in experiment time
+        self.LOSlist_exp  = dict()  # All Losses Of Separation in experiment time
+        self.conflist_now = dict()  # Current Conflicts
+        self.LOSlist_now  = dict()  # Current Losses Of Separation
 
         # For keeping track of locations with most severe intrusions
         self.LOSmaxsev    = []
         self.LOShmaxsev   = []
         self.LOSvmaxsev   = []
 
-    def toggle(self, flag=None):
+    def setstate(self, state, n, prefix=''):
+        super(ASAS, self).setstate(state, n, prefix)
+        # Link to the CD and CR methods of the restored state
+        self.cd = ASAS.CDmethods.get(self.cd_name, self.cd)
+        self.cr = ASAS.CRmethods.get(self.cr_name, self.cr)
+
+    def toggle(self, flag=None, value=None):
+        if flag == "GEOMETRY":
+            return self.SetGeometry(value)
         if flag is None:
             return True, "ASAS is currently " + ("ON" if self.swasas else "OFF")
+        if not isinstance(flag, bool):
+            return False, "ASAS ON/OFF or ASAS GEOMETRY WGS84/FLAT"
         self.swasas = flag
         return True
 
+    def SetGeometry(self, value=None):
+        if value is None:
+            return True, ("ASAS GEOMETRY [WGS84/FLAT]\nCurrent CD geometry: " + self.geometry)
+        if value not in ("WGS84", "FLAT"):
+            return False, "ASAS GEOMETRY: unknown geometry " + value + ", use WGS84 or FLAT"
+
+        self.geometry = value
+
     def SetCDmethod(self, method=""):
         if method is "":
             return True, ("Current CD method: " + self.cd_name +
@@ -199,9 +224,9 @@ class ASAS(TrafficArrays):
 
     def SetDtNoLook(self, value=None):
         if value is None:
-            return True, ("DTNOLOOK [time]\nCurrent value: %.1f sec" % self.dtasas)
+            return True, ("DTNOLOOK [time]\nCurrent value: %.1f sec" % self.task.dt)
 
-        self.dtasas = value
+        self.task.dt = value
 
     def SetResoHoriz(self, value=None):
         """ Processes the RMETHH command. Sets swresovert = False"""
@@ -354,9 +379,7 @@ class ASAS(TrafficArrays):
         iconf0 = np.array(self.iconf)
 
         # Scheduling: update when dt has passed
-        if self.swasas and simt >= self.tasas:
-            self.tasas += self.dtasas
-
+        if self.swasas and self.task.due(simt):
             # Conflict detection and resolution
             self.cd.detect(self, bs.traf, simt)
             self.cr.resolve(self, bs.traf)
@@ -0,0 +1,128 @@
+""" Cache of the pair distances of the state-based conflict detection, to skip
+    the pairs that can't be in conflict since the last time they were checked."""
+import numpy as np
+import bluesky as bs
+from bluesky.tools.trafficarrays import TrafficArrays, RegisterElementParameters, keepmask
+
+# WGS'84 semi-axes [m]. The distance of geo.qdrdist_pairs is the central
+# angle times an earth radius that lies between these two.
+a = 6378137.0
+b = 6356752.314245
+
+
+class CDCache(TrafficArrays):
+    """ Lower bounds of the horizontal and vertical distance of the candidate
+        pairs of the conflict detection.
+
+        The bounds are stored relative to a reference position of each
+        aircraft: the distance of a pair at the reference positions is at
+        least the slack of the pair. Since then, the distance has decreased
+        by at most the sum of the displacements of both aircraft from their
+        reference positions, whatever the aircraft did in the meantime
+        (turns, climbs, speed changes, or a MOVE command). Pairs of which the
+        remaining distance is larger than the reach of the conflict detection
+        are skipped. When the aircraft have moved too far from their
+        reference positions, the cache is cleared, and all aircraft get their
+        current position as new reference position."""
+
+    def __init__(self):
+        super(CDCache, self).__init__()
+        with RegisterElementParameters(self):
+            self.lat = np.array([])  # Reference latitude of each aircraft [deg]
+            self.lon = np.array([])  # Reference longitude [deg]
+            self.alt = np.array([])  # Reference altitude [m]
+
+        self.pending = None  # Pairs of the CD in progress, see filter()
+        self.clear()
+
+    def clear(self):
+        """ Remove all pairs from the cache """
+        self.i      = np.array([], dtype=int)  # Ownship and intruder of the pairs,
+        self.j      = np.array([], dtype=int)  # in row-major order
+        self.hslack = np.array([])             # Central angle at the reference positions [rad]
+        self.vslack = np.array([])             # Vertical distance at the reference positions [m]
+
+    def create(self, n=1):
+        super(CDCache, self).create(n)
+        if n <= 0:
+            return
+        self.lat[-n:] = bs.traf.lat[-n:]
+        self.lon[-n:] = bs.traf.lon[-n:]
+        self.alt[-n:] = bs.traf.alt[-n:]
+
+    def delete(self, idx):
+        # Renumber the pairs, and remove the pairs of deleted aircraft
+        keep   = keepmask(len(self.lat), idx)
+        newidx = np.cumsum(keep) - 1
+        valid  = keep[self.i] & keep[self.j]
+        self.i, self.j = newidx[self.i[valid]], newidx[self.j[valid]]
+        self.hslack, self.vslack = self.hslack[valid], self.vslack[valid]
+        super(CDCache, self).delete(idx)
+
+    def reset(self):
+        super(CDCache, self).reset()
+        self.pending = None
+        self.clear()
+
+    def displacement(self, traf):
+        """ Return the central angle [rad] and the vertical distance [m] of
+            the aircraft from their reference positions """
+        lat1, lat2 = np.radians(self.lat), np.radians(traf.lat)
+        sindlat = np.sin(0.5 * (lat2 - lat1))
+        sindlon = np.sin(0.5 * np.radians(traf.lon - self.lon))
+        hav     = sindlat * sindlat + np.cos(lat1) * np.cos(lat2) * sindlon * sindlon
+        delta   = 2. * np.arctan2(np.sqrt(hav), np.sqrt(np.maximum(0., 1. - hav)))
+        return delta, np.abs(traf.alt - self.alt)
+
+    def filter(self, traf, i, j, hreach, vreach):
+        """ Return the pairs of the candidate pairs i, j (in row-major order)
+            that have to be checked: the pairs that aren't in the cache, and
+            the pairs that may have come within hreach horizontally and within
+            vreach vertically. Pairs outside this reach can't be in conflict.
+            The distances of the checked pairs are passed with store(), after
+            which commit() updates the cache. """
+        delta, dz = self.displacement(traf)
+
+        # Start again from the current positions when the aircraft have
+        # used up a large part of the reach
+        if len(delta) and (b * np.max(delta) > 0.25 * hreach or np.max(dz) > 0.25 * vreach):
+            self.clear()
+            self.lat, self.lon, self.alt = traf.lat.copy(), traf.lon.copy(), traf.alt.copy()
+            self.ArrBufs.clear()
+            delta, dz = np.zeros(traf.ntraf), np.zeros(traf.ntraf)
+
+        # Look up the candidate pairs in the cache
+        n      = traf.ntraf
+        key    = self.i * n + self.j
+        pos    = np.minimum(np.searchsorted(key, i * n + j), max(0, len(key) - 1))
+        cached = np.zeros(len(i), dtype=bool) if len(key) == 0 else key[pos] == i * n + j
+        hslack = np.where(cached, self.hslack[pos] if len(key) else 0., -np.inf)
+        vslack = np.where(cached, self.vslack[pos] if len(key) else 0., -np.inf)
+
+        # Lower bounds of the current distances
+        check = (b * (hslack - delta[i] - delta[j]) < hreach) & \
+                (vslack - dz[i] - dz[j] < vreach)
+
+        self.pending = (i, j, check, hslack, vslack, delta, dz, [], [])
+        return i[check], j[check]
+
+    def store(self, dist, dalt):
+        """ Pass the distance [m] and vertical distance [m] of the next
+            checked pairs, in the order of filter() """
+        if self.pending is not None:
+            self.pending[7].append(dist)
+            self.pending[8].append(dalt)
+
+    def commit(self):
+        """ Replace the pairs in the cache by the candidate pairs of the last
+            filter(), with the new distances of the pairs that were checked """
+        if self.pending is None:
+            return
+        i, j, check, hslack, vslack, delta, dz, dists, dalts = self.pending
+        self.pending = None
+
+        ic, jc = i[check], j[check]
+        if dists:
+            hslack[check] = np.concatenate(dists) / a - delta[ic] - delta[jc]
+            vslack[check] = np.abs(np.concatenate(dalts)) - dz[ic] - dz[jc]
+        self.i, self.j, self.hslack, self.vslack = i, j, hslack, vslack
@@ -5,37 +5,34 @@
 #include <cmath>
 #include <algorithm>
 
+// Parameters of the conflict detection. The conflict lists, LOS registry
+// and ASAS active flags are maintained in Python (see StateBasedCD.detect).
 struct Dbconf {
     PyObject* self;
     double dtlookahead, R, R2, dh;
-    int nconf;
-    // Per aircraft arrays/lists
-    PyBoolArrayAttr asasactive;// not recreated with each call to detect
-    PyListAttr  iconf;// iconf is a list of (empty) lists
-    // Per conflict lists
-    PyListAttr latowncpa, lonowncpa, altowncpa, confpairs,
-               LOSlist_now, LOSlist_exp, LOSlist_all, 
-               conflist_now, conflist_exp, conflist_all;
-    // Also used in CR methods, but not yet created here:
-    // qdr, dist, u, v, dx, dy, tcpa, dalt, tinconf, toutconf
-    // LOSmaxsev, LOShmaxsev, LOSvmaxsev
+    int nthreads;
 
     Dbconf(PyObject* self) : self(self),
         dtlookahead(GetAttrDouble(self, "dtlookahead")), R(GetAttrDouble(self, "R")),
-        dh(GetAttrDouble(self, "dh")), nconf(0), asasactive(self, "active")
+        dh(GetAttrDouble(self, "dh")), nthreads(GetAttrInt(self, "nthreads"))
         {R2 = R * R;}
+};
 
-    void copyback() {
-        PyObject_SetAttrString(self, "latowncpa", latowncpa.attr);
-        PyObject_SetAttrString(self, "lonowncpa", lonowncpa.attr);
-        PyObject_SetAttrString(self, "altowncpa", altowncpa.attr);
-        PyObject_SetAttrString(self, "confpairs", confpairs.attr);
-        PyObject_SetAttrString(self, "iconf", iconf.attr);
-        PyObject_SetAttrString(self, "nconf", PyLong_FromLong(nconf));
-    }
+// Aircraft data as plain C arrays, which can be used without the GIL
+struct acdata {
+    const double *lat, *lon, *trk, *gs, *alt, *vs;
+};
+
+// Detected conflict of ownship i with intruder j, with the same CD results
+// as the Python version: bearing [deg] and distance [m] from i to j, relative
+// position of j [m], altitude difference of j [m], time to CPA, and times of
+// entering and leaving the conflict [s]
+struct confrec {
+    npy_intp i, j;
+    double qdr, dist, dx, dy, dalt, tcpa, tin, tout;
 };
 
-struct conflict {double tin, tout, latcpa, loncpa; bool LOS; };
+struct conflict {double tin, tout, tcpa, qdr, dist, dx, dy, latcpa, loncpa; bool LOS; };
 inline bool detect_hor(const Dbconf& params, conflict& conf,
                        const qdr_d_in& ll1, const double& gs1, const double& trk1,
                        const qdr_d_in& ll2, const double& gs2, const double& trk2)
@@ -65,26 +62,26 @@ inline bool detect_hor(const Dbconf& params, conflict& conf,
     // If diverging and separated, no horizontal conflict
     if (vreldotdx < 0.0 && !conf.LOS) return false;
 
-    double vrel2     = (du * du + dv * dv);
-    if (conf.LOS) {
-        // Horizontal separation is already lost: calculate PZ exit time
-        conf.tin     = 0.0;
-        conf.tout    = (sqrt(vreldotdx * vreldotdx - d * d * vrel2) - vreldotdx) / (d * d);
-        conf.latcpa  = ll1.lat;
-        conf.loncpa  = ll1.lon;
+    // Times as in StateBasedCD.conflicts: the entry time is negative when
+    // separation is already lost
+    double vrel2     = std::max(du * du + dv * dv, 1e-6);
+    double t_cpa     = vreldotdx / vrel2;
+    double CPA2      = d * d - vreldotdx * t_cpa;
+    if (CPA2 >= params.R2) return false;
+
+    double dt        = sqrt((params.R2 - CPA2) / vrel2);
+    conf.tcpa        = t_cpa;
+    conf.qdr         = q;
+    conf.dist        = d;
+    conf.dx          = dx;
+    conf.dy          = dy;
+    conf.tin         = t_cpa - dt;
+    conf.tout        = t_cpa + dt;
+    // Calculate CPA position of AC1 if conflict is in detection range
+    if (conf.tin <= params.dtlookahead) {
+        conf.latcpa  = ll1.lat + v1 * t_cpa / re;
+        conf.loncpa  = ll1.lon + u1 * t_cpa / re / ll1.coslat;
         return true;
-    } else {
-        double t_cpa = vreldotdx / vrel2;
-        double CPA2  = d * d - vreldotdx * t_cpa;
-        double dt    = sqrt((params.R2 - CPA2) / vrel2);
-        conf.tin     = t_cpa - dt;
-        conf.tout    = t_cpa + dt;
-        // Calculate CPA position of AC1 if conflict is in detection range
-        if (conf.tin <= params.dtlookahead) {
-          conf.latcpa = ll1.lat + v1 * t_cpa / re;
-          conf.loncpa = ll1.lon + u1 * t_cpa / re / ll1.coslat;
-          return true;
-        }
     }
     return false;
 }
@@ -93,18 +90,14 @@ inline bool detect_ver(const Dbconf& params, conflict& conf,
                        const double& dalt, const double& dvs)
 {
     conf.LOS = fabs(dalt) < params.dh;
-    if (fabs(dvs) > 1e-6) {
-        double tcrosshi = (dalt + params.dh) / -dvs,
-               tcrosslo = (dalt - params.dh) / -dvs;
+    // Small vertical speed differences are limited as in the Python version
+    double dvslim   = fabs(dvs) < 1e-6 ? 1e-6 : dvs;
+    double tcrosshi = (dalt + params.dh) / -dvslim,
+           tcrosslo = (dalt - params.dh) / -dvslim;
 
-        conf.tin  = std::max(0.0, std::min(tcrosslo, tcrosshi));
-        conf.tout = std::max(tcrosslo, tcrosshi);
+    conf.tin  = std::min(tcrosslo, tcrosshi);
+    conf.tout = std::max(tcrosslo, tcrosshi);
 
-        // Vertical conflict if t_in is within lookahead horizon, and t_out > 0
-        return (conf.tin <= params.dtlookahead && conf.tout > 0.0);
-    } else {
-        conf.tin  = 0.0;
-        conf.tout = 1e4;
-        return conf.LOS;
-    }
+    // Vertical conflict if t_in is within lookahead horizon, and t_out > 0
+    return (conf.tin <= params.dtlookahead && conf.tout > 0.0);
 }
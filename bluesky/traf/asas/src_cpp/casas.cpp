@@ -1,5 +1,6 @@
 #include <iostream>
 #include <vector>
+#include <thread>
 #include "asas.hpp"
 #define DEG2RAD 0.017453292519943295
 #define RAD2DEG 57.29577951308232
@@ -9,12 +10,74 @@
 #define FT2M 0.3048
 #define FPM2MS 0.00508
 
+// Detect the conflicts of ownships [ibegin, iend) with all intruders, and
+// store them in confs. Only plain C data is used, so that this function
+// can run in a worker thread without holding the GIL. C++ exceptions (e.g.,
+// std::bad_alloc in push_back) are caught and reported in failed, because
+// they can't pass to Python, nor leave a thread.
+static void detect_block(const Dbconf& dbconf, const acdata& own, const acdata& intr,
+                         const std::vector<qdr_d_in>& ll2, npy_intp size,
+                         npy_intp ibegin, npy_intp iend,
+                         std::vector<confrec>& confs, char& failed)
+{
+    conflict confhor, confver;
+    double tin, tout;
+    double dalt, dvs;
+    qdr_d_in ll1;
+
+    try {
+        for (npy_intp i = ibegin; i < iend; ++i) {
+            ll1.init(own.lat[i] * DEG2RAD, own.lon[i] * DEG2RAD);
+            for (npy_intp j = 0; j < size; ++j) {
+                if (i != j) {
+                    // Vectical detection first
+                    dalt = own.alt[i] - intr.alt[j];
+                    dvs  = own.vs[i]  - intr.vs[j];
+                    if (detect_ver(dbconf, confver, dalt, dvs)) {
+                        // Horizontal detection
+                        if (detect_hor(dbconf, confhor,
+                                       ll1,   own.gs[i],  own.trk[i] * DEG2RAD,
+                                       ll2[j], intr.gs[j], intr.trk[j] * DEG2RAD)) {
+                            tin  = std::max(confhor.tin, confver.tin);
+                            tout = std::min(confhor.tout, confver.tout);
+                            // Combined conflict?
+                            if (tin < dbconf.dtlookahead && tin <= tout && tout > 0.0) {
+                                confrec conf = {i, j, confhor.qdr * RAD2DEG, confhor.dist,
+                                                confhor.dx, confhor.dy, -dalt, confhor.tcpa,
+                                                tin, tout};
+                                confs.push_back(conf);
+                            }
+                        }
+                    }
+                }
+            }
+        }
+    } catch (...) {
+        failed = 1;
+    }
+}
+
+// Return a new one-dimensional numpy array with the values of field of all
+// conflicts, in the order of the blocks
+template<typename T>
+static PyObject* confarray(const std::vector<std::vector<confrec> >& confs, npy_intp nconf,
+                           int typenum, T confrec::* field)
+{
+    PyObject* arr = PyArray_SimpleNew(1, &nconf, typenum);
+    if (arr == NULL)
+        return NULL;
+    T* ptr = (T*)PyArray_DATA((PyArrayObject*)arr);
+    for (size_t t = 0; t < confs.size(); ++t)
+        for (size_t c = 0; c < confs[t].size(); ++c)
+            *ptr++ = confs[t][c].*field;
+    return arr;
+}
+
 static PyObject* casas_detect(PyObject* self, PyObject* args)
 {
     PyObject *pyasas = NULL,
              *traf   = NULL;
-    double   simt;
-    if (!PyArg_ParseTuple(args, "OOd", &pyasas, &traf, &simt))
+    if (!PyArg_ParseTuple(args, "OO", &pyasas, &traf))
         return NULL;
 
     PyAttr adsb(traf, "adsb");
@@ -24,83 +87,96 @@ static PyObject* casas_detect(PyObject* self, PyObject* args)
                       lat2(adsb, "lat"), lon2(adsb, "lon"), trk2(adsb, "trk"),
                       gs2 (adsb, "gs"),  alt2(adsb, "alt"), vs2 (adsb, "vs");
 
-    PyListAttr  acid(traf, "id");
-
     // Only continue if all arrays exist
-    if (lat1 && lon1 && trk1 && gs1  && alt1 && vs1  && lat2 && lon2 && trk2 && gs2  && alt2 && vs2)
-    {
-        // Assume all arrays are the same size; only get the size of lat1
-        npy_intp  size  = lat1.size();
-
-        // Wrap dbconf in C struct
-        Dbconf dbconf(pyasas);
-
-        // Loop over all combinations of aircraft to detect conflicts
-        conflict confhor, confver;
-        double tin, tout;
-        double dalt, dvs;
-        qdr_d_in ll1;
-        std::vector<qdr_d_in> ll2(size);
-        std::vector<qdr_d_in>::iterator pll2 = ll2.begin();
-        npy_bool asasactive = NPY_FALSE;
+    if (!(lat1 && lon1 && trk1 && gs1  && alt1 && vs1  && lat2 && lon2 && trk2 && gs2  && alt2 && vs2))
+        return NULL;
+
+    // Assume all arrays are the same size; only get the size of lat1
+    npy_intp  size  = lat1.size();
+
+    // Wrap dbconf in C struct
+    Dbconf dbconf(pyasas);
+    if (PyErr_Occurred())
+        return NULL;
+
+    // The same data as StateBasedCD.narrowphase: the position of the ownship
+    // is its own position, and its velocity and altitude are its ADS-B data.
+    // For the intruder it is the other way around.
+    acdata own  = {lat1.ptr, lon1.ptr, trk2.ptr, gs2.ptr, alt2.ptr, vs2.ptr},
+           intr = {lat2.ptr, lon2.ptr, trk1.ptr, gs1.ptr, alt1.ptr, vs1.ptr};
+
+    // Number of threads: each thread checks a block of ownships against
+    // all intruders. Zero means one thread per core.
+    npy_intp nthreads = dbconf.nthreads > 0 ? dbconf.nthreads :
+                        std::max(1u, std::thread::hardware_concurrency());
+    nthreads = std::max(npy_intp(1), std::min(nthreads, size));
+
+    std::vector<std::vector<confrec> > confs;
+    std::vector<qdr_d_in> ll2;
+    std::vector<std::thread> workers;
+    std::vector<char> failed;
+    bool error = false;
+
+    // Release the GIL during the detection, so other Python threads
+    // (e.g., the GUI) can continue. No exception may leave this block,
+    // and the GIL is reacquired before an error is raised.
+    Py_BEGIN_ALLOW_THREADS
+    try {
+        confs.resize(nthreads);
+        failed.resize(nthreads, 0);
 
         // Pre-calculate intruder data
-        for (unsigned int i = 0; i < size; ++i) {
-            pll2->init(*lat2.ptr * DEG2RAD, *lon2.ptr * DEG2RAD);
-            lat2.ptr++; lon2.ptr++; pll2++;
-        }
+        ll2.resize(size);
+        for (npy_intp j = 0; j < size; ++j)
+            ll2[j].init(intr.lat[j] * DEG2RAD, intr.lon[j] * DEG2RAD);
 
-        for (unsigned int i = 0; i < size; ++i) {
-            ll1.init(*lat1.ptr * DEG2RAD, *lon1.ptr * DEG2RAD);
-            pll2 = ll2.begin();
-            PyListAttr acconfids;
-            for (unsigned int j = 0; j < size; ++j) {
-                if (i != j) {
-                    // Vectical detection first
-                    dalt = *alt1.ptr - *alt2.ptr;
-                    dvs  = *vs1.ptr  - *vs2.ptr;
-                    if (detect_ver(dbconf, confver, dalt, dvs)) {
-                        // Horizontal detection
-                        if (detect_hor(dbconf, confhor,
-                                       ll1,   *gs1.ptr, *trk1.ptr * DEG2RAD,
-                                       *pll2, *gs2.ptr, *trk2.ptr * DEG2RAD)) {
-                            tin  = std::max(confhor.tin, confver.tin);
-                            tout = std::min(confhor.tout, confver.tout);
-                            // Combined conflict?
-                            if (tin <= dbconf.dtlookahead && tin < tout && tout > 0.0) {
-                                // Add AC id to conflict list
-                                dbconf.confpairs.append(PyTuple_Pack(2, acid[i], acid[j]));
-                                dbconf.latowncpa.append(confhor.latcpa * RAD2DEG);
-                                dbconf.lonowncpa.append(confhor.loncpa * RAD2DEG);
-
-                                // Keep index for current ownship and increase conflict count
-                                acconfids.append(dbconf.nconf);
-                                dbconf.nconf++;
-                                asasactive = NPY_TRUE;// ASAS should be active for this aircraft
-                            }
-                        }
-                    }
-                }
-                pll2++; trk2.ptr++; gs2.ptr++; alt2.ptr++; vs2.ptr++;
-            }
-            dbconf.iconf.append(acconfids.attr);
-            *dbconf.asasactive.ptr = asasactive;
-            dbconf.asasactive.ptr++;
-            asasactive = NPY_FALSE;
-            trk2.ptr = trk2.ptr_start; gs2.ptr  = gs2.ptr_start;
-            alt2.ptr = alt2.ptr_start; vs2.ptr  = vs2.ptr_start;
-            lat1.ptr++; lon1.ptr++; trk1.ptr++; gs1.ptr++; alt1.ptr++; vs1.ptr++;
-        }
-        // Copy new lists back to python dbconf object
-        dbconf.copyback();
+        // Loop over all combinations of aircraft to detect conflicts. The
+        // first block is done in the calling thread.
+        workers.reserve(nthreads - 1);
+        for (npy_intp t = 1; t < nthreads; ++t)
+            workers.push_back(std::thread(detect_block, std::cref(dbconf), std::cref(own),
+                                          std::cref(intr), std::cref(ll2), size,
+                                          t * size / nthreads, (t + 1) * size / nthreads,
+                                          std::ref(confs[t]), std::ref(failed[t])));
+        detect_block(dbconf, own, intr, ll2, size, 0, size / nthreads, confs[0], failed[0]);
+    } catch (...) {
+        error = true;
+    }
+    // Wait for the threads that were started, also after an error
+    for (size_t t = 0; t < workers.size(); ++t)
+        workers[t].join();
+    Py_END_ALLOW_THREADS
+
+    for (size_t t = 0; t < failed.size(); ++t)
+        error = error || failed[t];
+    if (error) {
+        PyErr_SetString(PyExc_RuntimeError, "casas.detect: conflict detection failed (out of memory, or threads unavailable)");
+        return NULL;
     }
 
-    Py_INCREF(Py_None);
-    return Py_None;
+    // Merge the conflicts of all threads. The blocks of ownships are in
+    // order, so the conflicts are in the same order as with one thread.
+    npy_intp nconf = 0;
+    for (npy_intp t = 0; t < nthreads; ++t)
+        nconf += confs[t].size();
+
+    // Return the indices and CD results of the conflicting pairs, like
+    // StateBasedCD.detectpairs
+    return Py_BuildValue("NNNNNNNNNN",
+        confarray(confs, nconf, NPY_INTP,   &confrec::i),
+        confarray(confs, nconf, NPY_INTP,   &confrec::j),
+        confarray(confs, nconf, NPY_DOUBLE, &confrec::qdr),
+        confarray(confs, nconf, NPY_DOUBLE, &confrec::dist),
+        confarray(confs, nconf, NPY_DOUBLE, &confrec::dx),
+        confarray(confs, nconf, NPY_DOUBLE, &confrec::dy),
+        confarray(confs, nconf, NPY_DOUBLE, &confrec::dalt),
+        confarray(confs, nconf, NPY_DOUBLE, &confrec::tcpa),
+        confarray(confs, nconf, NPY_DOUBLE, &confrec::tin),
+        confarray(confs, nconf, NPY_DOUBLE, &confrec::tout));
 };
 
 static PyMethodDef methods[] = {
-    {"detect", casas_detect, METH_VARARGS, "Detect conflicts for traffic"},
+    {"detect", casas_detect, METH_VARARGS, "Detect the conflicting pairs of aircraft"},
     {NULL}  /* Sentinel */
 };
 
@@ -1,10 +1,16 @@
 #!/usr/bin/env python
 # -*- coding: UTF-8 -*-
 
+import sys
 from distutils.core import setup, Extension
 import numpy as np
 
-ext_modules = [Extension('casas', sources=['casas.cpp'])]
+# The conflict detection uses std::thread, which requires C++11 and, with
+# gcc and clang, the pthread flag
+flags = [] if sys.platform == 'win32' else ['-std=c++11', '-pthread']
+
+ext_modules = [Extension('casas', sources=['casas.cpp'],
+                         extra_compile_args=flags, extra_link_args=flags)]
 
 setup(name='casas', version='1.0', include_dirs=[np.get_include(), '../../../tools/src_cpp'],
       ext_modules=ext_modules)
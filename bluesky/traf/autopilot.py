@@ -2,20 +2,21 @@
 from math import sin, cos, radians
 import numpy as np
 import bluesky as bs
-from bluesky.tools import geo
+from bluesky.tools import geo, scheduler
 from bluesky.tools.position import txt2pos
 from bluesky.tools.aero import ft, nm, vtas2cas, cas2mach, \
-     mach2cas, vcasormach2tas
+     mach2cas, vcas2mach, vmach2cas, vcasormach2tas
 from .route import Route
-from bluesky.tools.trafficarrays import TrafficArrays, RegisterElementParameters
+from .routetable import RouteTable
+from bluesky.tools.trafficarrays import TrafficArrays, RegisterElementParameters, setsubset
 
 
 class Autopilot(TrafficArrays):
     def __init__(self):
         super(Autopilot, self).__init__()
-        # Scheduling of FMS and ASAS
-        self.t0 = -999.  # last time fms was called
-        self.dt = 1.01   # interval for fms
+        # Scheduling of FMS: 1.01 s after its last update. With more than one
+        # slice, each update covers the next slice of the aircraft.
+        self.task = scheduler.Task('FMS', dt=1.01, sliceable=True)
 
         # Standard self.steepness for descent
         self.steepness = 3000. * ft / (10. * nm)
@@ -39,8 +40,11 @@ class Autopilot(TrafficArrays):
             self.orig = []  # Four letter code of origin airport
             self.dest = []  # Four letter code of destination airport
 
-        # Route objects
-        self.route = []
+            # Route objects
+            self.route = []
+
+            # Array-backed copy of the routes, for the waypoint sequencing
+            self.routetable = RouteTable()
 
     def create(self, n=1):
         super(Autopilot, self).create(n)
@@ -54,130 +58,147 @@ class Autopilot(TrafficArrays):
         self.dist2vs[-n:] = -999.
 
         # Route objects
-        self.route.extend([Route()] * n)
-
-    def delete(self, idx):
-        super(Autopilot, self).delete(idx)
-        # Route objects
-        del self.route[idx]
-
-    def update(self, simt):
-        # Scheduling: when dt has passed or restart
-        if self.t0 + self.dt < simt or simt < self.t0:
-            self.t0 = simt
+        self.route[-n:] = [Route() for i in range(n)]
+
+    def update(self, simt, idx=None):
+        """ Update the FMS guidance when the FMS task is due, and the
+            commanded speed of aircraft idx (default: all aircraft).
+            Returns True when the FMS guidance was updated. """
+        # Scheduling: when the FMS task is due
+        fms = self.task.due(simt)
+        if fms:
+            # Aircraft of this FMS update: all aircraft (sel=None), or the
+            # next slice of them
+            sel = None if self.task.nslices <= 1 else self.task.getslice(bs.traf.ntraf)
+            s   = slice(None) if sel is None else sel
 
             # FMS LNAV mode:
-            qdr, dist = geo.qdrdist(bs.traf.lat, bs.traf.lon,
-                                    bs.traf.actwp.lat, bs.traf.actwp.lon)  # [deg][nm])
+            qdr, dist = geo.qdrdist(bs.traf.lat[s], bs.traf.lon[s],
+                                    bs.traf.actwp.lat[s], bs.traf.actwp.lon[s])  # [deg][nm])
 
-            # Shift waypoints for aircraft i where necessary
-            for i in bs.traf.actwp.Reached(qdr, dist,bs.traf.actwp.flyby):
+            # Shift waypoints for aircraft where necessary
+            reached = bs.traf.actwp.Reached(qdr, dist, bs.traf.actwp.flyby[s], sel)
+            if len(reached) > 0:
                 # Save current wp speed
-                oldspd = bs.traf.actwp.spd[i]
+                oldspd = bs.traf.actwp.spd[reached]
 
                 # Get next wp (lnavon = False if no more waypoints)
-                lat, lon, alt, spd, bs.traf.actwp.xtoalt, toalt, \
-                          lnavon, flyby, bs.traf.actwp.next_qdr[i] =  \
-                       self.route[i].getnextwp()  # note: xtoalt,toalt in [m]
+                lat, lon, alt, spd, xtoalt, toalt, lnavon, flyby, \
+                    bs.traf.actwp.next_qdr[reached] = \
+                    self.routetable.getnextwp(reached, self.route)  # note: xtoalt,toalt in [m]
+                bs.traf.actwp.xtoalt[reached] = xtoalt
 
                 # End of route/no more waypoints: switch off LNAV
-                bs.traf.swlnav[i] = bs.traf.swlnav[i] and lnavon
+                swlnav = bs.traf.swlnav[reached] & lnavon
 
                 # In case of no LNAV, do not allow VNAV mode on its own
-                bs.traf.swvnav[i] = bs.traf.swvnav[i] and bs.traf.swlnav[i]
+                swvnav = bs.traf.swvnav[reached] & swlnav
 
-                bs.traf.actwp.lat[i]   = lat
-                bs.traf.actwp.lon[i]   = lon
-                bs.traf.actwp.flyby[i] = int(flyby)  # 1.0 in case of fly by, else fly over
+                bs.traf.swlnav[reached] = swlnav
+                bs.traf.swvnav[reached] = swvnav
 
-                # User has entered an altitude for this waypoint
-                if alt >= 0.:
-                    bs.traf.actwp.nextaltco[i] = alt
-
-                if spd > 0. and bs.traf.swlnav[i] and bs.traf.swvnav[i]:
-
-                    # Valid speed and LNAV and VNAV ap modes are on
-                    # Depending on crossover altitude we fix CAS or Mach
-                    if bs.traf.abco[i] and spd>2.0:
-                        bs.traf.actwp.spd[i] = cas2mach(spd,bs.traf.alt[i])
-                    
-                    elif bs.traf.belco[i] and spd<=2.0:
-                        bs.traf.actwp.spd[i] = mach2cas(spd,bs.traf.alt[i])
-                  
-                    else:  
-                        bs.traf.actwp.spd[i] = spd
+                bs.traf.actwp.lat[reached]   = lat
+                bs.traf.actwp.lon[reached]   = lon
+                bs.traf.actwp.flyby[reached] = flyby  # 1.0 in case of fly by, else fly over
 
-                else:
-                    bs.traf.actwp.spd[i] = -999.
+                # User has entered an altitude for this waypoint
+                bs.traf.actwp.nextaltco[reached] = np.where(alt >= 0., alt,
+                                                            bs.traf.actwp.nextaltco[reached])
+
+                # Valid speed and LNAV and VNAV ap modes are on
+                # Depending on crossover altitude we fix CAS or Mach
+                acalt  = bs.traf.alt[reached]
+                tomach = (bs.traf.abco[reached] > 0) & (spd > 2.0)
+                tocas  = (bs.traf.belco[reached] > 0) & (spd > 0.) & (spd <= 2.0)
+                spd[tomach] = vcas2mach(spd[tomach], acalt[tomach])
+                spd[tocas]  = vmach2cas(spd[tocas], acalt[tocas])
+                bs.traf.actwp.spd[reached] = np.where((spd > 0.) & swvnav, spd, -999.)
 
                 # VNAV spd mode: use speed of this waypoint as commanded speed
                 # while passing waypoint and save next speed for passing next wp
                 # Speed is now from speed! Next speed is ready in wpdata
-                if bs.traf.swvnav[i] and oldspd > 0.0:
-                        bs.traf.selspd[i] = oldspd
+                bs.traf.selspd[reached] = np.where(swvnav & (oldspd > 0.0), oldspd,
+                                                   bs.traf.selspd[reached])
 
                 # VNAV = FMS ALT/SPD mode
-                self.ComputeVNAV(i, toalt, bs.traf.actwp.xtoalt)
+                self.ComputeVNAV(reached, toalt, xtoalt)
 
             #=============== End of Waypoint switching loop ===================
 
             #================= Continuous FMS guidance ========================
             # Do VNAV start of descent check
-            dy = (bs.traf.actwp.lat - bs.traf.lat)
-            dx = (bs.traf.actwp.lon - bs.traf.lon) * bs.traf.coslat
+            dy = (bs.traf.actwp.lat[s] - bs.traf.lat[s])
+            dx = (bs.traf.actwp.lon[s] - bs.traf.lon[s]) * bs.traf.coslat[s]
             dist2wp   = 60. * nm * np.sqrt(dx * dx + dy * dy)
 
             # VNAV logic: descend as late as possible, climb as soon as possible
-            startdescent = bs.traf.swvnav * ((dist2wp < self.dist2vs)+(bs.traf.actwp.nextaltco > bs.traf.alt))
+            startdescent = bs.traf.swvnav[s] * ((dist2wp < self.dist2vs[s])+(bs.traf.actwp.nextaltco[s] > bs.traf.alt[s]))
 
             # If not lnav:Climb/descend if doing so before lnav/vnav was switched off
             #    (because there are no more waypoints). This is needed
             #    to continue descending when you get into a conflict
             #    while descending to the destination (the last waypoint)
             #    Use 100 nm (185.2 m) circle in case turndist might be zero
-            self.swvnavvs = np.where(bs.traf.swlnav, startdescent, dist <= np.maximum(185.2,bs.traf.actwp.turndist))
+            swvnavvs = np.where(bs.traf.swlnav[s], startdescent, dist <= np.maximum(185.2,bs.traf.actwp.turndist[s]))
+            self.swvnavvs = setsubset(self.swvnavvs, sel, swvnavvs)
 
             #Recalculate V/S based on current altitude and distance to next alt constraint
-            t2go2alt = np.maximum(0.,(dist2wp + bs.traf.actwp.xtoalt - bs.traf.actwp.turndist*nm)) \
-                                        / np.maximum(0.5,bs.traf.gs)
-                                        
-            bs.traf.actwp.vs = np.maximum(self.steepness*bs.traf.gs, \
-                                   np.abs((bs.traf.actwp.nextaltco-bs.traf.alt))/np.maximum(1.0,t2go2alt))
+            t2go2alt = np.maximum(0.,(dist2wp + bs.traf.actwp.xtoalt[s] - bs.traf.actwp.turndist[s]*nm)) \
+                                        / np.maximum(0.5,bs.traf.gs[s])
+
+            actwpvs = np.maximum(self.steepness*bs.traf.gs[s], \
+                                   np.abs((bs.traf.actwp.nextaltco[s]-bs.traf.alt[s]))/np.maximum(1.0,t2go2alt))
+            bs.traf.actwp.vs = setsubset(bs.traf.actwp.vs, sel, actwpvs)
 
-            self.vnavvs  = np.where(self.swvnavvs, bs.traf.actwp.vs, self.vnavvs)
+            self.vnavvs  = setsubset(self.vnavvs, sel, np.where(swvnavvs, actwpvs, self.vnavvs[s]))
             #was: self.vnavvs  = np.where(self.swvnavvs, self.steepness * bs.traf.gs, self.vnavvs)
 
             # self.vs = np.where(self.swvnavvs, self.vnavvs, bs.traf.apvsdef * bs.traf.limvs_flag)
-            selvs = np.where(abs(bs.traf.selvs) > 0.1, bs.traf.selvs, bs.traf.apvsdef) # m/s
-            self.vs = np.where(self.swvnavvs, self.vnavvs, selvs)
+            selvs = np.where(abs(bs.traf.selvs[s]) > 0.1, bs.traf.selvs[s], bs.traf.apvsdef[s]) # m/s
+            self.vs = setsubset(self.vs, sel, np.where(swvnavvs, self.vnavvs[s], selvs))
 
-            self.alt = np.where(self.swvnavvs, bs.traf.actwp.nextaltco, bs.traf.selalt)
+            self.alt = setsubset(self.alt, sel, np.where(swvnavvs, bs.traf.actwp.nextaltco[s], bs.traf.selalt[s]))
 
             # When descending or climbing in VNAV also update altitude command of select/hold mode
-            bs.traf.selalt = np.where(self.swvnavvs,bs.traf.actwp.nextaltco,bs.traf.selalt)
+            bs.traf.selalt = setsubset(bs.traf.selalt, sel,
+                                       np.where(swvnavvs, bs.traf.actwp.nextaltco[s], bs.traf.selalt[s]))
 
             # LNAV commanded track angle
-            self.trk = np.where(bs.traf.swlnav, qdr, self.trk)
+            self.trk = setsubset(self.trk, sel, np.where(bs.traf.swlnav[s], qdr, self.trk[s]))
 
             # FMS speed guidance: anticipate accel distance
 
             # Actual distance it takes to decelerate
-            nexttas  = vcasormach2tas(bs.traf.actwp.spd,bs.traf.alt) 
-            tasdiff  = nexttas - bs.traf.tas # [m/s]
-            dtspdchg = np.abs(tasdiff)/np.maximum(0.01,np.abs(bs.traf.ax))
-            dxspdchg = 0.5*np.sign(tasdiff)*np.abs(bs.traf.ax)*dtspdchg*dtspdchg + bs.traf.tas*dtspdchg
-            
-            usespdcon      = (dist2wp < dxspdchg)*(bs.traf.actwp.spd > 0.)*bs.traf.swvnav
-            bs.traf.selspd = np.where(usespdcon, bs.traf.actwp.spd, bs.traf.selspd)
-           
+            nexttas  = vcasormach2tas(bs.traf.actwp.spd[s],bs.traf.alt[s])
+            tasdiff  = nexttas - bs.traf.tas[s] # [m/s]
+            dtspdchg = np.abs(tasdiff)/np.maximum(0.01,np.abs(bs.traf.ax[s]))
+            dxspdchg = 0.5*np.sign(tasdiff)*np.abs(bs.traf.ax[s])*dtspdchg*dtspdchg + bs.traf.tas[s]*dtspdchg
+
+            usespdcon      = (dist2wp < dxspdchg)*(bs.traf.actwp.spd[s] > 0.)*bs.traf.swvnav[s]
+            bs.traf.selspd = setsubset(bs.traf.selspd, sel,
+                                       np.where(usespdcon, bs.traf.actwp.spd[s], bs.traf.selspd[s]))
+
+            # New guidance for all aircraft
+            idx = None
+
         # Below crossover altitude: CAS=const, above crossover altitude: Mach = const
-        self.tas = vcasormach2tas(bs.traf.selspd, bs.traf.alt)
+        i = slice(None) if idx is None else idx
+        self.tas = setsubset(self.tas, idx, vcasormach2tas(bs.traf.selspd[i], bs.traf.alt[i]))
+        return fms
 
 
     def ComputeVNAV(self, idx, toalt, xtoalt):
-        if not (toalt >= 0 and bs.traf.swvnav[idx]):
-            self.dist2vs[idx] = -999
-            return
+        """ Compute the VNAV guidance for aircraft idx. idx, toalt and xtoalt
+            can be single values or arrays. """
+        idx    = np.atleast_1d(idx)
+        toalt  = np.broadcast_to(toalt, idx.shape)
+        xtoalt = np.broadcast_to(xtoalt, idx.shape)
+
+        # Level leg, or no VNAV: never start V/S
+        vnav    = (toalt >= 0.) & bs.traf.swvnav[idx]
+        descent = vnav & (bs.traf.alt[idx] > toalt + 10. * ft)
+        climb   = vnav & (bs.traf.alt[idx] < toalt - 10. * ft)
+        self.dist2vs[idx[~(descent | climb)]] = -999.
 
         # So: somewhere there is an altitude constraint ahead
         # Compute proper values for bs.traf.actwp.nextaltco, self.dist2vs, self.alt, bs.traf.actwp.vs
@@ -213,57 +234,45 @@ class Autopilot(TrafficArrays):
         #   which can be many waypoints beyond current actual waypoint
 
 
-        # VNAV Descent mode
-        if bs.traf.alt[idx] > toalt + 10. * ft:
+        # Flat earth distance to next wp
+        alt = bs.traf.alt[idx]
+        gs  = bs.traf.gs[idx]
+        dy  = (bs.traf.actwp.lat[idx] - bs.traf.lat[idx])
+        dx  = (bs.traf.actwp.lon[idx] - bs.traf.lon[idx]) * bs.traf.coslat[idx]
+        legdist = 60. * nm * np.sqrt(dx * dx + dy * dy)  # [m]
+        t2go    = np.maximum(0.1, legdist + xtoalt) / np.maximum(0.01, gs)
 
+        # VNAV Descent mode
+        d = descent
+        i = idx[d]
 
-            #Calculate max allowed altitude at next wp (above toalt)
-            bs.traf.actwp.nextaltco[idx] = min(bs.traf.alt[idx],toalt + xtoalt * self.steepness)
-
-
-            # Dist to waypoint where descent should start
-            self.dist2vs[idx] = bs.traf.actwp.turndist[idx]*nm + \
-                               (bs.traf.alt[idx] - bs.traf.actwp.nextaltco[idx]) / self.steepness
-
-            # Flat earth distance to next wp
-            dy = (bs.traf.actwp.lat[idx] - bs.traf.lat[idx])
-            dx = (bs.traf.actwp.lon[idx] - bs.traf.lon[idx]) * bs.traf.coslat[idx]
-            legdist = 60. * nm * np.sqrt(dx * dx + dy * dy)
-
+        # Calculate max allowed altitude at next wp (above toalt)
+        nextaltco = np.minimum(alt[d], toalt[d] + xtoalt[d] * self.steepness)
+        bs.traf.actwp.nextaltco[i] = nextaltco
 
-            # If the descent is urgent, descend with maximum steepness
-            if legdist < self.dist2vs[idx]:
-                self.alt[idx] = bs.traf.actwp.nextaltco[idx]  # dial in altitude of next waypoint as calculated
+        # Dist to waypoint where descent should start
+        dist2vs = bs.traf.actwp.turndist[i] * nm + (alt[d] - nextaltco) / self.steepness
+        self.dist2vs[i] = dist2vs
 
-                t2go         = max(0.1, legdist + xtoalt) / max(0.01, bs.traf.gs[idx])
-                bs.traf.actwp.vs[idx]  = (bs.traf.actwp.nextaltco[idx] - bs.traf.alt[idx]) / t2go
+        # If the descent is urgent, descend with maximum steepness:
+        # dial in altitude of next waypoint as calculated
+        urgent = legdist[d] < dist2vs
+        self.alt[i[urgent]] = nextaltco[urgent]
 
-            else:
-                # Calculate V/S using self.steepness,
-                # protect against zero/invalid ground speed value
-                bs.traf.actwp.vs[idx] = -self.steepness * (bs.traf.gs[idx] +
-                      (bs.traf.gs[idx] < 0.2 * bs.traf.tas[idx]) * bs.traf.tas[idx])
+        # Otherwise, calculate V/S using self.steepness,
+        # protect against zero/invalid ground speed value
+        tas = bs.traf.tas[i]
+        bs.traf.actwp.vs[i] = np.where(urgent, (nextaltco - alt[d]) / t2go[d],
+                                       -self.steepness * (gs[d] + (gs[d] < 0.2 * tas) * tas))
 
         # VNAV climb mode: climb as soon as possible (T/C logic)
-        elif bs.traf.alt[idx] < toalt - 10. * ft:
-
-
-            bs.traf.actwp.nextaltco[idx] = toalt
-            self.alt[idx]          = bs.traf.actwp.nextaltco[idx]  # dial in altitude of next waypoint as calculated
-            self.dist2vs[idx]      = 9999.
-
-            # Flat earth distance to next wp
-            dy = (bs.traf.actwp.lat[idx] - bs.traf.lat[idx])
-            dx = (bs.traf.actwp.lon[idx] - bs.traf.lon[idx]) * bs.traf.coslat[idx]
-            legdist = 60. * nm * np.sqrt(dx * dx + dy * dy) # [m]
-            t2go = max(0.1, legdist+xtoalt) / max(0.01, bs.traf.gs[idx])
-            bs.traf.actwp.vs[idx]  = np.maximum(self.steepness*bs.traf.gs[idx], \
-                            (bs.traf.actwp.nextaltco[idx] - bs.traf.alt[idx])/ t2go) # [m/s]
-        # Level leg: never start V/S
-        else:
-            self.dist2vs[idx] = -999.
-
-        return
+        c = climb
+        i = idx[c]
+        bs.traf.actwp.nextaltco[i] = toalt[c]
+        self.alt[i]     = toalt[c]  # dial in altitude of next waypoint as calculated
+        self.dist2vs[i] = 9999.
+        bs.traf.actwp.vs[i] = np.maximum(self.steepness * gs[c],
+                                         (toalt[c] - alt[c]) / t2go[c])  # [m/s]
 
     def selaltcmd(self, idx, alt, vspd=None):
         """ Select altitude command: ALT acid, alt, [vspd] """
@@ -463,7 +472,3 @@ class Autopilot(TrafficArrays):
                 return False, ("VNAV " + bs.traf.id[idx] + ": no waypoints or destination specified")
         else:
             bs.traf.swvnav[idx] = False
-
-    def reset(self):
-        super(Autopilot,self).reset()
-        self.route = []
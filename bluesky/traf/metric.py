@@ -1413,19 +1413,13 @@ class Metric():
 
         print("Number of Aircraft in Research Area (FIR):" + str(self.metric[self.metric_number].ntraf))
 
-        deleteAC = []
-        for i in range(0,bs.traf.ntraf):
-            if bs.traf.selvs[i] <= 0 and (bs.traf.selalt[i]/ft) < 750 and bs.traf.selspd[i] < 300:
-                deleteAC.append(bs.traf.id[i])
-
-            elif bs.traf.selvs[i] <=0 and (bs.traf.selalt[i]/ft) < 10.:
-                deleteAC.append(bs.traf.id[i])
-
-            if bs.traf.selvs[i] <=0 and bs.traf.selspd[i] < 10.:
-                deleteAC.append(bs.traf.id[i])
+        # Delete landed aircraft in one go
+        descending = bs.traf.selvs <= 0
+        deleteAC = np.where(descending & (((bs.traf.selalt / ft < 750) & (bs.traf.selspd < 300)) |
+                                          (bs.traf.selalt / ft < 10.) |
+                                          (bs.traf.selspd < 10.)))[0]
 
-        for i in range(0,len(deleteAC)):
-            bs.traf.delete(deleteAC[i])
+        bs.traf.delete_many(deleteAC)
 
         # Heartbeat for test
         self.write(bs.sim.simt,"NTRAF;"+str(bs.traf.ntraf))
@@ -2,7 +2,8 @@
 import numpy as np
 import bluesky as bs
 from bluesky.tools.aero import kts, ft, g0, a0, T0, gamma1, gamma2,  beta, R
-from bluesky.tools.trafficarrays import TrafficArrays, RegisterElementParameters
+from bluesky.tools.trafficarrays import TrafficArrays, RegisterElementParameters, setsubset
+from bluesky.tools import scheduler
 from .performance import esf, phases, calclimits, PHASE
 from bluesky import settings
 
@@ -37,9 +38,8 @@ class PerfBADA(TrafficArrays):
         self.warned = False     # Flag: Did we warn for default perf parameters yet?
         self.warned2 = False    # Flag: Use of piston engine aircraft?
 
-        # Flight performance scheduling
-        self.dt  = 0.1           # [s] update interval of performance limits
-        self.t0  = -self.dt  # [s] last time checked (in terms of simt)
+        # Flight performance scheduling: update interval of performance limits
+        self.task = scheduler.Task('PERF', dt=0.1)
         self.warned2 = False        # Flag: Did we warn for default engine parameters yet?
 
         # Register the per-aircraft parameter arrays
@@ -69,6 +69,7 @@ class PerfBADA(TrafficArrays):
             self.mmo        = np.array([])   # max operating mach number [-]
             self.hmax       = np.array([])   # max. alt above standard MSL (ISA) at MTOW [m]
             self.hmaxact    = np.array([])   # max. alt depending on temperature gradient [m]
+            self.hact       = np.array([])   # max. alt at the current mass [m]
             self.hmo        = np.array([])   # max. operating alt abov standard MSL [m]
             self.gt         = np.array([])   # temp. gradient on max. alt [ft/k]
             self.maxthr     = np.array([])   # maximum thrust [N]
@@ -167,120 +168,126 @@ class PerfBADA(TrafficArrays):
     def create(self, n=1):
         super(PerfBADA, self).create(n)
         """CREATE NEW AIRCRAFT"""
+        # Aircraft of the same type share their coefficients, so these are
+        # looked up and set once per aircraft type
         actypes = bs.traf.type[-n:]
+        n0      = len(self.mass) - n
+        for actype in set(actypes):
+            idx = [n0 + i for i, t in enumerate(actypes) if t == actype]
+            self.setcoeffs(idx, actype)
 
+    def setcoeffs(self, idx, actype):
+        """Set the BADA coefficients of aircraft idx, which are all of type actype"""
         # note: coefficients are initialized in SI units
 
         # general
         # designate aircraft to its aircraft type
-        for actype in actypes:
-            syn, coeff = bada_coeff.getCoefficients(actype)
-            if syn:
-                continue
-
+        syn, coeff = bada_coeff.getCoefficients(actype)
+        if not syn:
             syn, coeff = bada_coeff.getCoefficients('B744')
-            bs.traf.type[-n:] = syn.accode
+            for i in idx:
+                bs.traf.type[i] = syn.accode
 
             if not settings.verbose:
                 if not self.warned:
                     print("Aircraft is using default B747-400 performance.")
                     self.warned = True
             else:
-                print("Flight " + bs.traf.id[-n:] + " has an unknown aircraft type, " + actype + ", BlueSky then uses default B747-400 performance.")
+                print("Flight " + bs.traf.id[idx[0]] + " has an unknown aircraft type, " + actype + ", BlueSky then uses default B747-400 performance.")
 
         # designate aicraft to its aircraft type
-        self.jet[-n:]       = 1 if coeff.engtype == 'Jet' else 0
-        self.turbo[-n:]     = 1 if coeff.engtype == 'Turboprop' else 0
-        self.piston[-n:]    = 1 if coeff.engtype == 'Piston' else 0
+        self.jet[idx]       = 1 if coeff.engtype == 'Jet' else 0
+        self.turbo[idx]     = 1 if coeff.engtype == 'Turboprop' else 0
+        self.piston[idx]    = 1 if coeff.engtype == 'Piston' else 0
 
         # Initial aircraft mass is currently reference mass.
         # BADA 3.12 also supports masses between 1.2*mmin and mmax
-        self.mass[-n:]      = coeff.m_ref * 1000.0
-        self.mmin[-n:]      = coeff.m_min * 1000.0
-        self.mmax[-n:]      = coeff.m_max * 1000.0
+        self.mass[idx]      = coeff.m_ref * 1000.0
+        self.mmin[idx]      = coeff.m_min * 1000.0
+        self.mmax[idx]      = coeff.m_max * 1000.0
 
         # self.mpyld = np.append(self.mpyld, coeff.mpyld[coeffidx]*1000)
-        self.gw[-n:]        = coeff.mass_grad * ft
+        self.gw[idx]        = coeff.mass_grad * ft
 
         # Surface Area [m^2]
-        self.Sref[-n:]      = coeff.S
+        self.Sref[idx]      = coeff.S
 
         # flight envelope
         # minimum speeds per phase
-        self.vmto[-n:]      = coeff.Vstall_to * coeff.CVmin_to * kts
-        self.vmic[-n:]      = coeff.Vstall_ic * coeff.CVmin * kts
-        self.vmcr[-n:]      = coeff.Vstall_cr * coeff.CVmin * kts
-        self.vmap[-n:]      = coeff.Vstall_ap * coeff.CVmin * kts
-        self.vmld[-n:]      = coeff.Vstall_ld * coeff.CVmin * kts
-        self.vmin[-n:]      = 0.0
-        self.vmo[-n:]       = coeff.VMO * kts
-        self.mmo[-n:]       = coeff.MMO
+        self.vmto[idx]      = coeff.Vstall_to * coeff.CVmin_to * kts
+        self.vmic[idx]      = coeff.Vstall_ic * coeff.CVmin * kts
+        self.vmcr[idx]      = coeff.Vstall_cr * coeff.CVmin * kts
+        self.vmap[idx]      = coeff.Vstall_ap * coeff.CVmin * kts
+        self.vmld[idx]      = coeff.Vstall_ld * coeff.CVmin * kts
+        self.vmin[idx]      = 0.0
+        self.vmo[idx]       = coeff.VMO * kts
+        self.mmo[idx]       = coeff.MMO
 
         # max. altitude parameters
-        self.hmo[-n:]       = coeff.h_MO * ft
-        self.hmax[-n:]      = coeff.h_max * ft
-        self.hmaxact[-n:]   = coeff.h_max * ft  # initialize with hmax
-        self.gt[-n:]        = coeff.temp_grad * ft
+        self.hmo[idx]       = coeff.h_MO * ft
+        self.hmax[idx]      = coeff.h_max * ft
+        self.hmaxact[idx]   = coeff.h_max * ft  # initialize with hmax
+        self.gt[idx]        = coeff.temp_grad * ft
 
         # max thrust setting
-        self.maxthr[-n:]    = 1e6  # initialize with excessive setting to avoid unrealistic limit setting
+        self.maxthr[idx]    = 1e6  # initialize with excessive setting to avoid unrealistic limit setting
 
         # Buffet Coefficients
-        self.clbo[-n:]      = coeff.Clbo
-        self.k[-n:]         = coeff.k
-        self.cm16[-n:]      = coeff.CM16
+        self.clbo[idx]      = coeff.Clbo
+        self.k[idx]         = coeff.k
+        self.cm16[idx]      = coeff.CM16
 
         # reference speeds
         # reference CAS speeds
-        self.cascl[-n:]     = coeff.CAScl1[0] * kts
-        self.cascr[-n:]     = coeff.CAScr1[0] * kts
-        self.casdes[-n:]    = coeff.CASdes1[0] * kts
+        self.cascl[idx]     = coeff.CAScl1[0] * kts
+        self.cascr[idx]     = coeff.CAScr1[0] * kts
+        self.casdes[idx]    = coeff.CASdes1[0] * kts
 
         # reference mach numbers
-        self.macl[-n:]      = coeff.Mcl[0]
-        self.macr[-n:]      = coeff.Mcr[0]
-        self.mades[-n:]     = coeff.Mdes[0]
+        self.macl[idx]      = coeff.Mcl[0]
+        self.macr[idx]      = coeff.Mcr[0]
+        self.mades[idx]     = coeff.Mdes[0]
 
         # reference speed during descent
-        self.vdes[-n:]      = coeff.Vdes_ref * kts
-        self.mdes[-n:]      = coeff.Mdes_ref
+        self.vdes[idx]      = coeff.Vdes_ref * kts
+        self.mdes[idx]      = coeff.Mdes_ref
 
         # crossover altitude for climbing and descending aircraft (BADA User Manual 3.12, p. 12)
-        self.atranscl[-n:]  = (1e3 / 6.5) * (T0 * (1.0 - (((( 1.0 + gamma1 *
-            (self.cascl[-n:] / a0) * (self.cascl[-n:] / a0)) ** gamma2) - 1.0) /
-                (((1.0 + gamma1 * self.macl[-n:] * self.macl[-n:]) ** gamma2) - 1.0)) **
+        self.atranscl[idx]  = (1e3 / 6.5) * (T0 * (1.0 - (((( 1.0 + gamma1 *
+            (self.cascl[idx] / a0) * (self.cascl[idx] / a0)) ** gamma2) - 1.0) /
+                (((1.0 + gamma1 * self.macl[idx] * self.macl[idx]) ** gamma2) - 1.0)) **
                     (-beta * R / g0)))
 
-        self.atransdes[-n:] = (1e3 / 6.5) * (T0 * (1.0 - (((( 1.0 + gamma1 *
-            (self.casdes[-n:] / a0) * (self.casdes[-n:] / a0)) ** gamma2) - 1.0) /
-                (((1.0 + gamma1 * self.mades[-n:] * self.mades[-n:]) ** gamma2) - 1.0)) **
+        self.atransdes[idx] = (1e3 / 6.5) * (T0 * (1.0 - (((( 1.0 + gamma1 *
+            (self.casdes[idx] / a0) * (self.casdes[idx] / a0)) ** gamma2) - 1.0) /
+                (((1.0 + gamma1 * self.mades[idx] * self.mades[idx]) ** gamma2) - 1.0)) **
                     (-beta * R / g0)))
 
         # aerodynamics
         # parasitic drag coefficients per phase
-        self.cd0to[-n:]     = coeff.CD0_to
-        self.cd0ic[-n:]     = coeff.CD0_ic
-        self.cd0cr[-n:]     = coeff.CD0_cr
-        self.cd0ap[-n:]     = coeff.CD0_ap
-        self.cd0ld[-n:]     = coeff.CD0_ld
-        self.gear[-n:]      = coeff.CD0_gear
+        self.cd0to[idx]     = coeff.CD0_to
+        self.cd0ic[idx]     = coeff.CD0_ic
+        self.cd0cr[idx]     = coeff.CD0_cr
+        self.cd0ap[idx]     = coeff.CD0_ap
+        self.cd0ld[idx]     = coeff.CD0_ld
+        self.gear[idx]      = coeff.CD0_gear
 
         # induced drag coefficients per phase
-        self.cd2to[-n:]     = coeff.CD2_to
-        self.cd2ic[-n:]     = coeff.CD2_ic
-        self.cd2cr[-n:]     = coeff.CD2_cr
-        self.cd2ap[-n:]     = coeff.CD2_ap
-        self.cd2ld[-n:]     = coeff.CD2_ld
+        self.cd2to[idx]     = coeff.CD2_to
+        self.cd2ic[idx]     = coeff.CD2_ic
+        self.cd2cr[idx]     = coeff.CD2_cr
+        self.cd2ap[idx]     = coeff.CD2_ap
+        self.cd2ld[idx]     = coeff.CD2_ld
 
         # reduced climb coefficient
-        self.cred[-n:] = np.where(
-            self.jet[-n:], coeff.Cred_jet,
-            np.where(self.turbo[-n:], coeff.Cred_turboprop, coeff.Cred_piston)
+        self.cred[idx] = np.where(
+            self.jet[idx], coeff.Cred_jet,
+            np.where(self.turbo[idx], coeff.Cred_turboprop, coeff.Cred_piston)
         )
 
         # commented due to vectrization
         # # NOTE: model only validated for jet and turbo aircraft
-        # if self.piston[-n:] and not self.warned2:
+        # if self.piston[idx] and not self.warned2:
         #     print "Using piston aircraft performance.",
         #     print "Not valid for real performance calculations."
         #     self.warned2 = True
@@ -288,57 +295,57 @@ class PerfBADA(TrafficArrays):
         # performance
 
         # max climb thrust coefficients
-        self.ctcth1[-n:]    = coeff.CTC[0]  # jet/piston [N], turboprop [ktN]
-        self.ctcth2[-n:]    = coeff.CTC[1]  # [ft]
-        self.ctcth3[-n:]    = coeff.CTC[2]  # jet [1/ft^2], turboprop [N], piston [ktN]
+        self.ctcth1[idx]    = coeff.CTC[0]  # jet/piston [N], turboprop [ktN]
+        self.ctcth2[idx]    = coeff.CTC[1]  # [ft]
+        self.ctcth3[idx]    = coeff.CTC[2]  # jet [1/ft^2], turboprop [N], piston [ktN]
 
         # 1st and 2nd thrust temp coefficient
-        self.ctct1[-n:]     = coeff.CTC[3]  # [k]
-        self.ctct2[-n:]     = coeff.CTC[4]  # [1/k]
-        self.dtemp[-n:]     = 0.0  # [k], difference from current to ISA temperature. At the moment: 0, as ISA environment
+        self.ctct1[idx]     = coeff.CTC[3]  # [k]
+        self.ctct2[idx]     = coeff.CTC[4]  # [1/k]
+        self.dtemp[idx]     = 0.0  # [k], difference from current to ISA temperature. At the moment: 0, as ISA environment
 
         # Descent Fuel Flow Coefficients
         # Note: Ctdes,app and Ctdes,lnd assume a 3 degree descent gradient during app and lnd
-        self.ctdesl[-n:]    = coeff.CTdes_low
-        self.ctdesh[-n:]    = coeff.CTdes_high
-        self.ctdesa[-n:]    = coeff.CTdes_app
-        self.ctdesld[-n:]   = coeff.CTdes_land
+        self.ctdesl[idx]    = coeff.CTdes_low
+        self.ctdesh[idx]    = coeff.CTdes_high
+        self.ctdesa[idx]    = coeff.CTdes_app
+        self.ctdesld[idx]   = coeff.CTdes_land
 
         # transition altitude for calculation of descent thrust
-        self.hpdes[-n:]     = coeff.Hp_des * ft
-        self.ESF[-n:]       = 1.0  # neutral initialisation
+        self.hpdes[idx]     = coeff.Hp_des * ft
+        self.ESF[idx]       = 1.0  # neutral initialisation
 
         # flight phase
-        self.phase[-n:]       = PHASE["None"]
-        self.post_flight[-n:] = False  # we assume prior
-        self.pf_flag[-n:]     = True
+        self.phase[idx]       = PHASE["None"]
+        self.post_flight[idx] = False  # we assume prior
+        self.pf_flag[idx]     = True
 
         # Thrust specific fuel consumption coefficients
         # prevent from division per zero in fuelflow calculation
-        self.cf1[-n:]       = coeff.Cf1
-        self.cf2[-n:]       = 1.0 if coeff.Cf2 < 1e-9 else coeff.Cf2
-        self.cf3[-n:]       = coeff.Cf3
-        self.cf4[-n:]       = 1.0 if coeff.Cf4 < 1e-9 else coeff.Cf4
-        self.cf_cruise[-n:] = coeff.Cf_cruise
+        self.cf1[idx]       = coeff.Cf1
+        self.cf2[idx]       = 1.0 if coeff.Cf2 < 1e-9 else coeff.Cf2
+        self.cf3[idx]       = coeff.Cf3
+        self.cf4[idx]       = 1.0 if coeff.Cf4 < 1e-9 else coeff.Cf4
+        self.cf_cruise[idx] = coeff.Cf_cruise
 
-        self.Thr[-n:]       = 0.0
-        self.D[-n:]         = 0.0
-        self.ff[-n:]        = 0.0
+        self.Thr[idx]       = 0.0
+        self.D[idx]         = 0.0
+        self.ff[idx]        = 0.0
 
         # ground
-        self.tol[-n:]       = coeff.TOL
-        self.ldl[-n:]       = coeff.LDL
-        self.ws[-n:]        = coeff.wingspan
-        self.len[-n:]       = coeff.length
+        self.tol[idx]       = coeff.TOL
+        self.ldl[idx]       = coeff.LDL
+        self.ws[idx]        = coeff.wingspan
+        self.len[idx]       = coeff.length
         # for now, BADA aircraft have the same acceleration as deceleration
-        self.gr_acc[-n:]    = coeff.gr_acc
+        self.gr_acc[idx]    = coeff.gr_acc
 
-    def perf(self, simt):
-        if abs(simt - self.t0) >= self.dt:
-            self.t0 = simt
-        else:
+    def perf(self, simt, idx=None):
+        if not self.task.due(simt):
             return
         """AIRCRAFT PERFORMANCE"""
+        # The BADA model always updates all aircraft (idx is not used),
+        # because the mass of each aircraft is integrated here
         # BADA version
         swbada = True
         # flight phase
@@ -550,8 +557,8 @@ class PerfBADA(TrafficArrays):
         # fuel flow for each condition
         self.ff = np.maximum.reduce([ffto, ffic, ffcc, ffcrl, ffcd, ffap, ffld, ffgd])/60. # convert from kg/min to kg/sec
 
-        # update mass
-        self.mass = self.mass - self.ff*self.dt # Use fuelflow in kg/min
+        # update mass, with the fuel burnt since the previous update
+        self.mass = self.mass - self.ff*self.task.elapsed
 
 
 
@@ -571,66 +578,82 @@ class PerfBADA(TrafficArrays):
         return
 
 
-    def limits(self):
-        """FLIGHT ENVELPOE"""
+    def limits(self, idx=None):
+        """FLIGHT ENVELPOE of aircraft idx (default: all aircraft)"""
+        i     = slice(None) if idx is None else idx
+        phase = self.phase[i]
+        vmic  = self.vmic[i]
+
         # summarize minimum speeds - ac in ground mode might be pushing back
-        self.vmin =  (self.phase == 1) * self.vmto + (self.phase == 2) * self.vmic + (self.phase == 3) * self.vmcr + \
-        (self.phase == 4) * self.vmap + (self.phase == 5) * self.vmld + (self.phase == 6) * -10.
+        vmin =  (phase == 1) * self.vmto[i] + (phase == 2) * vmic + (phase == 3) * self.vmcr[i] + \
+        (phase == 4) * self.vmap[i] + (phase == 5) * self.vmld[i] + (phase == 6) * -10.
+        self.vmin = setsubset(self.vmin, idx, vmin)
 
         # maximum altitude: hmax/act = MIN[hmo, hmax+gt*(dtemp-ctc1)+gw*(mmax-mact)]
         #                   or hmo if hmx ==0 ()
         # at the moment just ISA atmosphere, dtemp  = 0
-        c1 = self.dtemp - self.ctct1
+        c1 = self.dtemp[i] - self.ctct1[i]
 
         # if c1<0: c1 = 0
         # values above 0 remain, values below are replaced through 0
         c1m = np.array(c1<0)*0.00000000000001
         c1def = np.maximum(c1, c1m)
 
-        self.hact = self.hmax+self.gt*c1def+self.gw*(self.mmax-self.mass)
+        hmax = self.hmax[i]
+        hmo  = self.hmo[i]
+        hact = hmax+self.gt[i]*c1def+self.gw[i]*(self.mmax[i]-self.mass[i])
         # if hmax in OPF File ==0: hmaxact = hmo, else minimum(hmo, hmact)
-        self.hmaxact = (self.hmax==0)*self.hmo +(self.hmax !=0)*np.minimum(self.hmo, self.hact)
+        hmaxact = (hmax==0)*hmo +(hmax !=0)*np.minimum(hmo, hact)
+        self.hact    = setsubset(self.hact, idx, hact)
+        self.hmaxact = setsubset(self.hmaxact, idx, hmaxact)
 
         # forwarding to tools
-        # forwarding to tools
-        bs.traf.limspd,          \
-        bs.traf.limspd_flag,     \
-        bs.traf.limalt,          \
-        bs.traf.limalt_flag,      \
-        bs.traf.limvs,           \
-        bs.traf.limvs_flag  =  calclimits(bs.traf.pilot.tas,   \
-                                        bs.traf.gs,            \
-                                        self.vmto,             \
-                                        self.vmin,             \
-                                        self.vmo,              \
-                                        self.mmo,              \
-                                        bs.traf.M,             \
-                                        bs.traf.alt,           \
-                                        bs.traf.pilot.alt,     \
-                                        self.hmaxact,          \
-                                        bs.traf.pilot.vs,      \
-                                        self.maxthr,           \
-                                        self.D,                \
-                                        bs.traf.tas,           \
-                                        self.mass,             \
-                                        self.ESF,              \
-                                        self.phase)
+        limspd, limspd_flag, limalt, limalt_flag, limvs, limvs_flag = \
+                            calclimits(bs.traf.pilot.tas[i],   \
+                                        bs.traf.gs[i],         \
+                                        self.vmto[i],          \
+                                        vmin,                  \
+                                        self.vmo[i],           \
+                                        self.mmo[i],           \
+                                        bs.traf.M[i],          \
+                                        bs.traf.alt[i],        \
+                                        bs.traf.pilot.alt[i],  \
+                                        hmaxact,               \
+                                        bs.traf.pilot.vs[i],   \
+                                        self.maxthr[i],        \
+                                        self.D[i],             \
+                                        bs.traf.tas[i],        \
+                                        self.mass[i],          \
+                                        self.ESF[i],           \
+                                        phase)
+
+        bs.traf.limspd      = setsubset(bs.traf.limspd, idx, limspd)
+        bs.traf.limspd_flag = setsubset(bs.traf.limspd_flag, idx, limspd_flag)
+        bs.traf.limalt      = setsubset(bs.traf.limalt, idx, limalt)
+        bs.traf.limalt_flag = setsubset(bs.traf.limalt_flag, idx, limalt_flag)
+        bs.traf.limvs       = setsubset(bs.traf.limvs, idx, limvs)
+        bs.traf.limvs_flag  = setsubset(bs.traf.limvs_flag, idx, limvs_flag)
 
         return
 
-    def acceleration(self, simdt):
+    def acceleration(self, simdt, idx=None):
         # define acceleration: aircraft taxiing and taking off use ground acceleration,
         # landing aircraft use ground deceleration, others use standard acceleration
         # --> BADA uses the same value for ground acceleration as for deceleration
-    
-
-        ax = ((self.phase==PHASE['IC']) + (self.phase==PHASE['CR']) + \
-                     (self.phase==PHASE['AP']) + (self.phase==PHASE['LD']) )                         \
-                 * np.minimum(abs(bs.traf.delspd / max(1e-8,simdt)), bs.traf.ax) + \
-             ((self.phase==PHASE['TO']) + (self.phase==PHASE['GD'])*(1-self.post_flight))      \
-                 * np.minimum(abs(bs.traf.delspd / max(1e-8,simdt)), self.gr_acc) +  \
-              (self.phase==PHASE['GD'])*self.post_flight                                        \
-                 * np.minimum(abs(bs.traf.delspd / max(1e-8,simdt)), self.gr_acc)
+        # (for aircraft idx, default: all aircraft)
+        i           = slice(None) if idx is None else idx
+        phase       = self.phase[i]
+        post_flight = self.post_flight[i]
+        delspd      = bs.traf.delspd[i]
+        gr_acc      = self.gr_acc[i]
+
+        ax = ((phase==PHASE['IC']) + (phase==PHASE['CR']) + \
+                     (phase==PHASE['AP']) + (phase==PHASE['LD']) )                         \
+                 * np.minimum(abs(delspd / max(1e-8,simdt)), bs.traf.ax[i]) + \
+             ((phase==PHASE['TO']) + (phase==PHASE['GD'])*(1-post_flight))      \
+                 * np.minimum(abs(delspd / max(1e-8,simdt)), gr_acc) +  \
+              (phase==PHASE['GD'])*post_flight                                        \
+                 * np.minimum(abs(delspd / max(1e-8,simdt)), gr_acc)
 
         return ax
 
@@ -7,7 +7,8 @@ import numpy as np
 import bluesky as bs
 from bluesky.tools.aero import ft, g0, a0, T0, rho0, gamma1, gamma2,  beta, R, \
     kts, lbs, inch, sqft, fpm, vtas2cas
-from bluesky.tools.trafficarrays import TrafficArrays, RegisterElementParameters
+from bluesky.tools.trafficarrays import TrafficArrays, RegisterElementParameters, setsubset
+from bluesky.tools import scheduler
 from .performance import esf, phases, calclimits, PHASE
 from bluesky import settings
 
@@ -27,9 +28,9 @@ class PerfBS(TrafficArrays):
         # prepare for coefficient readin
         coeffBS.coeff()
 
-        # Flight performance scheduling
-        self.dt  = 0.1           # [s] update interval of performance limits
-        self.t0  = -self.dt  # [s] last time checked (in terms of simt)
+        # Flight performance scheduling: update interval of performance limits.
+        # Can be updated in slices.
+        self.task = scheduler.Task('PERF', dt=0.1, sliceable=True)
         
         with RegisterElementParameters(self):
             # index of aircraft types in library
@@ -98,7 +99,9 @@ class PerfBS(TrafficArrays):
                                               #taxi prior of after flight
             self.pf_flag      = np.array([])
 
-        self.engines      = []           # avaliable engine type per aircraft type
+            # avaliable engine types per aircraft
+            self.engines      = []
+
         self.eta          = 0.8          # propeller efficiency according to Raymer
         self.Thr_s        = np.array([1., 0.85, 0.07, 0.3 ]) # Thrust settings per flight phase according to ICAO
 
@@ -130,9 +133,8 @@ class PerfBS(TrafficArrays):
         self.Sref[-n:]              = coeffBS.Sref[coeffidx] # wing surface reference area
         self.etype[-n:]             = coeffBS.etype[coeffidx] # engine type of current aircraft
 
-        #self.engines is a list of list, not part of the RegisterElementParameters
-        for c in coeffidx:
-            self.engines.append(coeffBS.engines[c]) # avaliable engine type per aircraft type
+        # avaliable engine type per aircraft type
+        self.engines[-n:] = [coeffBS.engines[c] for c in coeffidx]
 
         # speeds
         self.refma[-n:]             = coeffBS.cr_Ma[coeffidx] # nominal cruise Mach at 35000 ft
@@ -201,108 +203,121 @@ class PerfBS(TrafficArrays):
         self.ffap[-n:]      = np.where(turboprops, 1. , coeffBS.ffap[jetidx]*coeffBS.n_eng[coeffidx])
         return
 
-    def delete(self,idx):
-        super(PerfBS,self).delete(idx)
-        del self.engines[idx]
+    def perf(self, simt, idx=None):
+        """Aircraft performance of aircraft idx (default: all aircraft)"""
+        if not self.task.due(simt):
+            return
 
-    def reset(self):
-        super(PerfBS,self).reset()
-        self.engines = []
+        swbada = False # no-bada version
 
-    def perf(self,simt):
-        if abs(simt - self.t0) >= self.dt:
-            self.t0 = simt
+        # Aircraft to update: all, or the current slice of the task
+        if idx is None:
+            sl = self.task.getslice(bs.traf.ntraf)
         else:
-            return
-        """Aircraft performance"""
-        swbada = False # no-bada version
+            sl = idx[self.task.getslice(len(idx))]
+
+        alt    = bs.traf.alt[sl]
+        tas    = bs.traf.tas[sl]
+        rho    = bs.traf.rho[sl]
+        delalt = bs.traf.delalt[sl]
+        mass   = self.mass[sl]
+        etype  = self.etype[sl]
 
         # allocate aircraft to their flight phase
-        self.phase, self.bank = \
-           phases(bs.traf.alt, bs.traf.gs, bs.traf.delalt, \
-           bs.traf.cas, self.vmto, self.vmic, self.vmap, self.vmcr, self.vmld, bs.traf.bank, bs.traf.bphase, \
-           bs.traf.swhdgsel,swbada)
+        # (phases() sets the bank angles in place, so these are copied back
+        # when sl is an index array)
+        bank = bs.traf.bank[sl]
+        self.phase[sl], self.bank[sl] = \
+           phases(alt, bs.traf.gs[sl], delalt, \
+           bs.traf.cas[sl], self.vmto[sl], self.vmic[sl], self.vmap[sl], self.vmcr[sl], self.vmld[sl], \
+           bank, bs.traf.bphase, bs.traf.swhdgsel[sl], swbada)
+        bs.traf.bank[sl] = bank
+        phase = self.phase[sl]
 
         # AERODYNAMICS
         # compute CL: CL = 2*m*g/(VTAS^2*rho*S)
-        self.qS = 0.5*bs.traf.rho*np.maximum(1.,bs.traf.tas)*np.maximum(1.,bs.traf.tas)*self.Sref
+        self.qS[sl] = 0.5*rho*np.maximum(1.,tas)*np.maximum(1.,tas)*self.Sref[sl]
+        qS = self.qS[sl]
 
-        cl = self.mass*g0/(self.qS*np.cos(self.bank))*(self.phase!=6)+ 0.*(self.phase==6)
+        cl = mass*g0/(qS*np.cos(self.bank[sl]))*(phase!=6)+ 0.*(phase==6)
 
         # scaling factors for CD0 and CDi during flight phases according to FAA (2005): SAGE, V. 1.5, Technical Manual
 
-        CD0f = (self.phase==1)*(self.etype==1)*coeffBS.d_CD0j[0] + \
-               (self.phase==2)*(self.etype==1)*coeffBS.d_CD0j[1]  + \
-               (self.phase==3)*(self.etype==1)*coeffBS.d_CD0j[2] + \
-               (self.phase==4)*(self.etype==1)*coeffBS.d_CD0j[3] + \
-               (self.phase==5)*(self.etype==1)*(bs.traf.alt>=450)*coeffBS.d_CD0j[4] + \
-               (self.phase==5)*(self.etype==1)*(bs.traf.alt<450)*coeffBS.d_CD0j[5] + \
-               (self.phase==1)*(self.etype==2)*coeffBS.d_CD0t[0] + \
-               (self.phase==2)*(self.etype==2)*coeffBS.d_CD0t[1]  + \
-               (self.phase==3)*(self.etype==2)*coeffBS.d_CD0t[2] + \
-               (self.phase==4)*(self.etype==2)*coeffBS.d_CD0t[3]
-                   # (self.phase==5)*(self.etype==2)*(self.alt>=450)*coeffBS.d_CD0t[4] + \
-                   # (self.phase==5)*(self.etype==2)*(self.alt<450)*coeffBS.d_CD0t[5]
-
-        kf =   (self.phase==1)*(self.etype==1)*coeffBS.d_kj[0] + \
-               (self.phase==2)*(self.etype==1)*coeffBS.d_kj[1]  + \
-               (self.phase==3)*(self.etype==1)*coeffBS.d_kj[2] + \
-               (self.phase==4)*(self.etype==1)*coeffBS.d_kj[3] + \
-               (self.phase==5)*(self.etype==1)*(bs.traf.alt>=450)*coeffBS.d_kj[4] + \
-               (self.phase==5)*(self.etype==1)*(bs.traf.alt<450)*coeffBS.d_kj[5] + \
-               (self.phase==1)*(self.etype==2)*coeffBS.d_kt[0] + \
-               (self.phase==2)*(self.etype==2)*coeffBS.d_kt[1]  + \
-               (self.phase==3)*(self.etype==2)*coeffBS.d_kt[2] + \
-               (self.phase==4)*(self.etype==2)*coeffBS.d_kt[3] + \
-               (self.phase==5)*(self.etype==2)*(bs.traf.alt>=450)*coeffBS.d_kt[4] + \
-               (self.phase==5)*(self.etype==2)*(bs.traf.alt<450)*coeffBS.d_kt[5]
+        CD0f = (phase==1)*(etype==1)*coeffBS.d_CD0j[0] + \
+               (phase==2)*(etype==1)*coeffBS.d_CD0j[1]  + \
+               (phase==3)*(etype==1)*coeffBS.d_CD0j[2] + \
+               (phase==4)*(etype==1)*coeffBS.d_CD0j[3] + \
+               (phase==5)*(etype==1)*(alt>=450)*coeffBS.d_CD0j[4] + \
+               (phase==5)*(etype==1)*(alt<450)*coeffBS.d_CD0j[5] + \
+               (phase==1)*(etype==2)*coeffBS.d_CD0t[0] + \
+               (phase==2)*(etype==2)*coeffBS.d_CD0t[1]  + \
+               (phase==3)*(etype==2)*coeffBS.d_CD0t[2] + \
+               (phase==4)*(etype==2)*coeffBS.d_CD0t[3]
+                   # (phase==5)*(etype==2)*(alt>=450)*coeffBS.d_CD0t[4] + \
+                   # (phase==5)*(etype==2)*(alt<450)*coeffBS.d_CD0t[5]
+
+        kf =   (phase==1)*(etype==1)*coeffBS.d_kj[0] + \
+               (phase==2)*(etype==1)*coeffBS.d_kj[1]  + \
+               (phase==3)*(etype==1)*coeffBS.d_kj[2] + \
+               (phase==4)*(etype==1)*coeffBS.d_kj[3] + \
+               (phase==5)*(etype==1)*(alt>=450)*coeffBS.d_kj[4] + \
+               (phase==5)*(etype==1)*(alt<450)*coeffBS.d_kj[5] + \
+               (phase==1)*(etype==2)*coeffBS.d_kt[0] + \
+               (phase==2)*(etype==2)*coeffBS.d_kt[1]  + \
+               (phase==3)*(etype==2)*coeffBS.d_kt[2] + \
+               (phase==4)*(etype==2)*coeffBS.d_kt[3] + \
+               (phase==5)*(etype==2)*(alt>=450)*coeffBS.d_kt[4] + \
+               (phase==5)*(etype==2)*(alt<450)*coeffBS.d_kt[5]
 
 
         # drag coefficient
-        cd = self.CD0*CD0f + self.k*kf*(cl*cl)
+        cd = self.CD0[sl]*CD0f + self.k[sl]*kf*(cl*cl)
 
         # compute drag: CD = CD0 + CDi * CL^2 and D = rho/2*VTAS^2*CD*S
-        self.D = cd*self.qS
+        self.D[sl] = cd*qS
 
         # energy share factor and crossover altitude
-        epsalt = np.array([0.001]*bs.traf.ntraf)
-        self.climb = np.array(bs.traf.delalt > epsalt)
-        self.descent = np.array(bs.traf.delalt< -epsalt)
+        epsalt  = 0.001
+        climb   = np.array(delalt > epsalt)
+        descent = np.array(delalt< -epsalt)
 
 
         # crossover altitiude
-        bs.traf.abco = np.array(bs.traf.alt>self.atrans)
-        bs.traf.belco = np.array(bs.traf.alt<self.atrans)
+        bs.traf.abco[sl] = np.array(alt>self.atrans[sl])
+        bs.traf.belco[sl] = np.array(alt<self.atrans[sl])
 
         # energy share factor
-        self.ESF = esf(bs.traf.abco, bs.traf.belco, bs.traf.alt, bs.traf.M,\
-                  self.climb, self.descent, bs.traf.delspd)
+        self.ESF[sl] = esf(bs.traf.abco[sl], bs.traf.belco[sl], alt, bs.traf.M[sl],\
+                  climb, descent, bs.traf.delspd[sl])
+        ESF = self.ESF[sl]
 
         # determine thrust
-        self.Thr = (((bs.traf.vs*self.mass*g0)/(self.ESF*np.maximum(bs.traf.eps, bs.traf.tas))) + self.D)
-        
+        eps = bs.traf.eps[sl]
+        self.Thr[sl] = (((bs.traf.vs[sl]*mass*g0)/(ESF*np.maximum(eps, tas))) + self.D[sl])
+        Thr = self.Thr[sl]
+
         # determine thrust required to fulfill requests from pilot
-        self.Thr_pilot = (((bs.traf.pilot.vs*self.mass*g0)/(self.ESF*np.maximum(bs.traf.eps, bs.traf.pilot.tas))) + self.D)
+        self.Thr_pilot[sl] = (((bs.traf.pilot.vs[sl]*mass*g0)/(ESF*np.maximum(eps, bs.traf.pilot.tas[sl]))) + self.D[sl])
 
         # maximum thrust jet (Bruenig et al., p. 66):
-        mt_jet = self.rThr*(bs.traf.rho/rho0)**0.75
+        mt_jet = self.rThr[sl]*(rho/rho0)**0.75
 
         # maximum thrust prop (Raymer, p.36):
-        mt_prop = self.P*self.eta/np.maximum(bs.traf.eps, bs.traf.tas)
+        mt_prop = self.P[sl]*self.eta/np.maximum(eps, tas)
 
         # merge
-        self.maxthr = mt_jet*(self.etype==1) + mt_prop*(self.etype==2)
+        self.maxthr[sl] = mt_jet*(etype==1) + mt_prop*(etype==2)
 
         # Fuel Flow
 
         # jet aircraft
         # ratio current thrust/rated thrust
-        pThr = self.Thr/self.rThr
+        pThr = Thr/self.rThr[sl]
         # fuel flow is assumed to be proportional to thrust(Torenbeek, p.62).
         #For ground operations, idle thrust is used
         # cruise thrust is approximately equal to approach thrust
-        ff_jet = ((pThr*self.ffto)*(self.phase!=6)*(self.phase!=3)+ \
-        self.ffid*(self.phase==6) + self.ffap*(self.phase==3) )*(self.etype==1)
+        ff_jet = ((pThr*self.ffto[sl])*(phase!=6)*(phase!=3)+ \
+        self.ffid[sl]*(phase==6) + self.ffap[sl]*(phase==3) )*(etype==1)
         # print "FFJET",  (pThr*self.ffto)*(self.phase!=6)*(self.phase!=3), self.ffid*(self.phase==6), self.ffap*(self.phase==3)
         # print "FFJET", ff_jet
 
@@ -310,17 +325,17 @@ class PerfBS(TrafficArrays):
         # to be refined - f(spd)
         # CRUISE-ALTITUDE!!!
         # above cruise altitude: PSFC_CR
-        PSFC = (((self.PSFC_CR - self.PSFC_TO) / 20000.0)*bs.traf.alt + self.PSFC_TO)*(bs.traf.alt<20.000) + \
-                self.PSFC_CR*(bs.traf.alt >= 20.000)
+        PSFC = (((self.PSFC_CR[sl] - self.PSFC_TO[sl]) / 20000.0)*alt + self.PSFC_TO[sl])*(alt<20.000) + \
+                self.PSFC_CR[sl]*(alt >= 20.000)
 
-        TSFC = PSFC*bs.traf.tas/(550.0*self.eta)
+        TSFC = PSFC*tas/(550.0*self.eta)
 
         # formula p.36 Raymer is missing here!
-        ff_prop = self.Thr*TSFC*(self.etype==2)
+        ff_prop = Thr*TSFC*(etype==2)
 
 
         # combine
-        self.ff = ff_jet + ff_prop
+        self.ff[sl] = ff_jet + ff_prop
 
         # update mass
         #self.mass = self.mass - self.ff*self.dt/60. # Use fuelflow in kg/min
@@ -333,73 +348,89 @@ class PerfBS(TrafficArrays):
 
         # for aircraft on the runway and taxiways we need to know, whether they
         # are prior or after their flight
-        self.post_flight = np.where(self.descent, True, self.post_flight)
+        self.post_flight[sl] = np.where(descent, True, self.post_flight[sl])
 
         # when landing, we would like to stop the aircraft.
-        bs.traf.pilot.tas = np.where((bs.traf.alt <0.5)*(self.post_flight)*self.pf_flag, 0.0, bs.traf.pilot.tas)
+        landed = (alt <0.5)*(self.post_flight[sl])
+        bs.traf.pilot.tas[sl] = np.where(landed*self.pf_flag[sl], 0.0, bs.traf.pilot.tas[sl])
         # the impulse for reducing the speed to 0 should only be given once,
         # otherwise taxiing will be impossible afterwards
-        self.pf_flag = np.where ((bs.traf.alt <0.5)*(self.post_flight), False, self.pf_flag)
+        self.pf_flag[sl] = np.where (landed, False, self.pf_flag[sl])
 
         return
 
-    def limits(self):
-        """Flight envelope""" # Connect this with function limits in performance.py
+    def limits(self, idx=None):
+        """Flight envelope of aircraft idx (default: all aircraft)""" # Connect this with function limits in performance.py
+        i     = slice(None) if idx is None else idx
+        mass  = self.mass[i]
+        rho   = bs.traf.rho[i]
+        alt   = bs.traf.alt[i]
+        phase = self.phase[i]
 
         # combine minimum speeds and flight phases. Phases initial climb, cruise
         # and approach use the same CLmax and thus the same function for Vmin
-        self.vmto = self.vm_to*np.sqrt(self.mass/bs.traf.rho)
-        self.vmic = np.sqrt(2*self.mass*g0/(bs.traf.rho*self.clmaxcr*self.Sref))
+        vmto = self.vm_to[i]*np.sqrt(mass/rho)
+        vmic = np.sqrt(2*mass*g0/(rho*self.clmaxcr[i]*self.Sref[i]))
+        vmld = self.vm_ld[i]*np.sqrt(mass/rho)
+        self.vmto = setsubset(self.vmto, idx, vmto)
+        self.vmic = setsubset(self.vmic, idx, vmic)
         self.vmcr = self.vmic
         self.vmap = self.vmic
-        self.vmld = self.vm_ld*np.sqrt(self.mass/bs.traf.rho)
+        self.vmld = setsubset(self.vmld, idx, vmld)
 
         # summarize and convert to cas
         # note: aircraft on ground may be pushed back
-        self.vmin = (self.phase==1)*vtas2cas(self.vmto, bs.traf.alt) + \
-                        ((self.phase==2) + (self.phase==3) + (self.phase==4))*vtas2cas(self.vmcr, bs.traf.alt) + \
-                            (self.phase==5)*vtas2cas(self.vmld, bs.traf.alt) + (self.phase==6)*-10.0
-
+        vmin = (phase==1)*vtas2cas(vmto, alt) + \
+                   ((phase==2) + (phase==3) + (phase==4))*vtas2cas(vmic, alt) + \
+                       (phase==5)*vtas2cas(vmld, alt) + (phase==6)*-10.0
+        self.vmin = setsubset(self.vmin, idx, vmin)
 
         # forwarding to tools
-        bs.traf.limspd,          \
-        bs.traf.limspd_flag,     \
-        bs.traf.limalt,          \
-        bs.traf.limalt_flag,     \
-        bs.traf.limvs,           \
-        bs.traf.limvs_flag  =  calclimits(bs.traf.pilot.tas, \
-                                        bs.traf.gs,          \
-                                        self.vmto,           \
-                                        self.vmin,           \
-                                        self.vmo,            \
-                                        self.mmo,            \
-                                        bs.traf.M,           \
-                                        bs.traf.alt,         \
-                                        self.hmaxact,        \
-                                        bs.traf.pilot.alt,   \
-                                        bs.traf.pilot.vs,    \
-                                        self.maxthr,         \
-                                        self.Thr_pilot,      \
-                                        self.D,              \
-                                        bs.traf.tas,         \
-                                        self.mass,           \
-                                        self.ESF,            \
-                                        self.phase)
-
+        limspd, limspd_flag, limalt, limalt_flag, limvs, limvs_flag = \
+                            calclimits(bs.traf.pilot.tas[i], \
+                                        bs.traf.gs[i],       \
+                                        vmto,                \
+                                        vmin,                \
+                                        self.vmo[i],         \
+                                        self.mmo[i],         \
+                                        bs.traf.M[i],        \
+                                        alt,                 \
+                                        self.hmaxact[i],     \
+                                        bs.traf.pilot.alt[i], \
+                                        bs.traf.pilot.vs[i], \
+                                        self.maxthr[i],      \
+                                        self.Thr_pilot[i],   \
+                                        self.D[i],           \
+                                        bs.traf.tas[i],      \
+                                        mass,                \
+                                        self.ESF[i],         \
+                                        phase)
+
+        bs.traf.limspd      = setsubset(bs.traf.limspd, idx, limspd)
+        bs.traf.limspd_flag = setsubset(bs.traf.limspd_flag, idx, limspd_flag)
+        bs.traf.limalt      = setsubset(bs.traf.limalt, idx, limalt)
+        bs.traf.limalt_flag = setsubset(bs.traf.limalt_flag, idx, limalt_flag)
+        bs.traf.limvs       = setsubset(bs.traf.limvs, idx, limvs)
+        bs.traf.limvs_flag  = setsubset(bs.traf.limvs_flag, idx, limvs_flag)
 
         return
 
-    def acceleration(self, simdt):
+    def acceleration(self, simdt, idx=None):
         # define acceleration: aircraft taxiing and taking off use ground acceleration,
         # landing aircraft use ground deceleration, others use standard acceleration
-
-        ax = ((self.phase==PHASE['IC']) + (self.phase==PHASE['CR']) + \
-                     (self.phase==PHASE['AP']) + (self.phase==PHASE['LD']) )                         \
-                 * np.minimum(abs(bs.traf.delspd / max(1e-8,simdt)), bs.traf.ax) + \
-             ((self.phase==PHASE['TO']) + (self.phase==PHASE['GD'])*(1-self.post_flight))      \
-                 * np.minimum(abs(bs.traf.delspd / max(1e-8,simdt)), self.gr_acc) +  \
-              (self.phase==PHASE['GD'])*self.post_flight                                        \
-                 * np.minimum(abs(bs.traf.delspd / max(1e-8,simdt)), self.gr_dec)
+        # (for aircraft idx, default: all aircraft)
+        i           = slice(None) if idx is None else idx
+        phase       = self.phase[i]
+        post_flight = self.post_flight[i]
+        delspd      = bs.traf.delspd[i]
+
+        ax = ((phase==PHASE['IC']) + (phase==PHASE['CR']) + \
+                     (phase==PHASE['AP']) + (phase==PHASE['LD']) )                         \
+                 * np.minimum(abs(delspd / max(1e-8,simdt)), bs.traf.ax[i]) + \
+             ((phase==PHASE['TO']) + (phase==PHASE['GD'])*(1-post_flight))      \
+                 * np.minimum(abs(delspd / max(1e-8,simdt)), self.gr_acc[i]) +  \
+              (phase==PHASE['GD'])*post_flight                                        \
+                 * np.minimum(abs(delspd / max(1e-8,simdt)), self.gr_dec[i])
 
 
         return ax
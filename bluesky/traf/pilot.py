@@ -2,7 +2,7 @@
 import numpy as np
 import bluesky as bs
 from bluesky.tools.aero import vtas2eas, vcas2tas, vcas2mach, vtas2cas
-from bluesky.tools.trafficarrays import TrafficArrays, RegisterElementParameters
+from bluesky.tools.trafficarrays import TrafficArrays, RegisterElementParameters, setsubset
 
 
 class Pilot(TrafficArrays):
@@ -24,56 +24,67 @@ class Pilot(TrafficArrays):
         self.hdg[-n:] = bs.traf.hdg[-n:]
         self.trk[-n:] = bs.traf.trk[-n:]
 
-    def APorASAS(self):
+    def APorASAS(self, idx=None):
+        """ Select the AP or ASAS targets for aircraft idx (default: all). """
+        i = slice(None) if idx is None else idx
+        traf = bs.traf
+        asas = traf.asas
+
         #--------- Input to Autopilot settings to follow: destination or ASAS ----------
         # Convert the ASAS commanded speed from ground speed to TAS
-        if bs.traf.wind.winddim > 0:
-            vwn, vwe     = bs.traf.wind.getdata(bs.traf.lat, bs.traf.lon, bs.traf.alt)
-            asastasnorth = bs.traf.asas.tas * np.cos(np.radians(bs.traf.asas.trk)) - vwn
-            asastaseast  = bs.traf.asas.tas * np.sin(np.radians(bs.traf.asas.trk)) - vwe
+        if traf.wind.winddim > 0:
+            vwn, vwe     = traf.wind.getdata(traf.lat[i], traf.lon[i], traf.alt[i])
+            asastasnorth = asas.tas[i] * np.cos(np.radians(asas.trk[i])) - vwn
+            asastaseast  = asas.tas[i] * np.sin(np.radians(asas.trk[i])) - vwe
             asastas      = np.sqrt(asastasnorth**2 + asastaseast**2)
         # no wind, then ground speed = TAS
         else:
-            asastas = bs.traf.asas.tas # TAS [m/s]
+            asastas = asas.tas[i] # TAS [m/s]
 
         # Determine desired states from ASAS or AP. Select asas if there is a conflict AND resolution is on.
-        self.trk = np.where(bs.traf.asas.active, bs.traf.asas.trk, bs.traf.ap.trk)
-        self.tas = np.where(bs.traf.asas.active, asastas, bs.traf.ap.tas)
-        self.alt = np.where(bs.traf.asas.active, bs.traf.asas.alt, bs.traf.ap.alt)
-        self.vs  = np.where(bs.traf.asas.active, bs.traf.asas.vs, bs.traf.ap.vs)
+        active = asas.active[i]
+        trk = np.where(active, asas.trk[i], traf.ap.trk[i])
+        self.trk = setsubset(self.trk, idx, trk)
+        self.tas = setsubset(self.tas, idx, np.where(active, asastas, traf.ap.tas[i]))
+        self.alt = setsubset(self.alt, idx, np.where(active, asas.alt[i], traf.ap.alt[i]))
 
         # ASAS can give positive and negative VS, but the sign of VS is determined using delalt in Traf.ComputeAirSpeed
         # Therefore, ensure that pilot.vs is always positive to prevent opposite signs of delalt and VS in Traf.ComputeAirSpeed
-        self.vs = np.abs(self.vs)
+        self.vs  = setsubset(self.vs, idx, np.abs(np.where(active, asas.vs[i], traf.ap.vs[i])))
 
         # Compute the desired heading needed to compensate for the wind
-        if bs.traf.wind.winddim > 0:
+        if traf.wind.winddim > 0:
 
             # Calculate wind correction
-            vwn, vwe = bs.traf.wind.getdata(bs.traf.lat, bs.traf.lon, bs.traf.alt)
+            vwn, vwe = traf.wind.getdata(traf.lat[i], traf.lon[i], traf.alt[i])
             Vw       = np.sqrt(vwn * vwn + vwe * vwe)
             winddir  = np.arctan2(vwe, vwn)
-            drift    = np.radians(self.trk) - winddir  # [rad]
+            drift    = np.radians(trk) - winddir  # [rad]
             steer    = np.arcsin(np.minimum(1.0, np.maximum(-1.0,
-                                     Vw * np.sin(drift) / np.maximum(0.001, bs.traf.tas))))
+                                     Vw * np.sin(drift) / np.maximum(0.001, traf.tas[i]))))
             # desired heading
-            self.hdg = (self.trk + np.degrees(steer)) % 360.
+            self.hdg = setsubset(self.hdg, idx, (trk + np.degrees(steer)) % 360.)
         else:
-            self.hdg = self.trk % 360.
+            self.hdg = setsubset(self.hdg, idx, trk % 360.)
+
+    def FlightEnvelope(self, idx=None):
+        """ Limit the targets of aircraft idx (default: all) to their
+            flight envelope. """
+        i = slice(None) if idx is None else idx
+        traf = bs.traf
 
-    def FlightEnvelope(self):
         # check for the flight envelope
-        bs.traf.delalt = bs.traf.selalt - bs.traf.alt  # [m]
-        bs.traf.perf.limits() # Sets limspd_flag and limspd when it needs to be limited
+        traf.delalt = setsubset(traf.delalt, idx, traf.selalt[i] - traf.alt[i])  # [m]
+        traf.perf.limits(idx) # Sets limspd_flag and limspd when it needs to be limited
 
         # Update desired sates with values within the flight envelope
         # When CAs is limited, it needs to be converted to TAS as only this TAS is used later on!
 
-        self.tas = np.where(bs.traf.limspd_flag, vcas2tas(bs.traf.limspd, bs.traf.alt), self.tas)
+        self.tas = setsubset(self.tas, idx, np.where(traf.limspd_flag[i],
+                             vcas2tas(traf.limspd[i], traf.alt[i]), self.tas[i]))
 
         # Autopilot selected altitude [m]
-        self.alt = np.where(bs.traf.limalt_flag, bs.traf.limalt, self.alt)
+        self.alt = setsubset(self.alt, idx, np.where(traf.limalt_flag[i], traf.limalt[i], self.alt[i]))
 
         # Autopilot selected vertical speed (V/S)
-        self.vs = np.where(bs.traf.limvs_flag, bs.traf.limvs, self.vs)
-
+        self.vs = setsubset(self.vs, idx, np.where(traf.limvs_flag[i], traf.limvs[i], self.vs[i]))
@@ -48,6 +48,10 @@ class Route():
         # default: False
         self.flag_landed_runway = False
 
+        # Route has changed, and needs to be reloaded in the FMS route table
+        # (see routetable.py). Set by all methods that change the route.
+        self.dirty = True
+
         return
 
     def addwptStack(self, idx, *args):  # args: all arguments of addwpt
@@ -452,6 +456,7 @@ class Route():
 #        print ("afterwp ="+afterwp)
 #        print
         self.iac = iac    # a/c to which this route belongs
+        self.dirty = True
         # For safety
         self.nwp = len(self.wplat)
 
@@ -685,6 +690,7 @@ class Route():
         if name != "" and self.wpname.count(name) > 0:
             wpidx = self.wpname.index(name)
             self.iactwp = wpidx
+            self.dirty  = True
 
             bs.traf.actwp.lat[idx]   = self.wplat[wpidx]
             bs.traf.actwp.lon[idx]   = self.wplon[wpidx]
@@ -787,7 +793,7 @@ class Route():
 
     def getnextwp(self):
         """Go to next waypoint and return data"""
-
+        self.dirty = True
 
         if self.flag_landed_runway == True:
 
@@ -872,6 +878,7 @@ class Route():
         if idx == -1:
             return False, "Waypoint " + delwpname + " not found"
 
+        self.dirty = True
         self.nwp = self.nwp-1
         del self.wpname[idx]
         del self.wplat[idx]
@@ -879,6 +886,7 @@ class Route():
         del self.wpalt[idx]
         del self.wpspd[idx]
         del self.wptype[idx]
+        del self.wpflyby[idx]
         if self.iactwp > idx:
             self.iactwp = max(0, self.iactwp - 1)
 
@@ -1025,7 +1033,7 @@ class Route():
 
     def insertcalcwp(self,i,name):
         """Insert empty wp with no attributes at location i"""
-
+        self.dirty = True
         self.wpname.insert(i,name)
         self.wplat.insert(i,0.)
         self.wplon.insert(i,0.)
@@ -1039,6 +1047,7 @@ class Route():
         """Do flight plan calculations"""
 #        self.delwpt("T/D")
 #        self.delwpt("T/C")
+        self.dirty = True
 
         # Direction to waypoint
         self.nwp = len(self.wpname)
@@ -0,0 +1,164 @@
+""" Array-backed route table for the vectorized FMS waypoint sequencing."""
+import numpy as np
+from bluesky.tools import geo
+from bluesky.tools.trafficarrays import TrafficArrays, RegisterElementParameters
+
+# Waypoint data in the table: name, dtype, and default value
+wpfields = (("wplat",    float, 0.0),
+            ("wplon",    float, 0.0),
+            ("wpalt",    float, -999.),
+            ("wpspd",    float, -999.),
+            ("wpxtoalt", float, 1.0),
+            ("wptoalt",  float, -999.),
+            ("wpflyby",  bool,  True),
+            ("wptype",   int,   0),
+            ("wplast",   bool,  False))
+
+
+class RouteTable(TrafficArrays):
+    """ Ragged table with the waypoints of all routes, stored in flat arrays.
+
+        The waypoints of each aircraft are stored in a segment of the flat
+        waypoint arrays (wplat, wplon, etc.), given by an offset and a size
+        per aircraft. The Route objects stay the place where routes are
+        edited: the Route methods that change a route set its dirty flag,
+        and the segment of a changed route is rewritten from its Route
+        object before the aircraft shifts to its next waypoint. The table is
+        used to shift to the next waypoint for all aircraft that reached
+        their active waypoint at once."""
+
+    def __init__(self):
+        super(RouteTable, self).__init__()
+        with RegisterElementParameters(self):
+            self.offset = np.array([], dtype=int)   # Start of the segment of each aircraft
+            self.size   = np.array([], dtype=int)   # Size of the segment
+            self.nwp    = np.array([], dtype=int)   # Number of waypoints in the route
+            self.iactwp = np.array([], dtype=int)   # Index of the active waypoint in the route
+            self.landed = np.array([], dtype=bool)  # Route ended on a runway (see Route.getnextwp)
+            self.dirty  = np.array([], dtype=bool)  # Segment needs to be rewritten (see invalidate)
+
+        self.clear()
+
+    def clear(self):
+        # Flat waypoint arrays, of which the first nused elements are in use
+        self.nused = 0
+        for name, dtype, _ in wpfields:
+            self.Vars[name] = np.zeros(64, dtype=dtype)
+
+    def create(self, n=1):
+        super(RouteTable, self).create(n)
+        self.iactwp[-n:] = -1
+        self.dirty[-n:]  = True
+
+    def reset(self):
+        super(RouteTable, self).reset()
+        self.clear()
+
+    def invalidate(self, idx=None):
+        """ Mark the routes of aircraft idx (default: all aircraft) as
+            changed. This is only needed when the waypoint lists of a Route
+            are changed directly, instead of with its methods. """
+        if idx is None:
+            self.dirty[:] = True
+        else:
+            self.dirty[idx] = True
+
+    def refresh(self, idx, routes):
+        """ Rewrite the segments of aircraft idx of which the route has
+            changed. The active waypoint of a route can also have been set
+            directly (e.g., Route.iactwp = 0), so this is compared as well. """
+        for i in idx.tolist():
+            route = routes[i]
+            if self.dirty[i] or route.dirty or route.iactwp != self.iactwp[i]:
+                self.store(i, route)
+
+    def store(self, i, route):
+        """ Write the waypoints of route into the segment of aircraft i """
+        n = route.nwp
+        if n > self.size[i]:
+            self.offset[i] = self.reserve(2 * n)
+            self.size[i]   = 2 * n
+
+        o = self.offset[i]
+        data = {"wplat": route.wplat, "wplon": route.wplon, "wpalt": route.wpalt,
+                "wpspd": route.wpspd, "wpxtoalt": getattr(route, "wpxtoalt", []),
+                "wptoalt": getattr(route, "wptoalt", []), "wpflyby": route.wpflyby,
+                "wptype": route.wptype,
+                "wplast": [name == route.wpname[-1] for name in route.wpname]}
+        for name, _, default in wpfields:
+            values = data[name][:n]
+            self.Vars[name][o:o + n] = values + [default] * (n - len(values))
+
+        self.nwp[i]    = n
+        self.iactwp[i] = route.iactwp
+        self.landed[i] = route.flag_landed_runway
+        self.dirty[i]  = False
+        route.dirty    = False
+
+    def reserve(self, n):
+        """ Return the offset of a new segment of n waypoints """
+        if self.nused + n > len(self.wplat):
+            # Segments of deleted aircraft and of routes that have grown
+            # are unused: compact the table when these take up most space
+            if self.nused > 2 * np.sum(self.size):
+                self.compact()
+
+            if self.nused + n > len(self.wplat):
+                nnew = max(2 * (self.nused + n), 64)
+                for name, dtype, _ in wpfields:
+                    arr = np.zeros(nnew, dtype=dtype)
+                    arr[:self.nused] = self.Vars[name][:self.nused]
+                    self.Vars[name] = arr
+
+        offset = self.nused
+        self.nused += n
+        return offset
+
+    def compact(self):
+        """ Move all segments to the start of the table, without gaps """
+        offset = np.cumsum(self.size) - self.size
+        src    = np.repeat(self.offset - offset, self.size) + np.arange(np.sum(self.size))
+        for name, _, _ in wpfields:
+            arr = self.Vars[name]
+            arr[:len(src)] = arr[src]
+
+        self.offset[:] = offset
+        self.nused     = len(src)
+
+    def getnextwp(self, idx, routes):
+        """ Go to the next waypoint for aircraft idx, like Route.getnextwp(),
+            and return the data of the new active waypoints as arrays. """
+        self.refresh(idx, routes)
+
+        nwp    = self.nwp[idx]
+        landed = self.landed[idx]
+        iact   = self.iactwp[idx]
+
+        # Shift to the next waypoint, unless the route has ended
+        lnavon = (iact + 1 < nwp) & ~landed
+        iact   = iact + lnavon
+        self.iactwp[idx] = iact
+
+        # Bearing of the next leg
+        j       = self.offset[idx] + iact
+        hasnext = iact + 1 < nwp
+        jnext   = np.where(hasnext, j + 1, j)
+        nextqdr, _ = geo.qdrdist(self.wplat[j], self.wplon[j], self.wplat[jnext], self.wplon[jnext])
+        nextqdr = np.where(hasnext & ~landed, nextqdr, -999.)
+
+        # In case that there is a runway, the aircraft should remain on it
+        # instead of deviating to the airport centre
+        self.landed[idx] = landed | ((self.wptype[j] == 5) &
+                                     (self.wplast[j] | hasnext & (self.wptype[jnext] == 3)))
+
+        # Keep the Route objects up to date. Aircraft that have landed on
+        # a runway use Route.getnextwp(), which stacks the runway commands.
+        for i, iwp, flag in zip(idx.tolist(), iact.tolist(), self.landed[idx].tolist()):
+            route = routes[i]
+            if route.flag_landed_runway:
+                route.getnextwp()
+            route.iactwp = iwp
+            route.flag_landed_runway = flag
+
+        return self.wplat[j], self.wplon[j], self.wpalt[j], self.wpspd[j], \
+            self.wpxtoalt[j], self.wptoalt[j], lnavon, self.wpflyby[j], nextqdr
@@ -6,10 +6,10 @@ from random import random, randint
 import bluesky as bs
 from bluesky.tools import datalog, geo
 from bluesky.tools.misc import latlon2txt
-from bluesky.tools.aero import fpm, kts, ft, g0, Rearth, nm, \
+from bluesky.tools.aero import fpm, kts, ft, g0, Rearth, nm, R, gamma, p0, rho0, \
                          vatmos,  vtas2cas, vtas2mach, casormach, vcasormach
 
-from bluesky.tools.trafficarrays import TrafficArrays, RegisterElementParameters
+from bluesky.tools.trafficarrays import TrafficArrays, RegisterElementParameters, setsubset
 
 from .windsim import WindSim
 from .trails import Trails
@@ -23,7 +23,8 @@ from .turbulence import Turbulence
 from bluesky import settings
 
 # Register settings defaults
-settings.set_variable_defaults(performance_model='bluesky', snapdt=1.0, instdt=1.0, skydt=1.0, asas_pzr=5.0, asas_pzh=1000.0)
+settings.set_variable_defaults(performance_model='bluesky', snapdt=1.0, instdt=1.0, skydt=1.0, asas_pzr=5.0, asas_pzh=1000.0,
+                               inplace_kinematics=False, dormant_fastpath=False)
 
 try:
     if settings.performance_model == 'bluesky':
@@ -55,6 +56,7 @@ class Traffic(TrafficArrays):
         deletall()           : delete all traffic
         update(sim)          : do a numerical integration step
         id2idx(name)         : return index in traffic database of given call sign
+        ids2idx(names)       : return array of indices of given call signs
         engchange(i,engtype) : change engine type of an aircraft
         setNoise(A)          : Add turbulence
     Members: see create
@@ -131,6 +133,9 @@ class Traffic(TrafficArrays):
             self.ax       = np.array([])  # [m/s2] absolute value of longitudinal accelleration
             self.bank     = np.array([])  # nominal bank angle, [radian]
             self.swhdgsel = np.array([], dtype=np.bool)  # determines whether aircraft is turning
+            self.swaltsel = np.array([], dtype=np.bool)  # determines whether aircraft is climbing/descending
+            self.delspd   = np.array([])  # [m/s] difference between desired and actual speed
+            self.delalt   = np.array([])  # [m] difference between selected and actual altitude
 
             # Crossover altitude
             self.abco   = np.array([])
@@ -151,6 +156,16 @@ class Traffic(TrafficArrays):
             self.coslat = np.array([])  # Cosine of latitude for computations
             self.eps    = np.array([])  # Small nonzero numbers
 
+            # Aircraft at their targets, that only need position updates (see Classify)
+            self.dormant = np.array([], dtype=np.bool)
+            self.steady  = np.array([], dtype=np.bool)  # steady since last perf update
+
+        # Look-up table of aircraft index per call sign
+        self.idmap = dict()
+
+        # Scratch buffers for the in-place kinematics (see UpdateInPlace)
+        self.scratchbufs = dict()
+
         # Default bank angles per flight phase
         self.bphase = np.deg2rad(np.array([15, 35, 35, 35, 15, 45]))
 
@@ -161,6 +176,7 @@ class Traffic(TrafficArrays):
         # are all reset as well, so all lat,lon,sdp etc but also objects adsb
         super(Traffic, self).reset()
         self.ntraf = 0
+        self.idmap.clear()
 
         # Reset models
         self.wind.clear()
@@ -171,6 +187,12 @@ class Traffic(TrafficArrays):
         # Noise (turbulence, ADBS-transmission noise, ADSB-truncated effect)
         self.setNoise(False)
 
+    def setstate(self, state, n, prefix=''):
+        super(Traffic, self).setstate(state, n, prefix)
+        self.ntraf = n
+        self.idmap.clear()
+        self.idmap.update(zip(self.id, range(n)))
+
     def mcreate(self, count, actype=None, alt=None, spd=None, dest=None):
         """ Create multiple random aircraft in a specified area """
         area = bs.scr.getviewlatlon()
@@ -178,12 +200,6 @@ class Traffic(TrafficArrays):
         if actype is None:
             actype = 'B744'
 
-        n = count
-        super(Traffic, self).create(n)
-
-        # Increase number of aircraft
-        self.ntraf = self.ntraf + count
-
         acids = []
         aclats = []
         aclons = []
@@ -199,9 +215,55 @@ class Traffic(TrafficArrays):
             acalts.append((randint(2000, 39000) * ft) if alt is None else alt)
             acspds.append((randint(250, 450) * kts) if spd is None else spd)
 
+        return self.create_batch(acids, actype, aclats, aclons, achdgs, acalts, acspds,
+                                 vectorspd=True)
+
+    def create_batch(self, acids, actypes, aclats, aclons, achdgs, acalts, acspds,
+                     vectorspd=False):
+        """ Create multiple aircraft at once. All arguments are lists or
+            arrays with one element per aircraft, actypes can also be a
+            single type for all aircraft. Speeds are CAS or Mach.
+
+            The speeds and headings are converted per aircraft with the
+            scalar functions, exactly like a single CRE. With vectorspd,
+            the vectorized aero functions are used instead (as in MCRE). """
+        if isinstance(actypes, str):
+            actypes = [actypes] * len(acids)
+
+        # Skip aircraft that already exist, or that occur twice in this batch
+        acids   = [acid.upper() for acid in acids]
+        newids  = set()
+        skipped = []
+        sel     = []
+        for i, acid in enumerate(acids):
+            if acid in self.idmap or acid in newids:
+                skipped.append(acid)
+            else:
+                newids.add(acid)
+                sel.append(i)
+
+        msg = ", ".join(skipped) + (" already exists." if len(skipped) == 1 else " already exist.")
+        n = len(sel)
+        if n == 0:
+            return False, msg
+
+        acids   = [acids[i] for i in sel]
+        actypes = [actypes[i] for i in sel]
+        aclats  = np.asarray(aclats, dtype=float)[sel]
+        aclons  = np.asarray(aclons, dtype=float)[sel]
+        achdgs  = np.asarray(achdgs, dtype=float)[sel]
+        acalts  = np.asarray(acalts, dtype=float)[sel]
+        acspds  = np.asarray(acspds, dtype=float)[sel]
+
+        super(Traffic, self).create(n)
+
+        # Increase number of aircraft
+        self.ntraf = self.ntraf + n
+
         # Aircraft Info
         self.id[-n:]   = acids
-        self.type[-n:] = [actype] * n
+        self.idmap.update(zip(acids, range(self.ntraf - n, self.ntraf)))
+        self.type[-n:] = actypes
 
         # Positions
         self.lat[-n:]  = aclats
@@ -212,10 +274,16 @@ class Traffic(TrafficArrays):
         self.trk[-n:]  = achdgs
 
         # Velocities
-        self.tas[-n:], self.cas[-n:], self.M[-n:] = vcasormach(acspds, acalts)
+        if vectorspd:
+            self.tas[-n:], self.cas[-n:], self.M[-n:] = vcasormach(acspds, acalts)
+            self.gsnorth[-n:] = self.tas[-n:] * np.cos(np.radians(self.hdg[-n:]))
+            self.gseast[-n:]  = self.tas[-n:] * np.sin(np.radians(self.hdg[-n:]))
+        else:
+            for i, spd, alt, hdg in zip(range(self.ntraf - n, self.ntraf), acspds, acalts, achdgs):
+                self.tas[i], self.cas[i], self.M[i] = casormach(spd, alt)
+                self.gsnorth[i] = self.tas[i] * cos(radians(hdg))
+                self.gseast[i]  = self.tas[i] * sin(radians(hdg))
         self.gs[-n:]      = self.tas[-n:]
-        self.gsnorth[-n:] = self.tas[-n:] * np.cos(np.radians(self.hdg[-n:]))
-        self.gseast[-n:]  = self.tas[-n:] * np.sin(np.radians(self.hdg[-n:]))
 
         # Atmosphere
         self.p[-n:], self.rho[-n:], self.Temp[-n:] = vatmos(acalts)
@@ -245,28 +313,33 @@ class Traffic(TrafficArrays):
         self.selalt[-n:] = self.alt[-n:]
 
         # Display information on label
-        self.label[-n:] = n*[['', '', '', 0]]
+        self.label[-n:] = [['', '', '', 0] for i in range(n)]
 
         # Miscallaneous
-        self.coslat[-n:] = np.cos(np.radians(aclats))  # Cosine of latitude for flat-earth aproximations
+        if vectorspd:
+            self.coslat[-n:] = np.cos(np.radians(aclats))  # Cosine of latitude for flat-earth aproximations
+        else:
+            self.coslat[-n:] = [cos(radians(lat)) for lat in aclats]
         self.eps[-n:] = 0.01
 
         # Finally call create for child TrafficArrays. This only needs to be done
         # manually in Traffic.
         self.create_children(n)
 
+        return True if len(skipped) == 0 else (True, msg)
+
     def create(self, acid=None, actype="B744", aclat=None, aclon=None, achdg=None, acalt=None, casmach=None):
         """Create an aircraft"""
 
         # Check if not already exist
-        if self.id.count(acid.upper()) > 0:
+        if acid is not None and acid.upper() in self.idmap:
             return False, acid + " already exists."  # already exists do nothing
 
         # Catch missing acid, replace by a default
         if acid is None or acid == "*":
             acid = "KL204"
             flno = 204
-            while self.id.count(acid) > 0:
+            while acid in self.idmap:
                 flno = flno + 1
                 acid = "KL" + str(flno)
 
@@ -277,68 +350,7 @@ class Traffic(TrafficArrays):
             return False, "CRE: Missing one or more arguments:"\
                           "acid,actype,aclat,aclon,achdg,acalt,acspd"
 
-        super(Traffic, self).create()
-
-        # Increase number of aircraft
-        self.ntraf = self.ntraf + 1
-
-        # Aircraft Info
-        self.id[-1]   = acid.upper()
-        self.type[-1] = actype
-
-        # Positions
-        self.lat[-1]  = aclat
-        self.lon[-1]  = aclon
-        self.alt[-1]  = acalt
-
-        self.hdg[-1]  = achdg
-        self.trk[-1]  = achdg
-
-        # Velocities
-        self.tas[-1], self.cas[-1], self.M[-1] = casormach(casmach, acalt)
-        self.gs[-1]      = self.tas[-1]
-        self.gsnorth[-1] = self.tas[-1] * cos(radians(self.hdg[-1]))
-        self.gseast[-1]  = self.tas[-1] * sin(radians(self.hdg[-1]))
-
-        # Atmosphere
-        self.p[-1], self.rho[-1], self.Temp[-1] = vatmos(acalt)
-
-        # Wind
-        if self.wind.winddim > 0:
-            vnwnd, vewnd     = self.wind.getdata(self.lat[-1], self.lon[-1], self.alt[-1])
-            self.gsnorth[-1] = self.gsnorth[-1] + vnwnd
-            self.gseast[-1]  = self.gseast[-1]  + vewnd
-            self.trk[-1]     = np.degrees(np.arctan2(self.gseast[-1], self.gsnorth[-1]))
-            self.gs[-1]      = np.sqrt(self.gsnorth[-1]**2 + self.gseast[-1]**2)
-
-        # Traffic performance data
-        #(temporarily default values)
-        self.apvsdef[-1] = 1500. * fpm  # default vertical speed of autopilot
-        self.aphi[-1]    = radians(25.)  # bank angle setting of autopilot
-        self.ax[-1]      = 1.0*kts       # absolute value of longitudinal accelleration
-        self.bank[-1]    = radians(25.)
-
-        # Crossover altitude
-        self.abco[-1]   = 0  # not necessary to overwrite 0 to 0, but leave for clarity
-        self.belco[-1]  = 1
-
-        # Traffic autopilot settings
-        self.selspd[-1] = self.cas[-1]
-        self.aptas[-1]  = self.tas[-1]
-        self.selalt[-1] = self.alt[-1]
-
-        # Display information on label
-        self.label[-1] = ['', '', '', 0]
-
-        # Miscallaneous
-        self.coslat[-1] = cos(radians(aclat))  # Cosine of latitude for flat-earth aproximations
-        self.eps[-1] = 0.01
-
-        # Finally call create for child TrafficArrays. This only needs to be done
-        # manually in Traffic.
-        self.create_children()
-
-        return True
+        return self.create_batch([acid], [actype], [aclat], [aclon], [achdg], [acalt], [casmach])
 
     def creconfs(self, acid, actype, targetidx, dpsi, cpa, tlosh, dH=None, tlosv=None, spd=None):
         latref  = self.lat[targetidx]  # deg
@@ -399,107 +411,440 @@ class Traffic(TrafficArrays):
         # Do nothing if not found
         if idx < 0:
             return False
+
+        return self.delete_many([idx])
+
+    def delete_many(self, indices):
+        """Delete multiple aircraft at once, given their indices.
+           All registered arrays and lists are compacted in one pass."""
+        # Skip invalid and duplicate indices
+        idx = np.unique(np.asarray(indices, dtype=int))
+        idx = idx[(idx >= 0) & (idx < self.ntraf)]
+        if len(idx) == 0:
+            return False
+
         # Decrease number of aircraft
-        self.ntraf = self.ntraf - 1
+        self.ntraf = self.ntraf - len(idx)
 
         # Delete all aircraft parameters
+        for acid in [self.id[i] for i in idx]:
+            del self.idmap[acid]
         super(Traffic, self).delete(idx)
 
+        # Aircraft after the first deleted one have shifted
+        for i in range(idx[0], self.ntraf):
+            self.idmap[self.id[i]] = i
+
         return True
 
-    def update(self, simt, simdt):
+    def update(self, simt, simdt, subdt=None):
+        """ Update the traffic with time step simdt. With subdt, simdt is an
+            adaptive (large) time step, in which aircraft that are turning,
+            or changing speed or altitude are sub-stepped (see UpdateSubSteps). """
         # Update only if there is traffic ---------------------
         if self.ntraf == 0:
             return
 
+        # Dormant aircraft are skipped in the updates below, except for
+        # the position update. idx=None means all aircraft are updated.
+        # Time steps with a performance update are full updates: the
+        # performance values (e.g., the mass) and the flight envelope limits
+        # of steady aircraft can still change, and a woken aircraft should
+        # continue from the same limits as without the fast path.
+        idx  = None if self.perf.task.isdue(simt) else self.activeidx()
+        alt0 = self.alt
+
         #---------- Atmosphere --------------------------------
-        self.p, self.rho, self.Temp = vatmos(self.alt)
+        if settings.inplace_kinematics:
+            self.UpdateAtmosphere()
+        elif idx is None:
+            self.p, self.rho, self.Temp = vatmos(self.alt)
+        else:
+            p, rho, Temp = vatmos(self.alt[idx])
+            self.p    = setsubset(self.p, idx, p)
+            self.rho  = setsubset(self.rho, idx, rho)
+            self.Temp = setsubset(self.Temp, idx, Temp)
 
         #---------- ADSB Update -------------------------------
         self.adsb.update(simt)
 
         #---------- Fly the Aircraft --------------------------
-        self.ap.update(simt)
+        # The FMS guidance is updated for all aircraft
+        if self.ap.update(simt, idx):
+            idx = None
+
+        # Aircraft that follow an ASAS resolution are woken up
         self.asas.update(simt)
-        self.pilot.APorASAS()
+        if idx is not None and np.any(self.dormant & self.asas.active):
+            self.dormant = self.dormant & ~self.asas.active
+            self.steady  = self.steady & ~self.asas.active
+            idx = self.activeidx()
+
+        self.pilot.APorASAS(idx)
 
         #---------- Limit Speeds ------------------------------
-        self.pilot.FlightEnvelope()
+        self.pilot.FlightEnvelope(idx)
 
         #---------- Kinematics --------------------------------
-        self.UpdateAirSpeed(simdt, simt)
-        self.UpdateGroundSpeed(simdt)
-        self.UpdatePosition(simdt)
+        if subdt is not None and simdt > subdt:
+            self.UpdateSubSteps(simdt, simt, subdt, idx)
+        elif settings.inplace_kinematics:
+            self.UpdateInPlace(simdt)
+        else:
+            self.UpdateAirSpeed(simdt, simt, idx)
+            self.UpdateGroundSpeed(simdt)
+            self.UpdatePosition(simdt)
 
         #---------- Performance Update ------------------------
-        self.perf.perf(simt)
+        nperf = self.perf.task.ncalls
+        self.perf.perf(simt, idx)
 
         #---------- Simulate Turbulence -----------------------
         self.turbulence.Woosh(simdt)
 
+        #---------- Activity classification -------------------
+        self.Classify(alt0, self.perf.task.ncalls != nperf)
+
         #---------- Aftermath ---------------------------------
         self.trails.update(simt)
         return
 
-    def UpdateAirSpeed(self, simdt, simt):
+    def activeidx(self):
+        """ Return the indices of the aircraft that are not dormant, or None
+            when all aircraft need a full update. """
+        if not self.dormant.any():
+            return None
+        return np.flatnonzero(~self.dormant)
+
+    def Classify(self, alt0, perfupdated):
+        """ Determine which aircraft are dormant: aircraft that are at their
+            target speed, heading and altitude, and that do not follow an
+            ASAS resolution. As long as their targets do not change, the
+            state of these aircraft stays the same, so they only need a
+            position update. Targets change through stack commands (which
+            wake up the aircraft, see wake()), ASAS (Traffic.update wakes up
+            these aircraft), and the FMS (which is always performed for all
+            aircraft, so also aircraft that get close to their active
+            waypoint are updated).
+            alt0 is the altitude array from before the update of this time
+            step, perfupdated is True when the performance model was updated
+            in this time step. """
+        # With wind and turbulence, the speeds and altitude of all aircraft
+        # change every time step. The in-place kinematics always update all
+        # aircraft.
+        if not settings.dormant_fastpath or settings.inplace_kinematics or \
+                self.wind.winddim > 0 or self.turbulence.active:
+            if self.dormant.any():
+                self.dormant = np.zeros(self.ntraf, dtype=np.bool)
+                self.steady  = np.zeros(self.ntraf, dtype=np.bool)
+            return
+
+        steady = (self.alt == alt0) & (self.delspd == 0.) & (self.tas == self.pilot.tas) & \
+                 ~self.swhdgsel & ~self.swaltsel & ~self.asas.active
+
+        # The flight envelope limits depend on the performance values, so
+        # aircraft only become dormant when they have been steady since
+        # their last performance update. Between performance updates, the
+        # limits of dormant aircraft then stay the same.
+        self.dormant = steady & (self.dormant | self.steady)
+        self.steady  = steady if perfupdated else steady & self.steady
+
+    def wake(self, idx=None):
+        """ Give aircraft idx (default: all aircraft) a full update in the
+            next time step, and reload their routes in the FMS route table.
+            This is needed when the targets of an aircraft are changed
+            outside the stack (e.g., in a plugin). Route changes with the
+            Route methods are picked up by the route table itself. """
+        self.ap.routetable.invalidate(idx)
+        if idx is None:
+            self.dormant = np.zeros(self.ntraf, dtype=np.bool)
+            self.steady  = np.zeros(self.ntraf, dtype=np.bool)
+        else:
+            self.dormant = setsubset(self.dormant, idx, False)
+            self.steady  = setsubset(self.steady, idx, False)
+
+    def UpdateAirSpeed(self, simdt, simt, idx=None):
+        # Speeds and vertical speed of aircraft idx (default: all aircraft)
+        i = slice(None) if idx is None else idx
+        alt = self.alt[i]
+        tas = self.tas[i]
+        hdg = self.hdg[i]
+        eps = self.eps[i]
+        pilottas = self.pilot.tas[i]
+
         # Acceleration
-        self.delspd = self.pilot.tas - self.tas
+        delspd = pilottas - tas
+        self.delspd = setsubset(self.delspd, idx, delspd)
 
-        swspdsel = np.abs(self.delspd) > 0.4  # <1 kts = 0.514444 m/s
-        ax = self.perf.acceleration(simdt)
+        swspdsel = np.abs(delspd) > 0.4  # <1 kts = 0.514444 m/s
+        ax = self.perf.acceleration(simdt, idx)
 
         # Update velocities
-        self.tas = np.where(swspdsel, \
-                            self.tas + swspdsel * ax * np.sign(self.delspd) * simdt,\
-                            self.pilot.tas)
+        tas = np.where(swspdsel, \
+                       tas + swspdsel * ax * np.sign(delspd) * simdt,\
+                       pilottas)
+        self.tas = setsubset(self.tas, idx, tas)
 
-        self.cas = vtas2cas(self.tas, self.alt)
-        self.M   = vtas2mach(self.tas, self.alt)
+        self.cas = setsubset(self.cas, idx, vtas2cas(tas, alt))
+        self.M   = setsubset(self.M, idx, vtas2mach(tas, alt))
 
         # Turning
-        turnrate = np.degrees(g0 * np.tan(self.bank) / np.maximum(self.tas, self.eps))
-        delhdg   = (self.pilot.hdg - self.hdg + 180.) % 360 - 180.  # [deg]
-        self.swhdgsel = np.abs(delhdg) > np.abs(2. * simdt * turnrate)
+        turnrate = np.degrees(g0 * np.tan(self.bank[i]) / np.maximum(tas, eps))
+        delhdg   = (self.pilot.hdg[i] - hdg + 180.) % 360 - 180.  # [deg]
+        swhdgsel = np.abs(delhdg) > np.abs(2. * simdt * turnrate)
+        self.swhdgsel = setsubset(self.swhdgsel, idx, swhdgsel)
 
         # Update heading
-        self.hdg = (self.hdg + simdt * turnrate * self.swhdgsel * np.sign(delhdg)) % 360.
+        self.hdg = setsubset(self.hdg, idx, (hdg + simdt * turnrate * swhdgsel * np.sign(delhdg)) % 360.)
 
         # Update vertical speed
-        delalt   = self.pilot.alt - self.alt
-        self.swaltsel = np.abs(delalt) > np.maximum(10 * ft, np.abs(2. * simdt * np.abs(self.vs)))
-        self.vs  = self.swaltsel * np.sign(delalt) * np.abs(self.pilot.vs)
+        delalt   = self.pilot.alt[i] - alt
+        swaltsel = np.abs(delalt) > np.maximum(10 * ft, np.abs(2. * simdt * np.abs(self.vs[i])))
+        self.swaltsel = setsubset(self.swaltsel, idx, swaltsel)
+        self.vs  = setsubset(self.vs, idx, swaltsel * np.sign(delalt) * np.abs(self.pilot.vs[i]))
 
-    def UpdateGroundSpeed(self, simdt):
+    def UpdateGroundSpeed(self, simdt, idx=None):
         # Compute ground speed and track from heading, airspeed and wind
+        # of aircraft idx (default: all aircraft)
+        tas = self.tas if idx is None else self.tas[idx]
+        hdg = self.hdg if idx is None else self.hdg[idx]
         if self.wind.winddim == 0:  # no wind
-            self.gsnorth  = self.tas * np.cos(np.radians(self.hdg))
-            self.gseast   = self.tas * np.sin(np.radians(self.hdg))
+            gsnorth = tas * np.cos(np.radians(hdg))
+            gseast  = tas * np.sin(np.radians(hdg))
+
+            gs  = tas
+            trk = hdg
 
-            self.gs  = self.tas
-            self.trk = self.hdg
+        else:
+            i = slice(None) if idx is None else idx
+            windnorth, windeast = self.wind.getdata(self.lat[i], self.lon[i], self.alt[i])
+            gsnorth = tas * np.cos(np.radians(hdg)) + windnorth
+            gseast  = tas * np.sin(np.radians(hdg)) + windeast
+
+            gs  = np.sqrt(gsnorth**2 + gseast**2)
+            trk = np.degrees(np.arctan2(gseast, gsnorth)) % 360.
+
+        self.gsnorth = setsubset(self.gsnorth, idx, gsnorth)
+        self.gseast  = setsubset(self.gseast, idx, gseast)
+        self.gs      = setsubset(self.gs, idx, gs)
+        self.trk     = setsubset(self.trk, idx, trk)
+
+    def UpdatePosition(self, simdt, idx=None):
+        # Update position of aircraft idx (default: all aircraft)
+        i = slice(None) if idx is None else idx
+        lat    = self.lat[i] + np.degrees(simdt * self.gsnorth[i] / Rearth)
+        coslat = np.cos(np.deg2rad(lat))
+        self.alt = setsubset(self.alt, idx, np.where(self.swaltsel[i], self.alt[i] + self.vs[i] * simdt,
+                                                     self.pilot.alt[i]))
+        self.lon = setsubset(self.lon, idx, self.lon[i] + np.degrees(simdt * self.gseast[i] / coslat / Rearth))
+        self.lat = setsubset(self.lat, idx, lat)
+        self.coslat = setsubset(self.coslat, idx, coslat)
+
+    def UpdateSubSteps(self, simdt, simt, subdt, idx=None):
+        """ Kinematics for a large (adaptive) time step simdt. Aircraft idx
+            (default: all aircraft) that are still turning, or changing
+            speed or altitude, are integrated in sub-steps of at most subdt.
+            The other aircraft fly straight at constant speed and altitude
+            during the whole step, and are moved in a single step. """
+        i = slice(None) if idx is None else idx
+        turnrate = np.degrees(g0 * np.tan(self.bank[i]) / np.maximum(self.tas[i], self.eps[i]))
+        delhdg   = (self.pilot.hdg[i] - self.hdg[i] + 180.) % 360 - 180.
+        sub      = (np.abs(delhdg) > np.abs(2. * subdt * turnrate)) | \
+                   (self.pilot.tas[i] != self.tas[i]) | (self.pilot.alt[i] != self.alt[i])
+
+        if not sub.any():
+            self.UpdateAirSpeed(simdt, simt, idx)
+            self.UpdateGroundSpeed(simdt)
+            self.UpdatePosition(simdt)
+            return
+
+        # Aircraft in transition, and the other (also dormant) aircraft
+        subidx = np.flatnonzero(sub) if idx is None else idx[sub]
+        single = np.ones(self.ntraf, dtype=np.bool)
+        single[subidx] = False
+        active = np.flatnonzero(single) if idx is None else idx[~sub]
+        single = np.flatnonzero(single)
+
+        self.UpdateAirSpeed(simdt, simt, active)
+        self.UpdateGroundSpeed(simdt, single)
+        self.UpdatePosition(simdt, single)
+
+        nsteps = int(np.ceil(simdt / subdt - 1e-6))
+        for _ in range(nsteps):
+            self.UpdateAirSpeed(simdt / nsteps, simt, subidx)
+            self.UpdateGroundSpeed(simdt / nsteps, subidx)
+            self.UpdatePosition(simdt / nsteps, subidx)
+
+    def scratch(self, name, dtype=float):
+        """ Return a scratch array of ntraf elements for intermediate
+            results. The buffer is kept between calls and only reallocated
+            (with double the required size) when traffic has grown, so the
+            contents are undefined. """
+        buf = self.scratchbufs.get(name)
+        if buf is None or len(buf) < self.ntraf:
+            buf = np.empty(max(2 * self.ntraf, 8), dtype=dtype)
+            self.scratchbufs[name] = buf
+        return buf[:self.ntraf]
+
+    def UpdateAtmosphere(self):
+        """ In-place version of vatmos for the traffic altitudes, used in
+            combination with UpdateInPlace. """
+        tmp = self.scratch('tmp1')
+
+        # Temp
+        np.multiply(0.0065, self.alt, out=tmp)
+        np.subtract(288.15, tmp, out=self.Temp)
+        np.maximum(self.Temp, 216.65, out=self.Temp)
+
+        # Density
+        np.divide(self.Temp, 288.15, out=self.rho)
+        self.rho **= 4.256848030018761
+        np.multiply(1.225, self.rho, out=self.rho)
+        np.subtract(self.alt, 11000., out=tmp)
+        np.maximum(0., tmp, out=tmp)
+        np.negative(tmp, out=tmp)
+        tmp /= 6341.552161
+        self.rho *= np.exp(tmp, out=tmp)
+
+        # Pressure
+        np.multiply(self.rho, R, out=self.p)
+        self.p *= self.Temp
+
+    def UpdateInPlace(self, simdt):
+        """ Allocation-free version of UpdateAirSpeed, UpdateGroundSpeed and
+            UpdatePosition, which gives identical results. The state arrays
+            are overwritten in place, and all intermediate results are
+            stored in scratch buffers. Only the performance model and the
+            wind field still return new arrays.
+
+            Note: references to the state arrays (e.g., held by the gui or
+            a plugin) now see the arrays change, instead of keeping the
+            values of the previous time step. Enable with inplace_kinematics
+            in the settings file. """
+        # Ground speed and track are references to TAS and heading after
+        # a no-wind step of UpdateGroundSpeed: give them their own memory
+        if self.gs is self.tas:
+            self.gs = self.tas.copy()
+        if self.trk is self.hdg:
+            self.trk = self.hdg.copy()
+
+        tmp1 = self.scratch('tmp1')
+        tmp2 = self.scratch('tmp2')
+        tmp3 = self.scratch('tmp3')
+        tmp4 = self.scratch('tmp4')
+
+        # Acceleration
+        self.delspd = np.subtract(self.pilot.tas, self.tas, out=self.scratch('delspd'))
+        swspdsel = np.greater(np.abs(self.delspd, out=tmp1), 0.4,
+                              out=self.scratch('swspdsel', bool))
+        ax = self.perf.acceleration(simdt)
+
+        # Update velocities
+        np.multiply(swspdsel, ax, out=tmp1)
+        tmp1 *= np.sign(self.delspd, out=tmp2)
+        tmp1 *= simdt
+        tmp1 += self.tas
+        np.copyto(self.tas, self.pilot.tas)
+        np.copyto(self.tas, tmp1, where=swspdsel)
+
+        # CAS and Mach (see vtas2cas and vtas2mach), using the atmosphere
+        # at the current altitude
+        np.multiply(self.rho, self.tas, out=tmp1)
+        tmp1 *= self.tas
+        tmp1 /= np.multiply(7., self.p, out=tmp2)
+        tmp1 += 1.
+        tmp1 **= 3.5
+        tmp1 -= 1.
+        tmp1 *= self.p  # dynamic pressure
+        tmp1 /= p0
+        tmp1 += 1.
+        tmp1 **= 2. / 7.
+        tmp1 -= 1.
+        np.multiply(7. * p0 / rho0, tmp1, out=tmp1)
+        np.sqrt(tmp1, out=self.cas)
+
+        np.multiply(gamma * R, self.Temp, out=tmp1)
+        np.divide(self.tas, np.sqrt(tmp1, out=tmp1), out=self.M)
+
+        # Turning
+        turnrate = np.tan(self.bank, out=tmp1)
+        np.multiply(g0, turnrate, out=turnrate)
+        turnrate /= np.maximum(self.tas, self.eps, out=tmp2)
+        np.degrees(turnrate, out=turnrate)
+
+        delhdg = np.subtract(self.pilot.hdg, self.hdg, out=tmp2)
+        delhdg += 180.
+        np.remainder(delhdg, 360, out=delhdg)
+        delhdg -= 180.  # [deg]
+
+        np.multiply(2. * simdt, turnrate, out=tmp4)
+        np.greater(np.abs(delhdg, out=tmp3), np.abs(tmp4, out=tmp4), out=self.swhdgsel)
+
+        # Update heading
+        np.multiply(simdt, turnrate, out=tmp3)
+        tmp3 *= self.swhdgsel
+        tmp3 *= np.sign(delhdg, out=tmp4)
+        self.hdg += tmp3
+        np.remainder(self.hdg, 360., out=self.hdg)
+
+        # Update vertical speed
+        delalt = np.subtract(self.pilot.alt, self.alt, out=tmp2)
+        np.abs(self.vs, out=tmp4)
+        np.multiply(2. * simdt, tmp4, out=tmp4)
+        np.maximum(10 * ft, np.abs(tmp4, out=tmp4), out=tmp4)
+        self.swaltsel = np.greater(np.abs(delalt, out=tmp3), tmp4,
+                                   out=self.scratch('swaltsel', bool))
+        np.multiply(self.swaltsel, np.sign(delalt, out=tmp3), out=self.vs)
+        self.vs *= np.abs(self.pilot.vs, out=tmp4)
+
+        # Ground speed and track from heading, airspeed and wind
+        np.radians(self.hdg, out=tmp1)
+        np.multiply(self.tas, np.cos(tmp1, out=tmp2), out=self.gsnorth)
+        np.multiply(self.tas, np.sin(tmp1, out=tmp2), out=self.gseast)
+
+        if self.wind.winddim == 0:  # no wind
+            np.copyto(self.gs, self.tas)
+            np.copyto(self.trk, self.hdg)
 
         else:
             windnorth, windeast = self.wind.getdata(self.lat, self.lon, self.alt)
-            self.gsnorth  = self.tas * np.cos(np.radians(self.hdg)) + windnorth
-            self.gseast   = self.tas * np.sin(np.radians(self.hdg)) + windeast
+            self.gsnorth += windnorth
+            self.gseast  += windeast
 
-            self.gs  = np.sqrt(self.gsnorth**2 + self.gseast**2)
-            self.trk = np.degrees(np.arctan2(self.gseast, self.gsnorth)) % 360.
+            np.square(self.gsnorth, out=tmp1)
+            tmp1 += np.square(self.gseast, out=tmp2)
+            np.sqrt(tmp1, out=self.gs)
+            np.arctan2(self.gseast, self.gsnorth, out=tmp1)
+            np.remainder(np.degrees(tmp1, out=tmp1), 360., out=self.trk)
 
-    def UpdatePosition(self, simdt):
         # Update position
-        self.alt = np.where(self.swaltsel, self.alt + self.vs * simdt, self.pilot.alt)
-        self.lat = self.lat + np.degrees(simdt * self.gsnorth / Rearth)
-        self.coslat = np.cos(np.deg2rad(self.lat))
-        self.lon = self.lon + np.degrees(simdt * self.gseast / self.coslat / Rearth)
+        np.multiply(self.vs, simdt, out=tmp1)
+        tmp1 += self.alt
+        np.copyto(self.alt, self.pilot.alt)
+        np.copyto(self.alt, tmp1, where=self.swaltsel)
+
+        np.multiply(simdt, self.gsnorth, out=tmp1)
+        tmp1 /= Rearth
+        self.lat += np.degrees(tmp1, out=tmp1)
+        np.cos(np.deg2rad(self.lat, out=tmp1), out=self.coslat)
+
+        np.multiply(simdt, self.gseast, out=tmp1)
+        tmp1 /= self.coslat
+        tmp1 /= Rearth
+        self.lon += np.degrees(tmp1, out=tmp1)
 
     def id2idx(self, acid):
         """Find index of aircraft id"""
         try:
-            return self.id.index(acid.upper())
+            return self.idmap.get(acid.upper(), -1)
         except:
             return -1
 
+    def ids2idx(self, acids):
+        """Find indices of a list of aircraft ids, -1 for unknown ids"""
+        get = self.idmap.get
+        return np.array([get(acid.upper(), -1) for acid in acids], dtype=int)
+
     def setNoise(self, noise=None):
         """Noise (turbulence, ADBS-transmission noise, ADSB-truncated effect)"""
         if noise is None:
@@ -63,16 +63,18 @@ class Trails(TrafficArrays):
 
     def create(self,n=1):
         super(Trails, self).create(n)
+        if n <= 0:
+            return
 
-        self.accolor[-1] = self.defcolor
-        self.lastlat[-1] = bs.traf.lat[-1]
-        self.lastlon[-1] = bs.traf.lon[-1]
+        self.accolor[-n:] = [self.defcolor] * n
+        self.lastlat[-n:] = bs.traf.lat[-n:]
+        self.lastlon[-n:] = bs.traf.lon[-n:]
 
     def update(self, t):
         self.acid    = bs.traf.id
         if not self.active:
-            self.lastlat = bs.traf.lat
-            self.lastlon = bs.traf.lon
+            self.lastlat[:] = bs.traf.lat
+            self.lastlon[:] = bs.traf.lon
             self.lasttim[:] = t
             return
         """Add linepieces for trails based on traffic data"""
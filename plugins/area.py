@@ -116,6 +116,11 @@ class Area(TrafficArrays):
         if self.swtaxi:
             pass # To be added!!!
 
+        # Without an area, no aircraft are deleted (and checkInside returns
+        # an empty list instead of an array)
+        if not self.active:
+            return
+
         # Find out which aircraft are currently inside the experiment area, and
         # determine which aircraft need to be deleted.
         inside = areafilter.checkInside(self.name, traf.lat, traf.lon, traf.alt)
@@ -123,7 +128,7 @@ class Area(TrafficArrays):
         self.inside = inside
 
         # Log flight statistics when for deleted aircraft
-        if delidx:
+        if len(delidx) > 0:
             self.logger.log(
                 np.array(traf.id)[delidx],
                 self.create_time[delidx],
@@ -149,8 +154,7 @@ class Area(TrafficArrays):
             )
 
         # delete all aicraft in self.delidx
-        for acid in [traf.id[idx] for idx in delidx]:
-            traf.delete(acid)
+        traf.delete_many(delidx)
 
     def setArea(self, *args):
         ''' Set Experiment Area. Aicraft leaving the experiment area are deleted.
@@ -22,6 +22,11 @@ def init_plugin():
         # frequent updates provide an update interval.
         'update_interval': 2.5,
 
+        # Optional offset in seconds of the update times (phase + k * interval).
+        # By default, each plugin gets a different offset, so that plugins with
+        # the same interval are not all updated in the same timestep.
+        # 'update_phase':    0.0,
+
         # The update function is called after traffic is updated. Use this if you
         # want to do things as a result of what happens in traffic. If you need to
         # something before traffic is updated please use preupdate.
@@ -57,6 +62,12 @@ def init_plugin():
 ### Periodic update functions that are called by the simulation. You can replace
 ### this by anything, so long as you communicate this in init_plugin
 
+### When you change the targets of aircraft directly (e.g., traf.selspd,
+### traf.selalt or traf.ap.trk) instead of with stack commands, call
+### traf.wake(idx) for these aircraft. With dormant_fastpath = True in the
+### settings, aircraft at their targets are otherwise not updated until the
+### next performance update.
+
 def update():
     stack.stack('ECHO MY_PLUGIN update: creating a random aircraft')
     stack.stack('MCRE 1')
@@ -0,0 +1,87 @@
+""" Shared fixtures of the BlueSky tests.
+
+    BlueSky is imported once, from its root folder, with the pygame
+    interface and a fresh config file (generated from data/default.cfg) in a
+    temporary folder. When BlueSky can't be imported (e.g., pygame or the
+    navigation data is missing), the tests that need it are skipped.
+
+    Usage (from the BlueSky root folder):
+        python -m pytest tests
+"""
+import os
+import sys
+import tempfile
+import pytest
+
+# Run from the BlueSky root folder, so the data paths are found
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+os.chdir(root)
+sys.path.insert(0, root)
+
+# The gui and config file are selected with the command line arguments
+argv     = sys.argv
+sys.argv = ['BlueSky_pygame.py', '--config-file',
+            os.path.join(tempfile.mkdtemp(), 'settings.cfg')]
+try:
+    import bluesky as bs
+    from bluesky import settings, stack
+    from bluesky.tools import plugin, scheduler
+    plugin.init()
+    stack.init()
+    stack.process()
+    importerror = None
+except Exception as e:
+    bs = None
+    importerror = "BlueSky can't be imported: %s" % e
+finally:
+    sys.argv = argv
+
+
+@pytest.fixture
+def traf():
+    """ The traffic object, without aircraft. The settings, the simulation
+        time, the scheduler and the scenario commands are restored
+        afterwards. """
+    if bs is None:
+        pytest.skip(importerror)
+    saved = dict(vars(settings))
+    bs.sim.simt = 0.0
+    scheduler.reset()
+    bs.traf.reset()
+    yield bs.traf
+    del stack.cmdstack[:]
+    stack.scentime, stack.scencmd = [], []
+    vars(settings).update(saved)
+    bs.sim.simt = 0.0
+    scheduler.reset()
+    bs.traf.reset()
+
+
+@pytest.fixture
+def cmd(traf, monkeypatch):
+    """ Function to process stack commands, which returns the echoed
+        messages """
+    echoed = []
+    monkeypatch.setattr(bs.scr, 'echo', lambda text='', *args: echoed.append(text))
+
+    def process(*cmdlines):
+        del echoed[:]
+        for line in cmdlines:
+            stack.stack(line)
+        stack.process()
+        return list(echoed)
+    return process
+
+
+@pytest.fixture
+def simulate(traf):
+    """ Function to run the simulation (stack and traffic) until time
+        tend [s], with time step dt [s] """
+    def run(tend, dt=0.05):
+        sim = bs.sim
+        while sim.simt < tend - 1e-9:
+            stack.checkfile(sim.simt)
+            stack.process()
+            traf.update(sim.simt, dt)
+            sim.simt += dt
+    return run
@@ -0,0 +1,61 @@
+""" Tests of the adaptive time step in fast-time: the results are close to
+    those of the fixed time step. """
+import numpy as np
+
+commands = ["CRE KL001 B744 52.0 4.0 90 FL300 280",
+            "CRE KL002 A320 52.5 4.0 270 FL200 250",
+            "CRE KL003 B744 51.5 4.0 0 FL100 250",
+            "CRE KL004 A320 52.0 5.0 180 FL100 250",
+            "ALT KL003 FL150",
+            "HDG KL004 270",
+            "SPD KL002 300"]
+
+
+def run(traf, cmd, monkeypatch, adaptive, tend=600.):
+    """ Simulate in fast-time with or without adaptive time step, and return
+        the traffic state and the time over which the performance model
+        integrated (e.g., the fuel burn) """
+    from bluesky import settings, sim, stack
+    monkeypatch.setattr(sim, "fixdt", 0.05)
+    settings.adaptive_dt = adaptive
+    cmd(*commands)
+    perf = traf.perf.task
+    tperf = 0.0
+    while sim.simt < tend - 1e-9:
+        stack.checkfile(sim.simt)
+        stack.process()
+        dt = sim.stepsize()
+        nperf = perf.ncalls
+        traf.update(sim.simt, dt, sim.fixdt if dt > sim.fixdt else None)
+        if perf.ncalls != nperf:
+            tperf += perf.elapsed
+        sim.simt += dt
+    assert np.isclose(tperf, perf.tlast + perf.dt)
+    state = {key: value.copy() for key, value in traf.getstate().items()
+             if isinstance(value, np.ndarray)}
+    return state, tperf
+
+
+def test_adaptive_dt(traf, cmd, monkeypatch):
+    from bluesky import sim
+    from bluesky.tools import geo, scheduler
+    from bluesky.tools.aero import nm
+    fixed, tfixed = run(traf, cmd, monkeypatch, False)
+    traf.reset()
+    sim.simt = 0.0
+    scheduler.reset()
+    adaptive, tadaptive = run(traf, cmd, monkeypatch, True)
+
+    # Positions, altitudes and speeds. The aircraft in steady cruise is
+    # within a metre, the others (climbing, turning and accelerating) within
+    # 0.1 nm after 10 minutes.
+    dist = geo.kwikdist(fixed["lat"], fixed["lon"], adaptive["lat"], adaptive["lon"]) * nm
+    assert dist[0] < 1. and np.all(dist < 0.1 * nm)
+    assert np.allclose(fixed["alt"], adaptive["alt"], atol=1.)
+    assert np.allclose(fixed["tas"], adaptive["tas"], atol=0.1)
+
+    # The performance model integrates over the whole simulation time in
+    # both cases (up to the last, larger step), so the fuel burn of BADA is
+    # the same
+    assert abs(tfixed - tadaptive) <= 1.0
+    assert np.allclose(fixed["perf.mass"], adaptive["perf.mass"], rtol=1e-3)
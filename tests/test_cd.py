@@ -0,0 +1,233 @@
+""" Tests of the state-based conflict detection. """
+import numpy as np
+import pytest
+
+
+def converging(n=30, radius=0.3):
+    """ CRE commands for n aircraft on a circle around 52N 4E, that all fly
+        to its centre. The flight levels differ less and more than the
+        vertical protected zone, but never by exactly its height. """
+    angles = np.arange(n) * 360. / n
+    return ["CRE KL%03d B744 %f %f %f FL%d 250" % (k, 52. + radius * np.cos(np.radians(a)),
+                                                    4. + radius * np.sin(np.radians(a)) / np.cos(np.radians(52.)),
+                                                    (a + 180.) % 360., (100, 104, 112)[k % 3])
+            for k, a in enumerate(angles)]
+
+
+def cdresults(asas):
+    """ CD results of all conflicts, by pair of call signs """
+    return {pair: np.array([asas.qdr[k], asas.dist[k], asas.dalt[k], asas.tcpa[k],
+                            asas.tinconf[k], asas.toutconf[k]])
+            for k, pair in enumerate(asas.confpairs)}
+
+
+def runcd(traf, cmd, simulate, monkeypatch, tend=60.):
+    """ Simulate converging traffic with climbing and descending aircraft
+        and MVP resolutions, and return the traffic state at tend and the
+        results of all conflict detections """
+    from bluesky import sim
+    from bluesky.tools import scheduler
+    from bluesky.traf.asas import StateBasedCD
+    traf.reset()
+    sim.simt = 0.0
+    scheduler.reset()
+
+    history = []
+
+    def detect(asas, traf, simt, detect=StateBasedCD.detect):
+        detect(asas, traf, simt)
+        history.append(cdresults(asas))
+    monkeypatch.setattr(StateBasedCD, "detect", detect)
+
+    cmd("ASAS ON", "RESO MVP", *converging(60, 1.))
+    cmd("ALT KL001 FL200", "ALT KL011 FL050", "ALT KL021 FL150")
+    simulate(tend)
+    monkeypatch.undo()
+    state = {key: value for key, value in traf.getstate().items()
+             if isinstance(value, np.ndarray) and not key.startswith("asas.cdcache")}
+    return state, history
+
+
+def assert_same_run(run1, run2):
+    """ Check that two results of runcd are identical """
+    state1, history1 = run1
+    state2, history2 = run2
+    for key, value in state1.items():
+        assert np.array_equal(value, state2[key]), key
+    assert len(history1) == len(history2)
+    for results1, results2 in zip(history1, history2):
+        assert sorted(results1) == sorted(results2)
+        for pair, values in results1.items():
+            assert np.array_equal(values, results2[pair]), pair
+
+
+def test_compiled_cd(traf, cmd, simulate, monkeypatch):
+    from bluesky.traf.asas import StateBasedCD
+    try:
+        from bluesky.traf.asas import casas
+    except ImportError:
+        pytest.skip("The compiled conflict detection (casas) is not built")
+
+    cmd("ASAS ON", "RESO MVP", *converging())
+    simulate(1.)
+    # As in Traffic.update, the ADS-B data is updated before the CD
+    traf.adsb.update(1.)
+    monkeypatch.setattr(StateBasedCD, "casas", None)
+    StateBasedCD.detect(traf.asas, traf, 1.)
+    expected = cdresults(traf.asas)
+    assert len(expected) > 0
+
+    # Same conflicts and geometry with the compiled detection (as with
+    # prefer_compiled = True)
+    monkeypatch.setattr(StateBasedCD, "casas", casas)
+    StateBasedCD.detect(traf.asas, traf, 1.)
+    results = cdresults(traf.asas)
+    # The geometry is calculated with other formulas, so conflicts that only
+    # just touch the protected zone can differ
+    for pair in set(results) ^ set(expected):
+        tin, tout = results.get(pair, expected.get(pair))[4:]
+        assert tout - tin < 1., pair
+    for pair in set(results) & set(expected):
+        assert np.allclose(results[pair], expected[pair], rtol=2e-3, atol=1.), pair
+    assert len(traf.asas.conflist_now) > 0
+
+    # The resolution methods can use the CD results of the conflicts
+    for method in ("MVP", "EBY", "SWARM", "DIFGAME"):
+        cmd("RESO " + method)
+        simulate(traf.asas.task.tnext + 2.)
+        assert len(traf.asas.dist) == len(traf.asas.confpairs) > 0
+
+
+def test_los_severity(traf, cmd, monkeypatch):
+    from bluesky.traf.asas import StateBasedCD
+    asas = traf.asas
+    cmd("ASAS ON", "CRE KL000 B744 52 4 90 FL100 250", "CRE KL001 B744 52 4.01 270 FL100 250")
+    StateBasedCD.detect(asas, traf, 0.)
+    assert sorted(asas.confpairs) == [("KL000", "KL001"), ("KL001", "KL000")]
+    assert asas.LOSlist_all == {("KL000", "KL001"): 0}
+    assert len(asas.LOSmaxsev) == 1 and 0. < asas.LOSmaxsev[0] < 1.
+    assert asas.LOSmaxsev[0] == asas.LOShmaxsev[0] and asas.LOSvmaxsev[0] == 1.
+
+    # A more severe LOS that is only detected by KL001 (KL000 has outdated
+    # ADS-B data of KL001) also updates the severity of the pair
+    monkeypatch.setattr(traf.adsb, "truncated", True)
+    sev = asas.LOSmaxsev[0]
+    traf.lon[1] = traf.adsb.lon[1] = 4.005
+    traf.adsb.lat[1] = 53.
+    StateBasedCD.detect(asas, traf, 1.)
+    assert asas.confpairs == [("KL001", "KL000")]
+    assert asas.LOSlist_all == {("KL000", "KL001"): 0}
+    assert len(asas.LOSmaxsev) == 1 and asas.LOSmaxsev[0] > sev
+
+
+def test_resumenav(traf, cmd):
+    from bluesky.traf.asas import StateBasedCD
+    asas = traf.asas
+    # Two pairs that have passed their CPA, and one pair that hasn't
+    cmd("ASAS ON",
+        "CRE KL000 B744 52 4 270 FL100 250", "CRE KL001 B744 52 4.5 90 FL100 250",
+        "CRE KL002 B744 53 4 270 FL100 250", "CRE KL003 B744 53 4.5 90 FL100 250",
+        "CRE KL004 B744 54 4 90 FL100 250", "CRE KL005 B744 54 4.5 270 FL100 250")
+    for pair in [("KL000", "KL001"), ("KL002", "KL003"), ("KL004", "KL005")]:
+        asas.conflist_all[StateBasedCD.pairkey(*pair)] = pair
+
+    # All conflicts that are over are removed in the same update
+    StateBasedCD.ResumeNav(asas, traf)
+    assert list(asas.conflist_all) == [("KL004", "KL005")]
+    assert list(asas.active) == [False] * 4 + [True] * 2
+
+
+def test_cdcache(traf, cmd, simulate, monkeypatch):
+    from bluesky import settings
+    from bluesky.traf.asas import StateBasedCD
+
+    # The cache only skips pairs that can't be in conflict
+    runs = []
+    for cache in (False, True):
+        monkeypatch.setattr(StateBasedCD, "casas", None)
+        settings.asas_cdcache = cache
+        runs.append(runcd(traf, cmd, simulate, monkeypatch))
+    assert sum(len(results) for results in runs[1][1]) > 0
+    assert len(traf.asas.cdcache.i) > 0
+    assert_same_run(*runs)
+
+
+def test_flat_geometry(traf, cmd, simulate, monkeypatch):
+    from bluesky import settings
+    from bluesky.traf.asas import StateBasedCD
+    monkeypatch.setattr(StateBasedCD, "casas", None)
+    asas = traf.asas
+    cmd("ASAS ON", *converging())
+    simulate(1.)
+    traf.adsb.update(1.)
+    StateBasedCD.detect(asas, traf, 1.)
+    expected = cdresults(asas)
+    assert len(expected) > 0
+
+    # The flat-earth approximation gives the same conflicts, apart from
+    # conflicts that only just touch the protected zone
+    assert cmd("ASAS GEOMETRY FLAT", "ASAS GEOMETRY")[-1].endswith("FLAT")
+    StateBasedCD.detect(asas, traf, 1.)
+    results = cdresults(asas)
+    for pair in set(results) ^ set(expected):
+        tin, tout = results.get(pair, expected.get(pair))[4:]
+        assert tout - tin < 1., pair
+    for pair in set(results) & set(expected):
+        assert np.allclose(results[pair], expected[pair], rtol=1e-3, atol=1.), pair
+
+    # Traffic in an area larger than asas_flatextent uses WGS84
+    settings.asas_flatextent = 10.
+    StateBasedCD.detect(asas, traf, 1.)
+    results = cdresults(asas)
+    assert sorted(results) == sorted(expected)
+    for pair, values in expected.items():
+        assert np.array_equal(results[pair], values), pair
+
+
+def test_broadphase(traf, cmd, simulate, monkeypatch):
+    from bluesky import settings
+    from bluesky.traf.asas import StateBasedCD
+
+    # The same conflicts without broad phase, with the grid, and with the
+    # altitude sweep
+    runs = []
+    for broadphase, grid in ((False, True), (True, True), (True, False)):
+        monkeypatch.setattr(StateBasedCD, "casas", None)
+        if not grid:
+            monkeypatch.setattr(StateBasedCD, "gridpairs", lambda *args: None)
+        settings.asas_cdcache = False
+        settings.asas_broadphase = broadphase
+        runs.append(runcd(traf, cmd, simulate, monkeypatch))
+    assert sum(len(results) for results in runs[0][1]) > 0
+    assert_same_run(runs[0], runs[1])
+    assert_same_run(runs[0], runs[2])
+
+
+def test_altpairs(traf, cmd, monkeypatch):
+    from bluesky import settings
+    from bluesky.tools.aero import ft
+    from bluesky.traf.asas import StateBasedCD
+    monkeypatch.setattr(StateBasedCD, "casas", None)
+    asas = traf.asas
+    cmd("ASAS ON", *converging(40))
+
+    # Two neighbouring aircraft at each flight level, 1500 ft apart: the
+    # altitude sweep only keeps the pairs at the same level
+    traf.alt[:] = traf.adsb.alt[:] = (100 + 15 * (np.arange(40) // 2)) * 100. * ft
+    i, j = StateBasedCD.altpairs(asas, traf, symmetric=True)
+    assert list(zip(i, j)) == [(k, k + 1) for k in range(0, 40, 2)]
+    i, j = StateBasedCD.altpairs(asas, traf)
+    assert sorted(zip(i, j)) == sorted([(k, k ^ 1) for k in range(40)])
+
+    # Which are the same conflicts as without broad phase
+    monkeypatch.setattr(StateBasedCD, "gridpairs", lambda *args: None)
+    settings.asas_cdcache = False
+    StateBasedCD.detect(asas, traf, 0.)
+    expected = cdresults(asas)
+    assert len(expected) > 0
+    settings.asas_broadphase = False
+    StateBasedCD.detect(asas, traf, 0.)
+    results = cdresults(asas)
+    assert sorted(results) == sorted(expected)
+    for pair, values in expected.items():
+        assert np.array_equal(results[pair], values), pair
@@ -0,0 +1,146 @@
+""" Tests of the conflict resolution methods. """
+import numpy as np
+from test_cd import converging
+
+
+def resolutions(traf, cmd, simulate, monkeypatch, method):
+    """ Simulate converging traffic with resolution method and the Python
+        CD for a few ASAS updates, check that the resolutions of all
+        aircraft are valid, and return the ASAS object """
+    from bluesky.traf.asas import StateBasedCD
+    monkeypatch.setattr(StateBasedCD, "casas", None)
+    asas = traf.asas
+    cmd("ASAS ON", "RESO " + method, *converging())
+    simulate(3. * asas.task.dt + 0.5)
+    assert asas.cr_name == method
+    assert len(asas.dist) == len(asas.confpairs) > 0
+    assert np.any(asas.active)
+    for arr in (asas.trk, asas.tas, asas.vs, asas.alt):
+        assert len(arr) == traf.ntraf
+        assert np.all(np.isfinite(arr))
+    tas = asas.tas[asas.active]
+    assert np.all((tas >= asas.vmin - 1e-6) & (tas <= asas.vmax + 1e-6))
+    return asas
+
+
+def test_mvp(traf, cmd, simulate, monkeypatch):
+    asas = resolutions(traf, cmd, simulate, monkeypatch, "MVP")
+    # The aircraft in conflict deviate from their route
+    assert np.any(asas.trk[asas.active] != traf.ap.trk[asas.active])
+
+
+def test_eby(traf, cmd, simulate, monkeypatch):
+    asas = resolutions(traf, cmd, simulate, monkeypatch, "EBY")
+    assert np.any(asas.trk[asas.active] != traf.ap.trk[asas.active])
+
+
+def test_swarm(traf, cmd, simulate, monkeypatch):
+    asas = resolutions(traf, cmd, simulate, monkeypatch, "SWARM")
+    # All aircraft follow the swarm, which climbs or descends with its
+    # vertical speed
+    assert np.all(asas.active)
+    assert np.array_equal(asas.alt, np.sign(asas.vs) * 1e5)
+
+
+def test_difgame(traf, cmd, simulate, monkeypatch):
+    asas = resolutions(traf, cmd, simulate, monkeypatch, "DIFGAME")
+    # The controls of the game: keep the speed or go to the minimum or
+    # maximum speed, and keep the altitude, climb, or descend
+    assert np.all((asas.tas == traf.gs) | (asas.tas == asas.vmin) | (asas.tas == asas.vmax))
+    assert set(asas.vs) <= {asas.vsmin, 0., asas.vsmax}
+
+
+def mvpreference(traf, asas):
+    """ Resolutions of MVP with a loop over the conflict pairs, as in the
+        original implementation for symmetric ADS-B. Returns the resolution
+        vectors and the times to solve vertically of all aircraft. """
+    from bluesky.traf.asas import MVP
+    dv = np.zeros((traf.ntraf, 3))
+    timesolveV = np.ones(traf.ntraf) * 1e9
+    done = set()
+    for k, (ac1, ac2) in enumerate(asas.confpairs):
+        id1, id2 = traf.id2idx(ac1), traf.id2idx(ac2)
+        if frozenset((ac1, ac2)) in done or id1 < 0 or id2 < 0:
+            continue
+        done.add(frozenset((ac1, ac2)))
+        dv_mvp, tsolV = MVP.MVP(traf, asas, np.array([k]), np.array([id1]), np.array([id2]))
+        dv_mvp, tsolV = dv_mvp[0], tsolV[0]
+        timesolveV[id1] = min(timesolveV[id1], tsolV)
+        timesolveV[id2] = min(timesolveV[id2], tsolV)
+
+        # Priority rules: which aircraft solve, and the vertical component
+        cruise1 = abs(traf.vs[id1]) < 0.1 and abs(traf.vs[id2]) > 0.1
+        cruise2 = abs(traf.vs[id2]) < 0.1 and abs(traf.vs[id1]) > 0.1
+        solve1 = solve2 = True
+        if asas.swprio and asas.priocode in ("FF2", "LAY1"):
+            solve1, solve2 = not cruise1, not cruise2
+        elif asas.swprio and asas.priocode in ("FF3", "LAY2"):
+            solve1, solve2 = not cruise2, not cruise1
+        if asas.swprio and (asas.priocode[:3] == "LAY" or
+                            asas.priocode == "FF3" and (cruise1 or cruise2)):
+            dv_mvp[2] = 0.0
+        else:
+            dv_mvp[2] = dv_mvp[2] / 2.0
+        if solve1:
+            dv[id1] = dv[id1] - dv_mvp
+        if solve2:
+            dv[id2] = dv[id2] + dv_mvp
+
+        # Nobody avoids noreso aircraft, and resooff aircraft don't resolve
+        if ac1 in asas.noresolst:
+            dv[id2] = dv[id2] - dv_mvp
+        if ac2 in asas.noresolst:
+            dv[id1] = dv[id1] + dv_mvp
+        if ac1 in asas.resoofflst:
+            dv[id1] = 0.0
+        if ac2 in asas.resoofflst:
+            dv[id2] = 0.0
+    return dv, timesolveV
+
+
+def test_mvp_pairs(traf, cmd, simulate, monkeypatch):
+    from bluesky.traf.asas import MVP, StateBasedCD
+    monkeypatch.setattr(StateBasedCD, "casas", None)
+    asas = traf.asas
+    cmd("ASAS ON", "RESO MVP", *converging())
+    simulate(3. * asas.task.dt + 0.5)
+    assert not traf.adsb.truncated and not traf.adsb.transnoise
+
+    # Cruising, climbing and descending aircraft for the priority rules
+    traf.vs[0::3], traf.vs[1::3], traf.vs[2::3] = 0.0, 2.5, -2.5
+
+    # Conflicts between a cruising and a climbing or descending aircraft
+    ids = traf.ids2idx([ac for pair in asas.confpairs for ac in pair]).reshape(-1, 2)
+    cruise = np.abs(traf.vs[ids]) < 0.1
+    assert np.any(cruise[:, 0] & ~cruise[:, 1]) and np.any(~cruise[:, 0] & cruise[:, 1])
+
+    # NORESO and RESOOFF aircraft with several conflicts
+    acids, nconf = np.unique(asas.confpairs, return_counts=True)
+    several = list(acids[nconf >= 4])
+    assert len(several) >= 4
+
+    alt = asas.alt.copy()
+    for prio in ("OFF", "FF1", "FF2", "FF3", "LAY1", "LAY2"):
+        for noreso, resooff in (([], []), (several[:2], []), ([], several[:2]),
+                                (several[:2], several[1:4])):
+            asas.swprio = prio != "OFF"
+            asas.priocode = prio if asas.swprio else "FF1"
+            asas.noresolst, asas.swnoreso = noreso, len(noreso) > 0
+            asas.resoofflst, asas.swresooff = resooff, len(resooff) > 0
+            asas.alt = alt.copy()
+            MVP.resolve(asas, traf)
+
+            dv, timesolveV = mvpreference(traf, asas)
+            newv = np.array([traf.gseast, traf.gsnorth, traf.vs]) + dv.T
+            trk = np.degrees(np.arctan2(newv[0], newv[1])) % 360.
+            tas = np.clip(np.sqrt(newv[0]**2 + newv[1]**2), asas.vmin, asas.vmax)
+            vs = np.clip(newv[2], asas.vsmin, asas.vsmax)
+            solvev = (timesolveV < asas.dtlookahead) & (np.abs(dv[:, 2]) > 0.0)
+            assert np.allclose(asas.trk, trk, rtol=0., atol=1e-9)
+            assert np.allclose(asas.tas, tas, rtol=1e-12, atol=0.)
+            assert np.allclose(asas.vs, vs, rtol=1e-12, atol=1e-12)
+            assert np.allclose(asas.alt, np.where(solvev, vs * timesolveV + traf.alt, alt),
+                               rtol=1e-12, atol=0.)
+            for acid in resooff:
+                i = traf.id2idx(acid)
+                assert np.isclose(asas.trk[i], traf.trk[i]) and asas.vs[i] == traf.vs[i]
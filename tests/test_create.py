@@ -0,0 +1,76 @@
+""" Tests of the creation of aircraft: single CRE, batches of CRE
+    commands, and Traffic.create_batch. """
+from math import cos, radians
+import numpy as np
+from bluesky.tools.aero import casormach, ft, kts
+
+# Aircraft of the tests: call sign, type, lat, lon, hdg, alt [ft], CAS [kts] or Mach
+aircraft = [("KL001", "B744", 52.0, 4.0, 90., 10000., 250.),
+            ("KL002", "A320", 52.1, 4.2, 180., 36000., 0.78),
+            ("KL003", "B744", 51.9, 3.8, 275., 3000., 180.)]
+
+
+def crecmd(acid, actype, lat, lon, hdg, alt, spd):
+    return "CRE %s %s %f %f %f %f %s" % (acid, actype, lat, lon, hdg, alt, spd)
+
+
+def test_single_create_is_scalar(traf):
+    acid, actype, lat, lon, hdg, alt, spd = aircraft[0]
+    assert traf.create(acid, actype, lat, lon, hdg, alt * ft, spd * kts) is True
+
+    tas, cas, mach = casormach(spd * kts, alt * ft)
+    assert traf.tas[0] == tas and traf.cas[0] == cas and traf.M[0] == mach
+    assert traf.gsnorth[0] == tas * cos(radians(hdg))
+    assert traf.coslat[0] == cos(radians(lat))
+
+
+def test_batch_cre_equals_single_creates(traf, cmd):
+    # Consecutive CRE commands are created in one batch
+    cmd(*[crecmd(*ac) for ac in aircraft])
+    assert traf.ntraf == len(aircraft)
+    batch = {v: getattr(traf, v).copy() for v in ("lat", "lon", "alt", "tas", "cas", "M",
+                                                  "gsnorth", "gseast", "coslat", "rho")}
+    ids = list(traf.id)
+
+    traf.reset()
+    for ac in aircraft:
+        cmd(crecmd(*ac))
+    assert list(traf.id) == ids
+    for v, values in batch.items():
+        assert np.array_equal(getattr(traf, v), values), v
+
+
+def test_duplicate_cre(traf, cmd):
+    echoed = cmd(crecmd(*aircraft[0]), crecmd(*aircraft[1]), crecmd(*aircraft[0]))
+    assert list(traf.id) == ["KL001", "KL002"]
+    assert any("KL001 already exists" in text for text in echoed)
+
+    # Also when the aircraft was created before
+    echoed = cmd(crecmd(*aircraft[1]))
+    assert traf.ntraf == 2
+    assert any("KL002 already exists" in text for text in echoed)
+
+
+def test_command_after_cre_batch(traf, cmd):
+    # Commands after a series of CRE commands can use the new aircraft
+    cmd(crecmd(*aircraft[0]), crecmd(*aircraft[1]), "ALT KL001 FL200")
+    assert traf.ntraf == 2
+    assert abs(traf.selalt[traf.id2idx("KL001")] - 20000. * ft) < 1e-6
+
+
+def test_create_batch(traf):
+    assert traf.create_batch(["KL001", "KL002"], "B744", [52., 52.1], [4., 4.1],
+                             [90., 180.], [3000., 4000.], [150., 0.7]) is True
+    assert traf.ntraf == 2
+    assert [traf.id2idx(acid) for acid in ("KL001", "KL002")] == [0, 1]
+
+    # Existing and repeated call signs are skipped
+    result = traf.create_batch(["kl002", "KL003", "KL003"], ["B744", "A320", "B744"],
+                               [52.2] * 3, [4.2] * 3, [0.] * 3, [3000.] * 3, [150.] * 3)
+    assert result[0] is True and "KL002, KL003 already exist" in result[1]
+    assert list(traf.id) == ["KL001", "KL002", "KL003"]
+    assert traf.type[2] == "A320"
+    assert len(traf.ap.route) == 3 and traf.ap.route[1] is not traf.ap.route[2]
+
+    assert traf.create_batch(["KL001"], "B744", [52.], [4.], [0.], [3000.], [150.])[0] is False
+    assert traf.ntraf == 3
@@ -0,0 +1,105 @@
+""" Tests of the storage of the traffic arrays, the deletion of aircraft,
+    and the call sign to index map. """
+import numpy as np
+from bluesky.tools.trafficarrays import TrafficArrays, RegisterElementParameters
+
+
+def create(traf, n):
+    rng = np.random.RandomState(1)
+    traf.create_batch(['KL%03d' % i for i in range(n)], 'B744', rng.uniform(51., 53., n),
+                      rng.uniform(3., 5., n), rng.uniform(0., 360., n), np.full(n, 3000.),
+                      np.full(n, 150.))
+
+
+def check_consistent(traf):
+    """ All registered arrays and lists have one element per aircraft, and
+        the id map points to the index of each call sign """
+    def check(obj):
+        for v in obj.ArrVars + obj.LstVars:
+            assert len(obj.Vars[v]) == traf.ntraf, v
+        for child in obj.children:
+            check(child)
+    check(traf)
+    assert traf.idmap == {acid: i for i, acid in enumerate(traf.id)}
+
+
+def test_delete_many(traf):
+    create(traf, 50)
+    lat = dict(zip(traf.id, traf.lat))
+
+    # Invalid and duplicate indices are skipped
+    assert traf.delete_many([3, 10, 10, 49, 200, -1]) is True
+    assert traf.ntraf == 47
+    assert not {"KL003", "KL010", "KL049"} & set(traf.id)
+    check_consistent(traf)
+    assert all(traf.lat[i] == lat[acid] for i, acid in enumerate(traf.id))
+
+    assert traf.delete_many([]) is False
+    assert traf.delete_many(np.arange(traf.ntraf)) is True
+    assert traf.ntraf == 0
+    check_consistent(traf)
+
+
+def test_delete_and_create(traf, cmd):
+    create(traf, 10)
+    cmd("DEL KL004")
+    assert traf.id2idx("KL004") == -1
+    assert traf.id2idx("KL005") == 4
+    check_consistent(traf)
+
+    # Create after delete, and look up call signs case-insensitively
+    cmd("CRE KL004 B744 52 4 90 FL100 250")
+    assert traf.id2idx("kl004") == 9
+    assert list(traf.ids2idx(["KL009", "XX1", "KL000"])) == [8, -1, 0]
+    check_consistent(traf)
+
+
+def test_grow_keeps_views(traf):
+    create(traf, 5)
+    lat = traf.lat
+    values = lat.copy()
+
+    # Creating aircraft reallocates or extends the buffers, but doesn't
+    # change the arrays that were obtained before
+    for i in range(100):
+        traf.create("AC%03d" % i, "B744", 50., 4., 0., 3000., 150.)
+    assert np.array_equal(lat, values)
+    assert np.array_equal(traf.lat[:5], values)
+    assert np.all(traf.lat[5:] == 50.)
+    check_consistent(traf)
+
+
+def test_defaults_per_dtype(traf):
+    class Child(TrafficArrays):
+        def __init__(self):
+            super(Child, self).__init__()
+            with RegisterElementParameters(self):
+                self.flag  = np.array([], dtype=bool)
+                self.count = np.array([], dtype=int)
+                self.code  = np.array([], dtype='S4')
+                self.name  = np.array([], dtype='U8')
+
+    child = Child()
+    child.create(3)
+    assert list(child.flag) == [False] * 3
+    assert list(child.count) == [0] * 3
+    assert list(child.code) == [b''] * 3
+    assert list(child.name) == [''] * 3
+    traf.children.remove(child)
+
+
+def test_create_none(traf):
+    create(traf, 5)
+    lat = traf.lat.copy()
+    cachelat = traf.asas.cdcache.lat.copy()
+
+    # Creating zero elements leaves all existing elements as they are
+    traf.trails.accolor[:] = ['RED'] * 5
+    traf.create_children(0)
+    super(type(traf), traf).create(0)
+    traf.trails.create(0)
+    traf.asas.cdcache.create(0)
+    assert np.array_equal(traf.lat, lat)
+    assert traf.trails.accolor == ['RED'] * 5
+    assert np.array_equal(traf.asas.cdcache.lat, cachelat)
+    check_consistent(traf)
@@ -0,0 +1,55 @@
+""" Tests of the dormant-aircraft fast path: aircraft at their targets only
+    get position updates, with the same results as full updates. """
+import numpy as np
+
+commands = ["ASAS ON", "RESO MVP", "DTLOOK 60",
+            "CRE KL001 B744 52.0 4.0 90 FL100 250",
+            "CRE KL002 B744 52.0 4.5 270 FL100 250",
+            "CRE KL003 A320 52.3 4.0 180 FL100 250",
+            "CRE KL004 A320 51.7 4.2 0 FL90 250",
+            "ALT KL004 FL150"]
+
+
+def run(traf, cmd, simulate, fastpath):
+    from bluesky import settings
+    settings.dormant_fastpath = fastpath
+    cmd(*commands)
+    simulate(20.)
+    ndormant = np.sum(traf.dormant)
+    simulate(120.)
+    state = {key: value for key, value in traf.getstate().items()
+             if isinstance(value, np.ndarray) and key not in ("dormant", "steady")}
+    return ndormant, state
+
+
+def test_fastpath_equals_full_update(traf, cmd, simulate):
+    from bluesky import sim
+    ndormant, full = run(traf, cmd, simulate, False)
+    assert ndormant == 0
+
+    traf.reset()
+    sim.simt = 0.0
+    ndormant, fast = run(traf, cmd, simulate, True)
+    assert ndormant > 0
+    for key, value in full.items():
+        assert np.array_equal(value, fast[key]), key
+
+
+def test_wake(traf, cmd, simulate):
+    from bluesky import settings, sim
+    assert not settings.dormant_fastpath
+    settings.dormant_fastpath = True
+    cmd(*commands)
+    simulate(20.)
+    i = traf.id2idx("KL003")
+    assert traf.dormant[i]
+
+    # A plugin that changes a target outside the stack wakes the aircraft,
+    # also in a time step without performance update
+    while traf.perf.task.isdue(sim.simt):
+        simulate(sim.simt + 0.05)
+    traf.selspd[i] = traf.selspd[i] + 10.
+    traf.wake(i)
+    tas = traf.tas[i]
+    simulate(sim.simt + 0.05)
+    assert traf.tas[i] > tas
@@ -0,0 +1,52 @@
+""" Tests of the FMS waypoint sequencing with the route table. """
+
+
+def setup_route(cmd, nwp=5):
+    cmd("CRE KL001 B744 52.0 4.0 90 FL100 250",
+        *["ADDWPT KL001 52.0 %.2f FL100" % (4.05 + 0.05 * i) for i in range(nwp)])
+    cmd("KL001 LNAV ON")
+
+
+def active(traf):
+    route = traf.ap.route[0]
+    return route.wpname[route.iactwp]
+
+
+def sequence(traf, simulate, tend, dt=1.0):
+    """ Simulate until tend, and return the active waypoints in the order
+        in which they were flown """
+    from bluesky import sim
+    names = [active(traf)]
+    while sim.simt < tend - 1e-9:
+        simulate(sim.simt + dt)
+        if active(traf) != names[-1]:
+            names.append(active(traf))
+    return names
+
+
+def test_sequencing(traf, cmd, simulate):
+    setup_route(cmd)
+    assert sequence(traf, simulate, 150.) == traf.ap.route[0].wpname
+    assert not traf.swlnav[0]
+
+
+def test_direct_from_code(traf, cmd, simulate):
+    setup_route(cmd)
+    route = traf.ap.route[0]
+    names = list(route.wpname)
+    assert sequence(traf, simulate, 40.) == names[:2]
+
+    # A direct by another module than the stack (e.g., ASAS recovery or a
+    # plugin) skips the third waypoint
+    route.direct(0, names[3])
+    assert sequence(traf, simulate, 150.) == names[3:]
+
+
+def test_delwpt_from_code(traf, cmd, simulate):
+    setup_route(cmd)
+    route = traf.ap.route[0]
+    names = list(route.wpname)
+    assert sequence(traf, simulate, 40.) == names[:2]
+
+    route.delwpt(names[2])
+    assert sequence(traf, simulate, 150.) == names[1:2] + names[3:]
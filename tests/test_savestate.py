@@ -0,0 +1,126 @@
+""" Tests of SAVESTATE and LOADSTATE: a run that continues from a saved
+    state is identical to the original run. """
+import numpy as np
+import pytest
+
+scenario = """00:00:00.00>ASAS ON
+00:00:00.00>RESO MVP
+00:00:00.00>CRE KL001 B744 52.0 4.0 90 FL100 250
+00:00:00.00>CRE KL002 B744 52.0 4.4 270 FL100 250
+00:00:00.00>CRE KL003 A320 52.1 4.2 180 FL120 280
+00:00:00.00>ADDWPT KL001 52.0 4.6 FL100
+00:00:00.00>ADDWPT KL001 52.2 4.8 FL120
+00:00:00.00>ADDWPT KL002 52.0 3.6 FL100
+00:00:00.00>KL001 LNAV ON
+00:00:00.00>KL002 LNAV ON
+00:00:30.00>ALT KL003 FL80
+00:00:35.00>CRE KL004 A320 52.3 4.0 120 FL90 250
+"""
+
+
+def compare(state, other):
+    assert sorted(state) == sorted(other)
+    for key, value in state.items():
+        if key == "ap.route":
+            np.testing.assert_equal([vars(r) for r in value], [vars(r) for r in other[key]])
+        else:
+            np.testing.assert_equal(value, other[key], err_msg=key)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """ The pygame sim reads time.clock, which was removed in Python 3.8 """
+    import time
+    monkeypatch.setattr(time, "clock", time.time, raising=False)
+
+
+def test_savestate_roundtrip(traf, cmd, simulate, clock, tmp_path):
+    from bluesky import stack
+    scnfile = tmp_path / "test.scn"
+    scnfile.write_text(scenario)
+    statefile = str(tmp_path / "state.npz")
+
+    stack.openfile(str(scnfile))
+    simulate(20.0)
+    assert "Saved state to " + statefile in cmd("SAVESTATE " + statefile)[0]
+    simulate(60.0)
+    assert traf.ntraf == 4
+    final = traf.getstate()
+
+    # Continue from the saved state
+    assert "Loaded state from " + statefile in cmd("LOADSTATE " + statefile)[0]
+    assert traf.ntraf == 3
+    simulate(60.0)
+    compare(traf.getstate(), final)
+
+
+
+def test_loadstate_mainloop(traf, clock, tmp_path, monkeypatch):
+    import bluesky as bs
+    from bluesky import stack
+    sim = bs.sim
+    monkeypatch.setattr(sim, "mode", sim.mode)
+    monkeypatch.setattr(sim, "ffmode", True)
+    monkeypatch.setattr(sim, "fixdt", 0.05)
+
+    def step():
+        """ One pass of the main loop of BlueSky_pygame """
+        sim.update()
+        if sim.mode == sim.init:
+            sim.reset()
+
+    def run(tend):
+        while sim.simt < tend - 1e-9:
+            step()
+
+    scnfile = tmp_path / "test.scn"
+    scnfile.write_text(scenario)
+    statefile = str(tmp_path / "state.npz")
+    stack.openfile(str(scnfile))
+    sim.start()
+    run(20.0)
+    stack.stack("SAVESTATE " + statefile)
+    run(60.0)
+    assert traf.ntraf == 4
+    final = traf.getstate()
+
+    # LOADSTATE from the stack continues the simulation from the saved
+    # state, which isn't reset again by the main loop
+    stack.stack("LOADSTATE " + statefile)
+    step()
+    assert sim.mode == sim.op
+    assert traf.ntraf == 3 and 20.0 < sim.simt < 21.0
+    run(60.0)
+    compare(traf.getstate(), final)
+
+
+def test_checkpoint_data(traf, tmp_path):
+    from bluesky.tools import checkpoint
+    from bluesky.traf.route import Route
+    route = Route()
+    route.wpname = ["A", "B"]
+    route.wplat  = [52.0, np.float64(52.5)]
+    state = {"lat": np.arange(5.), "empty": np.array([], dtype=int),
+             "conf": {("KL1", "KL2"): (1.0, 2)}, "route": [route],
+             "ids": ["KL1", "KL2"], "t": 1.5, "flag": True}
+    fname = str(tmp_path / "state.npz")
+    checkpoint.save(fname, state)
+    loaded = checkpoint.load(fname)
+
+    assert np.array_equal(loaded["lat"], state["lat"])
+    assert loaded["empty"].dtype == int and len(loaded["empty"]) == 0
+    assert loaded["conf"] == state["conf"]
+    assert isinstance(loaded["route"][0], Route)
+    assert loaded["route"][0].wplat == [52.0, 52.5]
+    assert loaded["ids"] == state["ids"] and loaded["t"] == 1.5 and loaded["flag"] is True
+
+    # Arrays are memory-mapped copy-on-write: they can be changed, but the
+    # file is not
+    loaded["lat"][0] = 10.
+    assert checkpoint.load(fname)["lat"][0] == 0.
+
+
+def test_checkpoint_rejects_objects(traf, tmp_path):
+    from bluesky.tools import checkpoint
+    with pytest.raises(TypeError):
+        checkpoint.save(str(tmp_path / "state.npz"), {"x": [object()]})
@@ -0,0 +1,116 @@
+""" Tests of the scheduler of the periodic updates of FMS, performance model,
+    ASAS and plugins. """
+import numpy as np
+import pytest
+
+
+@pytest.fixture
+def task(traf):
+    """ Function to create a task, which is removed from the scheduler
+        afterwards """
+    from bluesky.tools import scheduler
+
+    def create(dt, phase=None):
+        return scheduler.Task('TEST', dt, phase)
+    yield create
+    scheduler.remove('TEST')
+
+
+def duetimes(task, simdt, tend):
+    """ Simulation times [s] at which task is due, with time step simdt """
+    times = []
+    for k in range(int(round(tend / simdt))):
+        simt = k * simdt
+        isdue = task.isdue(simt)
+        # isdue doesn't count the update, and gives the same answer as due
+        assert task.isdue(simt) == isdue
+        if task.due(simt):
+            times.append(round(simt, 6))
+        assert isdue == (times[-1:] == [round(simt, 6)])
+    return times
+
+
+def test_interval(task):
+    # Without phase: the interval after the last update, as the FMS used to
+    # do with its 1.01 s interval
+    assert duetimes(task(1.01), 0.05, 4.0) == [0.0, 1.05, 2.1, 3.15]
+    assert duetimes(task(0.1), 0.05, 0.5) == [0.0, 0.1, 0.2, 0.3, 0.4]
+
+
+def test_phase(task):
+    # With phase: at the times phase + k * dt
+    assert duetimes(task(1.0, 0.5), 0.05, 4.0) == [0.5, 1.5, 2.5, 3.5]
+    # Updates that are missed with a large time step are skipped
+    assert duetimes(task(1.0, 0.5), 0.7, 4.2) == [0.7, 2.1, 2.8, 3.5]
+
+
+
+def test_elapsed(task):
+    # The time since the previous update, also when updates are skipped
+    t = task(1.0, 0.5)
+    elapsed = []
+    for k in range(7):
+        if t.due(k * 0.7):
+            elapsed.append(round(t.elapsed, 6))
+    assert elapsed == [1.0, 1.4, 0.7, 0.7]
+    assert t.tlast == 3.5
+
+
+def test_reset(task):
+    t = task(1.01)
+    assert duetimes(t, 0.05, 3.0) == [0.0, 1.05, 2.1]
+    assert t.ncalls == 3
+    # The task starts again when the simulation time is reset
+    assert t.due(0.0) and t.ncalls == 1
+
+
+def test_default_rates(traf, cmd, monkeypatch):
+    from bluesky.tools import scheduler
+    fms, perf, asas = traf.ap.task, traf.perf.task, traf.asas.task
+    assert (fms.dt, fms.phase) == (1.01, None)
+    assert (perf.dt, perf.phase) == (0.1, None)
+    assert asas.phase == 0.0
+
+    # Staggering is opt-in with UPDATERATE
+    for attr in ('dt', 'phase', 'tnext'):
+        monkeypatch.setattr(fms, attr, getattr(fms, attr))
+    assert scheduler.setrate('FMS', 1.0, 0.5) is True
+    assert (fms.dt, fms.phase) == (1.0, 0.5)
+    assert fms.isdue(0.5) and not fms.isdue(0.45)
+    assert "FMS          dt = 1.00 s, phase = 0.50 s" in scheduler.setrate()[1]
+    assert "PERF         dt = 0.10 s, after each update" in scheduler.setrate()[1]
+
+
+def test_fms_slices(traf, cmd, monkeypatch):
+    from bluesky.tools import scheduler
+    n = 10
+    cmd(*["CRE KL%03d B744 52 %f 90 FL100 250" % (k, 4. + 0.1 * k) for k in range(n)])
+    cmd(*["ADDWPT KL%03d 52.%d 6 FL%d" % (k, k, 150 + 10 * k) for k in range(n)])
+    cmd(*["KL%03d VNAV ON" % k for k in range(n)])
+    state = traf.getstate()
+
+    def guidance():
+        return [arr.copy() for arr in (traf.ap.trk, traf.ap.vs, traf.ap.alt, traf.selalt,
+                                       traf.selspd, traf.actwp.vs, traf.actwp.turndist)]
+
+    # Guidance of a full FMS update
+    fms = traf.ap.task
+    assert traf.ap.update(0.0)
+    expected = guidance()
+    assert not np.array_equal(expected[0], state["ap.trk"])
+
+    # With three slices, each FMS update covers the next slice of the
+    # aircraft, and three updates give the same guidance
+    traf.setstate(state, n)
+    monkeypatch.setattr(fms, "nslices", 3)
+    fms.reset()
+    before = guidance()
+    assert traf.ap.update(0.0)
+    first = guidance()
+    for arr, old, new in zip(first, before, expected):
+        assert np.array_equal(arr[:3], new[:3]) and np.array_equal(arr[3:], old[3:])
+    assert not traf.ap.update(1.0)
+    assert traf.ap.update(1.01) and traf.ap.update(2.02)
+    for arr, new in zip(guidance(), expected):
+        assert np.array_equal(arr, new)
+    assert "FMS          dt = 1.01 s, after each update, 3 slices" in scheduler.setrate()[1]
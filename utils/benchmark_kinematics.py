@@ -0,0 +1,96 @@
+""" Benchmark of the kinematic integration step of the traffic simulation.
+
+    Compares the default kinematics (UpdateAirSpeed, UpdateGroundSpeed and
+    UpdatePosition) with the in-place kinematics (UpdateInPlace), which is
+    enabled with inplace_kinematics in the settings file. For each traffic
+    size and mode, the script prints the time per step, and the
+    amount of memory that is allocated during a step.
+
+    Usage (from the BlueSky root folder):
+        python utils/benchmark_kinematics.py [ntraf1 ntraf2 ...]
+"""
+from __future__ import print_function
+import os
+import sys
+import timeit
+import tracemalloc
+import numpy as np
+
+# Run from the BlueSky root folder, so the data paths are found
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+os.chdir(root)
+sys.path.insert(0, root)
+
+import bluesky as bs
+from bluesky import settings
+from bluesky.tools.aero import vatmos
+
+simdt = 0.05
+
+
+def kinematics(traf):
+    """ The atmosphere and kinematics part of Traffic.update() """
+    if settings.inplace_kinematics:
+        traf.UpdateAtmosphere()
+        traf.UpdateInPlace(simdt)
+    else:
+        traf.p, traf.rho, traf.Temp = vatmos(traf.alt)
+        traf.UpdateAirSpeed(simdt, 0.0)
+        traf.UpdateGroundSpeed(simdt)
+        traf.UpdatePosition(simdt)
+
+
+def setup(traf, ntraf):
+    """ Create ntraf aircraft at random positions, that are all turning,
+        climbing or descending, and accelerating or decelerating """
+    rng = np.random.RandomState(42)
+    traf.reset()
+    traf.create_batch(['KL%05d' % i for i in range(ntraf)], 'B744',
+                      rng.uniform(50., 54., ntraf), rng.uniform(2., 7., ntraf),
+                      rng.uniform(0., 360., ntraf), rng.uniform(2000., 11000., ntraf),
+                      rng.uniform(150., 250., ntraf))
+    traf.pilot.tas = traf.tas + rng.uniform(-20., 20., ntraf)
+    traf.pilot.hdg = rng.uniform(0., 360., ntraf)
+    traf.pilot.alt = rng.uniform(2000., 11000., ntraf)
+    traf.pilot.vs  = rng.uniform(5., 10., ntraf)
+
+
+def measure(traf, nsteps):
+    """ Return the time per step [us], and the average and maximum amount
+        of memory that is allocated during a step [bytes] """
+    # Warm up, this also allocates the scratch buffers
+    for _ in range(10):
+        kinematics(traf)
+
+    t = timeit.timeit(lambda: kinematics(traf), number=nsteps)
+
+    tracemalloc.start()
+    allocs = []
+    for _ in range(nsteps):
+        size0 = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        kinematics(traf)
+        allocs.append(tracemalloc.get_traced_memory()[1] - size0)
+    tracemalloc.stop()
+
+    return 1e6 * t / nsteps, np.mean(allocs), np.max(allocs)
+
+
+def main():
+    sizes = [int(n) for n in sys.argv[1:]] or [1000, 10000, 50000]
+    traf  = bs.traf
+    print('%8s %10s %12s %16s %16s' % ('ntraf', 'mode', 'us/step', 'mean alloc [kB]', 'max alloc [kB]'))
+    for ntraf in sizes:
+        nsteps = max(10, 200000 // ntraf)
+        for inplace in (False, True):
+            settings.inplace_kinematics = inplace
+            setup(traf, ntraf)
+            us, mean, peak = measure(traf, nsteps)
+            print('%8d %10s %12.1f %16.1f %16.1f' % (ntraf, 'in-place' if inplace else 'default',
+                                                      us, mean / 1024., peak / 1024.))
+
+    traf.reset()
+
+
+if __name__ == '__main__':
+    main()